@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Подготовка пакета app одного сервиса для запуска вне Docker.
+
+В контейнерах каталоги config и common монтируются как app/config
+и app/common (см. docker-compose.yml). use_service() добавляет корень
+репозитория в путь поиска пакета app, и app.config / app.common
+импортируются так же, как в контейнере.
+
+Пакеты всех сервисов называются app, поэтому в одном процессе
+можно использовать только один сервис.
+"""
+
+import os
+import sys
+
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+SERVICES = {
+    'edge_router': 'ryadom_edge-router',
+    'front_end': 'ryadom_front-end',
+    'users': 'ryadom_users',
+    'events': 'ryadom_events',
+    'maps': 'ryadom_maps',
+}
+
+
+def use_service(name: str, chdir: bool = True) -> str:
+    """
+    Сделать пакет app сервиса импортируемым
+
+    Args:
+        name: имя сервиса (ключ SERVICES)
+        chdir: перейти в каталог сервиса, как WORKDIR в Dockerfile
+            (шаблоны и статика front-end открываются по относительным путям)
+
+    Returns:
+        str: каталог сервиса
+    """
+    service_dir = os.path.join(REPO_ROOT, SERVICES[name])
+
+    if 'app' in sys.modules:
+        raise RuntimeError('Another service package is already imported in this process')
+
+    sys.path.insert(0, service_dir)
+
+    import app
+
+    app.__path__.append(REPO_ROOT)
+
+    if chdir:
+        os.chdir(service_dir)
+
+    return service_dir
@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Размер и процессорное время сжатия ответов.
+
+Полезные нагрузки:
+    events[N]   список N событий в JSON, как GET /events/
+    index[N]    главная страница front-end с N событиями
+
+Для каждой кодировки (gzip, br, zstd — если модуль установлен) и уровня
+выводятся размер, степень сжатия и процессорное время на один запрос.
+Отдельно через CompressionMiddleware замеряется ответ с ETag без
+кэша вариантов и с попаданием в кэш.
+
+Запуск:
+    python benchmarks/compression.py --events 100,1000,10000
+    python benchmarks/compression.py --levels gzip:1,6,9 br:1,4,11 zstd:1,3,9
+"""
+
+import argparse
+import asyncio
+import sys
+import time
+
+from typing import *
+
+from bootstrap import use_service
+
+
+DEFAULT_LEVELS = ['gzip:1,6', 'br:4,11', 'zstd:1,3']
+
+
+def cpu_per_call(fn: Callable[[], Any], min_time: float) -> float:
+    """
+    Процессорное время одного вызова fn в миллисекундах
+    """
+    fn()
+
+    iterations = 0
+    started = time.process_time()
+
+    while time.process_time() - started < min_time:
+        fn()
+        iterations += 1
+
+    return (time.process_time() - started) / iterations * 1000
+
+
+async def render_index(service, events: List[Dict[str, Any]]) -> bytes:
+    from starlette.requests import Request
+
+    async def get_all_events():
+        return [dict(event) for event in events]
+
+    service.get_all_events = get_all_events
+
+    response = await service.get_index_page(Request({
+        'type': 'http',
+        'method': 'GET',
+        'scheme': 'http',
+        'server': ('127.0.0.1', 8081),
+        'path': '/',
+        'root_path': '',
+        'query_string': b'',
+        'headers': [(b'host', b'127.0.0.1:8081')],
+    }))
+
+    return response.body
+
+
+async def middleware_cpu(body: bytes, encoding: str, cached: bool, min_time: float) -> float:
+    """
+    Процессорное время запроса через CompressionMiddleware в миллисекундах
+    """
+    from app.common.compression import CompressionMiddleware
+
+    async def endpoint(scope, receive, send):
+        headers = [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode())]
+
+        if cached:
+            headers.append((b'etag', b'"events-1"'))
+
+        await send({'type': 'http.response.start', 'status': 200, 'headers': headers})
+        await send({'type': 'http.response.body', 'body': body})
+
+    middleware = CompressionMiddleware(endpoint)
+    scope = {
+        'type': 'http',
+        'method': 'GET',
+        'path': '/events/',
+        'query_string': b'',
+        'headers': [(b'accept-encoding', encoding.encode())],
+    }
+
+    async def receive():
+        return {'type': 'http.request', 'body': b''}
+
+    async def send(message):
+        pass
+
+    await middleware(scope, receive, send)
+
+    iterations = 0
+    started = time.process_time()
+
+    while time.process_time() - started < min_time:
+        await middleware(scope, receive, send)
+        iterations += 1
+
+    return (time.process_time() - started) / iterations * 1000
+
+
+async def run(args) -> None:
+    use_service('front_end')
+
+    import orjson
+
+    from app.common.compression import COMPRESSORS
+    from app.services.front_end_service import FrontEndService
+    from datagen import event_response, generate_events
+
+    service = FrontEndService()
+    payloads = []
+
+    for count in args.events:
+        events = [event_response(row) for row in generate_events(count, seed=args.seed)]
+
+        payloads.append((f'events[{count}]', orjson.dumps({'events': events})))
+        payloads.append((f'index[{count}]', await render_index(service, events)))
+
+    levels = []
+
+    for spec in args.levels:
+        encoding, _, values = spec.partition(':')
+
+        if encoding not in COMPRESSORS:
+            print(f'{encoding}: module is not installed, skipped', file=sys.stderr)
+            continue
+
+        levels.extend((encoding, int(value)) for value in values.split(','))
+
+    print(f'{"payload":16} {"encoding":10} {"bytes":>10} {"ratio":>7} {"cpu ms":>9}')
+
+    for name, body in payloads:
+        print(f'{name:16} {"identity":10} {len(body):10d} {1.0:7.2f} {0.0:9.3f}')
+
+        for encoding, level in levels:
+            compressor = COMPRESSORS[encoding]
+            compressed = compressor(body, level)
+            cpu_ms = cpu_per_call(lambda: compressor(body, level), args.min_time)
+
+            label = f'{encoding}:{level}'
+            print(f'{name:16} {label:10} {len(compressed):10d} {len(body) / len(compressed):7.2f} {cpu_ms:9.3f}')
+
+    name, body = next((name, body) for name, body in reversed(payloads) if name.startswith('events'))
+
+    print(f'\nCompressionMiddleware, {name}, cpu ms per request')
+
+    for encoding in [encoding for encoding in ('gzip', 'br', 'zstd') if encoding in COMPRESSORS]:
+        uncached = await middleware_cpu(body, encoding, cached=False, min_time=args.min_time)
+        cached = await middleware_cpu(body, encoding, cached=True, min_time=args.min_time)
+
+        print(f'{encoding:10} no etag {uncached:9.3f}  cached variant {cached:9.3f}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--events', default='10,100,1000,10000', help='Количества событий в полезных нагрузках')
+    parser.add_argument('--levels', nargs='+', default=DEFAULT_LEVELS, help='Кодировки и уровни, например gzip:1,6')
+    parser.add_argument('--min-time', type=float, default=0.5, help='Минимальное время замера, с')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    args.events = [int(value) for value in args.events.split(',') if value]
+
+    asyncio.run(run(args))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Генераторы воспроизводимых данных для бенчмарков.
+
+Строки соответствуют моделям сервисов событий и пользователей
+и подходят для массовой вставки через insert().
+"""
+
+import datetime
+import random
+
+from typing import *
+
+
+CATEGORIES = ['science', 'education', 'volunteering', 'business', 'career', 'culture', 'sport']
+
+STREETS = [
+    'Университетская наб.', 'Невский пр.', 'Литейный пр.', 'ул. Рубинштейна',
+    'Малый пр. В.О.', 'Средний пр. В.О.', 'Большой пр. П.С.', 'Каменноостровский пр.',
+]
+
+ROLES = ['organizer', 'participant', 'participant', 'participant', 'partner']
+
+
+def generate_events(count: int, seed: int = 1, start_id: int = 1) -> List[Dict[str, Any]]:
+    """
+    События со случайными категориями и датами в пределах
+    двух недель до и месяца после сегодняшнего дня
+    """
+    rng = random.Random(seed)
+    today = datetime.date.today()
+    created_at = datetime.datetime.now().isoformat()
+
+    return [
+        {
+            'id': event_id,
+            'url': f'https://example.com/events/{event_id}',
+            'category': rng.choice(CATEGORIES),
+            'format': rng.choice(['online', 'offline']),
+            'name': f'Событие {event_id}',
+            'description': 'Описание события для бенчмарка. ' * rng.randint(1, 8),
+            'photo': None,
+            'banner': None,
+            'location': 'Санкт-Петербург',
+            'address': f'{rng.choice(STREETS)}, {rng.randint(1, 120)}',
+            'date': (today + datetime.timedelta(days=rng.randint(-14, 30))).isoformat(),
+            'start_time': f'{rng.randint(9, 20):02d}:00',
+            'max_participants': rng.choice([None, 20, 50, 100]),
+            'color': rng.choice(['#FF6B6B', '#4ECDC4', '#FFE66D']),
+            'created_at': created_at,
+        }
+        for event_id in range(start_id, start_id + count)
+    ]
+
+
+def generate_users(count: int, seed: int = 1, start_id: int = 1, password_hash: str = '') -> List[Dict[str, Any]]:
+    rng = random.Random(seed)
+    created_at = datetime.datetime.now().isoformat()
+
+    return [
+        {
+            'id': user_id,
+            'name': f'Пользователь {user_id}',
+            'surname': 'Тестовый',
+            'email': f'user{user_id}@example.com',
+            'password_hash': password_hash,
+            'is_spbsu_student': rng.random() < 0.7,
+            'university': 'СПбГУ',
+            'faculty': 'Математико-механический',
+            'speciality': 'Программная инженерия',
+            'course': rng.randint(1, 6),
+            'photo': None,
+            'email_verified': True,
+            'created_at': created_at,
+        }
+        for user_id in range(start_id, start_id + count)
+    ]
+
+
+def generate_members(event_ids: Sequence[int], users_count: int, per_event: int, seed: int = 1) -> List[Dict[str, Any]]:
+    """
+    Участники событий без повторов пары (событие, пользователь)
+    """
+    rng = random.Random(seed)
+    members = []
+
+    for event_id in event_ids:
+        for position, user_id in enumerate(rng.sample(range(1, users_count + 1), min(per_event, users_count))):
+            members.append({
+                'event_id': event_id,
+                'user_id': user_id,
+                'role': 'organizer' if position == 0 else rng.choice(ROLES[1:]),
+            })
+
+    return members
+
+
+def event_response(row: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Событие в том виде, в котором его отдает API
+    """
+    return {key: value for key, value in row.items() if key != 'created_at'}
+
+
+async def insert_rows(engine, table, rows: List[Dict[str, Any]], batch_size: int = 10000) -> None:
+    """
+    Массовая вставка строк пачками
+    """
+    from sqlalchemy import insert
+
+    for start in range(0, len(rows), batch_size):
+        async with engine.begin() as conn:
+            await conn.execute(insert(table), rows[start:start + batch_size])
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Сравнение сериализации списка событий до и после перехода на orjson.
+
+legacy   ORM-объекты -> EventResponse.model_validate -> проверка по response_model
+         -> JSONResponse (json.dumps), как сервис событий отвечал раньше
+current  выбор столбцов схемы -> словари -> ORJSONResponse без повторной проверки,
+         настоящий маршрут GET /events/ сервиса событий
+
+Оба варианта вызываются через ASGI-приложение FastAPI, поэтому в замер попадают
+маршрутизация, зависимости и сериализация. База — SQLite (aiosqlite).
+
+Запуск:
+    python benchmarks/json_responses.py --rows 10000
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+from typing import *
+
+from bootstrap import use_service
+
+
+async def measure(client, path: str, repeat: int) -> Dict[str, Any]:
+    response = await client.get(path)
+    response.raise_for_status()
+
+    timings = []
+
+    for _ in range(repeat):
+        started = time.perf_counter()
+        await client.get(path)
+        timings.append(time.perf_counter() - started)
+
+    return {
+        'min_ms': round(min(timings) * 1000, 2),
+        'median_ms': round(statistics.median(timings) * 1000, 2),
+        'bytes': len(response.content),
+        'events': len(response.json()['events']),
+    }
+
+
+async def run(args, workdir: str) -> None:
+    os.environ['POSTGRES_EVENTS_URL'] = f'sqlite+aiosqlite:///{os.path.join(workdir, "events.db")}'
+
+    use_service('events')
+
+    import httpx
+    import ryadom_schemas.events as schemas_events
+
+    import app.models.outbox  # noqa: F401
+
+    from fastapi import Depends, FastAPI
+    from fastapi.responses import JSONResponse
+    from sqlalchemy import select
+    from sqlalchemy.ext.asyncio import AsyncSession
+
+    from app.common.responses import ORJSONResponse
+    from app.database import engine, get_async_session
+    from app.models.base import Base
+    from app.models.event import EventModel
+    from app.routes.routes import router
+    from datagen import generate_events, insert_rows
+
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
+    await insert_rows(engine, EventModel.__table__, generate_events(args.rows, seed=args.seed))
+
+    app = FastAPI(default_response_class=ORJSONResponse)
+    app.include_router(router)
+
+    @app.get('/legacy/events/', response_model=schemas_events.EventListResponse, response_class=JSONResponse)
+    async def legacy_get_all_events(session: AsyncSession = Depends(get_async_session)):
+        result = await session.execute(select(EventModel))
+
+        return schemas_events.EventListResponse(
+            events=[schemas_events.EventResponse.model_validate(event, from_attributes=True) for event in result.scalars().all()]
+        )
+
+    transport = httpx.ASGITransport(app=app)
+
+    async with httpx.AsyncClient(transport=transport, base_url='http://bench') as client:
+        legacy = await measure(client, '/legacy/events/', args.repeat)
+        current = await measure(client, '/events/', args.repeat)
+
+    print(f'rows={args.rows} repeat={args.repeat}')
+
+    for name, stats in (('legacy', legacy), ('current', current)):
+        print(f'{name:8} median {stats["median_ms"]:9.2f} ms  min {stats["min_ms"]:9.2f} ms  {stats["bytes"]} bytes')
+
+    print(f'speedup x{legacy["median_ms"] / current["median_ms"]:.2f}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    os.environ.setdefault('ENVIRONMENT', 'production')
+
+    with tempfile.TemporaryDirectory(prefix='ryadom-json-') as workdir:
+        asyncio.run(run(args, workdir))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Бенчмарк раздачи счетчиков участников на одном воркере front-end.
+
+Подключает N подписчиков к ParticipantsBroadcaster с локальным
+источником данных, публикует обновления и измеряет время подписки,
+время доставки обновления всем подписчикам и потребление памяти.
+
+Запуск:
+    python benchmarks/live_fanout.py --subscribers 10000 --events 50 --updates 200
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'ryadom_front-end'))
+
+from app.services.participants_broadcaster import ParticipantsBroadcaster
+
+
+async def run(subscribers: int, events: int, updates: int, slow_ratio: float) -> dict:
+    counts = {event_id: 0 for event_id in range(events)}
+    upstream_calls = 0
+
+    async def fetch_count(event_id: int) -> int:
+        nonlocal upstream_calls
+        upstream_calls += 1
+        return counts[event_id]
+
+    async def fetch_head() -> int:
+        return 0
+
+    async def fetch_changes(since: int) -> dict:
+        await asyncio.sleep(3600)
+
+    broadcaster = ParticipantsBroadcaster(fetch_count, fetch_head, fetch_changes, max_subscribers=subscribers)
+
+    tracemalloc.start()
+    memory_before = tracemalloc.get_traced_memory()[0]
+
+    ready = asyncio.Event()
+    stop = asyncio.Event()
+    connected = 0
+    received = 0
+
+    async def client(index: int):
+        nonlocal connected, received
+
+        slow = index < subscribers * slow_ratio
+
+        async with broadcaster.subscribe(index % events) as subscription:
+            connected += 1
+
+            if connected == subscribers:
+                ready.set()
+
+            while not stop.is_set():
+                getter = asyncio.ensure_future(subscription.get())
+                stopper = asyncio.ensure_future(stop.wait())
+
+                done, pending = await asyncio.wait({getter, stopper}, return_when=asyncio.FIRST_COMPLETED)
+
+                for task in pending:
+                    task.cancel()
+
+                if getter in done:
+                    received += 1
+
+                    if slow:
+                        await asyncio.sleep(0.01)
+
+    started = time.perf_counter()
+    tasks = [asyncio.create_task(client(index)) for index in range(subscribers)]
+    await ready.wait()
+    subscribe_seconds = time.perf_counter() - started
+
+    memory_connected = tracemalloc.get_traced_memory()[0]
+
+    publish_latencies = []
+
+    for update in range(updates):
+        event_id = update % events
+        counts[event_id] += 1
+
+        publish_started = time.perf_counter()
+        broadcaster.publish(event_id, counts[event_id])
+        publish_latencies.append(time.perf_counter() - publish_started)
+
+        await asyncio.sleep(0)
+
+    await asyncio.sleep(0.1)
+
+    stop.set()
+    await asyncio.gather(*tasks)
+
+    tracemalloc.stop()
+
+    publish_latencies.sort()
+
+    return {
+        'subscribers': subscribers,
+        'events': events,
+        'updates': updates,
+        'subscribe_seconds': round(subscribe_seconds, 4),
+        'upstream_count_requests': upstream_calls,
+        'publish_p50_ms': round(publish_latencies[len(publish_latencies) // 2] * 1000, 4),
+        'publish_p99_ms': round(publish_latencies[int(len(publish_latencies) * 0.99)] * 1000, 4),
+        'messages_received': received,
+        'bytes_per_subscriber': (memory_connected - memory_before) // subscribers,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--subscribers', type=int, default=10000)
+    parser.add_argument('--events', type=int, default=50)
+    parser.add_argument('--updates', type=int, default=200)
+    parser.add_argument('--slow-ratio', type=float, default=0.1, help='Доля медленных клиентов')
+    args = parser.parse_args()
+
+    result = asyncio.run(run(args.subscribers, args.events, args.updates, args.slow_ratio))
+
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,499 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Нагрузочное тестирование всей цепочки сервисов на одной машине.
+
+Запускает edge-router, front-end, users, events и maps отдельными
+процессами uvicorn с базами SQLite и геокодером-заглушкой, наполняет
+их данными и воспроизводит смесь запросов: главная страница с фильтрами,
+страница события, список событий API, регистрация пользователя, запись
+на событие, прямое и обратное геокодирование. Для каждого маршрута
+считаются пропускная способность и задержки p50/p95/p99.
+
+Результат — JSON с хэшем коммита, который можно сравнить с прошлым
+прогоном: при росте p95 или падении пропускной способности больше
+--threshold процентов команда завершается с кодом 1.
+
+Запуск:
+    pip install -r benchmarks/requirements.txt
+    python benchmarks/loadtest.py run --duration 30 --concurrency 32 --output results/loadtest.json
+    python benchmarks/loadtest.py run --compare results/loadtest.json
+"""
+
+import argparse
+import asyncio
+import datetime
+import json
+import math
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+from typing import *
+
+from bootstrap import REPO_ROOT, SERVICES, use_service
+
+
+PORTS = {
+    'edge_router': 18080,
+    'front_end': 18081,
+    'users': 18082,
+    'events': 18083,
+    'maps': 18084,
+}
+
+CATEGORIES = ['science', 'education', 'volunteering', 'business', 'career', 'culture', 'sport']
+
+STREETS = [
+    'Университетская наб.', 'Невский пр.', 'Литейный пр.', 'ул. Рубинштейна',
+    'Малый пр. В.О.', 'Средний пр. В.О.', 'Большой пр. П.С.', 'Каменноостровский пр.',
+]
+
+TRAFFIC_MIX = {
+    'home': 30,
+    'home_filtered': 10,
+    'event_page': 25,
+    'api_events': 10,
+    'register_user': 5,
+    'join_event': 10,
+    'geocode': 7,
+    'reverse_geocode': 3,
+}
+
+
+def service_env(workdir: str, base_env: Optional[Dict[str, str]] = None) -> Dict[str, str]:
+    env = dict(base_env or os.environ)
+
+    env.update({
+        'ENVIRONMENT': 'production',
+        'PYTHONUNBUFFERED': '1',
+        'POSTGRES_EVENTS_URL': f'sqlite+aiosqlite:///{os.path.join(workdir, "events.db")}',
+        'POSTGRES_USERS_URL': f'sqlite+aiosqlite:///{os.path.join(workdir, "users.db")}',
+        'GEOCODER_PROVIDERS': 'stub',
+        'TRACE_EXPORT_DIR': os.path.join(workdir, 'traces'),
+        'PROFILING_DIR': os.path.join(workdir, 'profiles'),
+        # Все виртуальные пользователи приходят с 127.0.0.1 и делят один лимит
+        # частоты, поэтому уже seed() получил бы 429; лимит на клиента здесь
+        # не измеряется
+        'RATE_LIMIT_ENABLED': '0',
+        # Admission control не зависит от адреса клиента и остается включенным,
+        # как в продукции: отброшенные при перегрузке запросы считаются ошибками
+        'ADMISSION_ENABLED': '1',
+    })
+
+    for name, port in PORTS.items():
+        env[f'{name.upper()}_SERVICE_URL'] = f'http://127.0.0.1:{port}'
+        env[f'{name.upper()}_SERVICE_PORT'] = str(port)
+
+    return env
+
+
+def serve(name: str, port: int) -> None:
+    """
+    Запустить один сервис в текущем процессе
+    """
+    use_service(name)
+
+    import uvicorn
+
+    uvicorn.run('app.main:app', host='127.0.0.1', port=port, log_level='warning', access_log=False)
+
+
+class Cluster:
+    """
+    Локальные процессы всех сервисов
+    """
+
+    def __init__(self, workdir: str):
+        self.workdir = workdir
+        self.env = service_env(workdir)
+        self.processes: Dict[str, subprocess.Popen] = {}
+
+    def start(self) -> None:
+        for name, port in PORTS.items():
+            log = open(os.path.join(self.workdir, f'{name}.log'), 'w')
+
+            self.processes[name] = subprocess.Popen(
+                [sys.executable, os.path.abspath(__file__), 'serve', name, '--port', str(port)],
+                env=self.env,
+                stdout=log,
+                stderr=subprocess.STDOUT
+            )
+
+    async def wait_ready(self, timeout: float = 60.0) -> None:
+        import httpx
+
+        deadline = time.monotonic() + timeout
+
+        async with httpx.AsyncClient(timeout=2.0) as client:
+            for name, port in PORTS.items():
+                while True:
+                    if self.processes[name].poll() is not None:
+                        raise RuntimeError(f'{name} exited, see {os.path.join(self.workdir, name + ".log")}')
+
+                    try:
+                        if (await client.get(f'http://127.0.0.1:{port}/metrics')).status_code == 200:
+                            break
+                    except httpx.HTTPError:
+                        pass
+
+                    if time.monotonic() > deadline:
+                        raise RuntimeError(f'{name} did not start in {timeout} s')
+
+                    await asyncio.sleep(0.2)
+
+    def stop(self) -> None:
+        for process in self.processes.values():
+            process.terminate()
+
+        for process in self.processes.values():
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+
+class Dataset:
+    """
+    Данные, созданные при наполнении, и генератор новых
+    """
+
+    def __init__(self, rng: random.Random):
+        self.rng = rng
+        self.user_ids: List[int] = []
+        self.event_ids: List[int] = []
+        self.memberships: Set[Tuple[int, int]] = set()
+        self.addresses: List[str] = []
+        self.points: List[Tuple[float, float]] = []
+        self._user_counter = 0
+
+    def user_payload(self) -> Dict[str, Any]:
+        self._user_counter += 1
+
+        return {
+            'name': f'Пользователь {self._user_counter}',
+            'surname': 'Нагрузочный',
+            'email': f'load-{os.getpid()}-{self._user_counter}-{self.rng.getrandbits(32)}@example.com',
+            'password': 'load-test-password',
+            'is_spbsu_student': self.rng.random() < 0.7,
+            'university': 'СПбГУ',
+            'faculty': 'Математико-механический',
+            'speciality': 'Программная инженерия',
+            'course': self.rng.randint(1, 6),
+            'photo': None,
+            'email_verified': True,
+        }
+
+    def event_payload(self, index: int) -> Dict[str, Any]:
+        address = f'{self.rng.choice(STREETS)}, {self.rng.randint(1, 120)}'
+        self.addresses.append(address)
+
+        day = datetime.date.today() + datetime.timedelta(days=self.rng.randint(-14, 30))
+
+        return {
+            'url': f'https://example.com/events/{index}',
+            'category': self.rng.choice(CATEGORIES),
+            'format': self.rng.choice(['online', 'offline']),
+            'name': f'Событие {index}',
+            'description': 'Описание события для нагрузочного теста. ' * 5,
+            'photo': None,
+            'banner': None,
+            'location': 'Санкт-Петербург',
+            'address': address,
+            'date': day.isoformat(),
+            'start_time': f'{self.rng.randint(9, 20):02d}:00',
+            'max_participants': self.rng.choice([None, 20, 50, 100]),
+            'color': self.rng.choice(['#FF6B6B', '#4ECDC4', '#FFE66D']),
+        }
+
+
+async def seed(client, dataset: Dataset, users: int, events: int, members_per_event: int) -> None:
+    edge = f'http://127.0.0.1:{PORTS["edge_router"]}/api'
+
+    for _ in range(users):
+        response = await client.post(f'{edge}/users/', json=dataset.user_payload())
+        response.raise_for_status()
+        dataset.user_ids.append(response.json()['id'])
+
+    for index in range(events):
+        response = await client.post(f'{edge}/events/', json=dataset.event_payload(index))
+        response.raise_for_status()
+        event_id = response.json()['id']
+        dataset.event_ids.append(event_id)
+
+        member_ids = dataset.rng.sample(dataset.user_ids, min(members_per_event + 1, len(dataset.user_ids)))
+
+        for position, user_id in enumerate(member_ids):
+            response = await client.post(
+                f'{edge}/events/{event_id}/members/',
+                json={'user_id': user_id, 'role': 'organizer' if position == 0 else 'participant'}
+            )
+            response.raise_for_status()
+            dataset.memberships.add((event_id, user_id))
+
+    for address in dataset.addresses[:50]:
+        response = await client.get(f'{edge}/geocode', params={'address': address})
+
+        if response.status_code == 200:
+            data = response.json()
+            dataset.points.append((data['lat'], data['lon']))
+
+
+def build_request(operation: str, dataset: Dataset) -> Tuple[str, str, Dict[str, Any]]:
+    """
+    Запрос для операции смеси: (метод, URL, параметры httpx)
+    """
+    rng = dataset.rng
+    front = f'http://127.0.0.1:{PORTS["front_end"]}'
+    edge = f'http://127.0.0.1:{PORTS["edge_router"]}/api'
+
+    if operation == 'home':
+        return 'GET', f'{front}/', {}
+
+    if operation == 'home_filtered':
+        params = {'category': rng.choice(CATEGORIES)}
+
+        if rng.random() < 0.5:
+            # front-end принимает дату в формате ДД-ММ-ГГГГ, как в ссылках календаря
+            params['date'] = (datetime.date.today() + datetime.timedelta(days=rng.randint(0, 14))).strftime('%d-%m-%Y')
+
+        return 'GET', f'{front}/', {'params': params}
+
+    if operation == 'event_page':
+        return 'GET', f'{front}/event/{rng.choice(dataset.event_ids)}', {}
+
+    if operation == 'api_events':
+        return 'GET', f'{edge}/events/', {}
+
+    if operation == 'register_user':
+        return 'POST', f'{edge}/users/', {'json': dataset.user_payload()}
+
+    if operation == 'join_event':
+        for _ in range(20):
+            pair = (rng.choice(dataset.event_ids), rng.choice(dataset.user_ids))
+
+            if pair not in dataset.memberships:
+                break
+
+        dataset.memberships.add(pair)
+
+        return 'POST', f'{edge}/events/{pair[0]}/members/', {'json': {'user_id': pair[1], 'role': 'participant'}}
+
+    if operation == 'geocode':
+        return 'GET', f'{edge}/geocode', {'params': {'address': rng.choice(dataset.addresses)}}
+
+    if operation == 'reverse_geocode':
+        lat, lon = rng.choice(dataset.points) if dataset.points else (59.94, 30.30)
+
+        return 'GET', f'{edge}/reverse-geocode', {'params': {'lat': lat + rng.uniform(-2e-4, 2e-4), 'lon': lon}}
+
+    raise ValueError(f'Unknown operation: {operation}')
+
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+
+    index = min(len(values) - 1, max(0, math.ceil(q / 100 * len(values)) - 1))
+
+    return values[index]
+
+
+def summarize(samples: Dict[str, List[float]], errors: Dict[str, int], elapsed: float) -> Dict[str, Dict[str, Any]]:
+    routes = {}
+
+    for operation in sorted(set(samples) | set(errors)):
+        latencies = sorted(samples.get(operation, []))
+        count = len(latencies) + errors.get(operation, 0)
+
+        routes[operation] = {
+            'requests': count,
+            'errors': errors.get(operation, 0),
+            'rps': round(count / elapsed, 2),
+            'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+            'p95_ms': round(percentile(latencies, 95) * 1000, 2),
+            'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+            'max_ms': round(latencies[-1] * 1000, 2) if latencies else 0.0,
+        }
+
+    return routes
+
+
+async def drive(dataset: Dataset, duration: float, warmup: float, concurrency: int) -> Dict[str, Any]:
+    import httpx
+
+    operations = list(TRAFFIC_MIX)
+    weights = [TRAFFIC_MIX[operation] for operation in operations]
+
+    samples: Dict[str, List[float]] = {}
+    errors: Dict[str, int] = {}
+
+    measure_from = time.monotonic() + warmup
+    stop_at = measure_from + duration
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(timeout=30.0, limits=limits) as client:
+
+        async def worker() -> None:
+            while True:
+                now = time.monotonic()
+
+                if now >= stop_at:
+                    return
+
+                operation = dataset.rng.choices(operations, weights)[0]
+                method, url, kwargs = build_request(operation, dataset)
+
+                issued_at = time.monotonic()
+                request_started = time.perf_counter()
+
+                try:
+                    response = await client.request(method, url, **kwargs)
+                    failed = response.status_code >= 400
+                except httpx.HTTPError:
+                    failed = True
+
+                latency = time.perf_counter() - request_started
+
+                if issued_at < measure_from:
+                    continue
+
+                if failed:
+                    errors[operation] = errors.get(operation, 0) + 1
+                else:
+                    samples.setdefault(operation, []).append(latency)
+
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+
+    routes = summarize(samples, errors, duration)
+    total = summarize({'total': [value for values in samples.values() for value in values]}, {'total': sum(errors.values())}, duration)
+
+    return {'routes': routes, 'total': total['total']}
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=REPO_ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], threshold: float) -> List[str]:
+    """
+    Маршруты, у которых p95 вырос или пропускная способность упала больше threshold процентов
+    """
+    regressions = []
+
+    for operation, stats in current['routes'].items():
+        old = baseline.get('routes', {}).get(operation)
+
+        if not old:
+            continue
+
+        if old['p95_ms'] and (stats['p95_ms'] - old['p95_ms']) / old['p95_ms'] * 100 > threshold:
+            regressions.append(f'{operation}: p95 {old["p95_ms"]} -> {stats["p95_ms"]} ms')
+
+        if old['rps'] and (old['rps'] - stats['rps']) / old['rps'] * 100 > threshold:
+            regressions.append(f'{operation}: rps {old["rps"]} -> {stats["rps"]}')
+
+    return regressions
+
+
+async def run(args) -> Dict[str, Any]:
+    import httpx
+
+    workdir = tempfile.mkdtemp(prefix='ryadom-loadtest-')
+    cluster = Cluster(workdir)
+
+    cluster.start()
+
+    try:
+        await cluster.wait_ready()
+
+        dataset = Dataset(random.Random(args.seed))
+
+        async with httpx.AsyncClient(timeout=60.0) as client:
+            await seed(client, dataset, args.users, args.events, args.members)
+
+        result = await drive(dataset, args.duration, args.warmup, args.concurrency)
+
+    finally:
+        cluster.stop()
+
+    return {
+        'commit': git_commit(),
+        'created_at': datetime.datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'cpu_count': os.cpu_count(),
+        'parameters': {
+            'duration': args.duration,
+            'warmup': args.warmup,
+            'concurrency': args.concurrency,
+            'seed': args.seed,
+            'users': args.users,
+            'events': args.events,
+            'members_per_event': args.members,
+            'traffic_mix': TRAFFIC_MIX,
+        },
+        'workdir': workdir,
+        **result,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    serve_parser = subparsers.add_parser('serve', help='Запустить один сервис (используется командой run)')
+    serve_parser.add_argument('service', choices=sorted(SERVICES))
+    serve_parser.add_argument('--port', type=int, required=True)
+
+    run_parser = subparsers.add_parser('run', help='Запустить сервисы и нагрузку')
+    run_parser.add_argument('--duration', type=float, default=30.0, help='Длительность измерения, с')
+    run_parser.add_argument('--warmup', type=float, default=5.0, help='Прогрев без учета результатов, с')
+    run_parser.add_argument('--concurrency', type=int, default=16, help='Количество одновременных клиентов')
+    run_parser.add_argument('--users', type=int, default=100)
+    run_parser.add_argument('--events', type=int, default=200)
+    run_parser.add_argument('--members', type=int, default=5, help='Участников на событие при наполнении')
+    run_parser.add_argument('--seed', type=int, default=1)
+    run_parser.add_argument('--output', help='Файл для JSON с результатами')
+    run_parser.add_argument('--compare', help='JSON прошлого прогона для сравнения')
+    run_parser.add_argument('--threshold', type=float, default=10.0, help='Допустимое ухудшение, %%')
+
+    args = parser.parse_args()
+
+    if args.command == 'serve':
+        serve(args.service, args.port)
+        return
+
+    result = asyncio.run(run(args))
+
+    output = json.dumps(result, indent=2, ensure_ascii=False)
+
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+
+        with open(args.output, 'w', encoding='utf-8') as file:
+            file.write(output)
+
+    print(output)
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as file:
+            regressions = compare(result, json.load(file), args.threshold)
+
+        for regression in regressions:
+            print(f'REGRESSION {regression}', file=sys.stderr)
+
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
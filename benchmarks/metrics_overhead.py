@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Бенчмарк накладных расходов MetricsMiddleware.
+
+Вызывает одно и то же приложение FastAPI напрямую через ASGI, без сети,
+с подключенными метриками и без них, и сравнивает время обработки запроса.
+Отдельно измеряется само middleware вокруг пустого ASGI-приложения.
+
+Запуск:
+    python benchmarks/metrics_overhead.py --requests 20000
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from fastapi import FastAPI
+
+from common.metrics import MetricsMiddleware, setup_metrics
+
+
+def make_app(with_metrics: bool) -> FastAPI:
+    app = FastAPI()
+
+    if with_metrics:
+        setup_metrics(app, 'benchmark')
+
+    @app.get('/events/{event_id}')
+    async def get_event(event_id: int):
+        return {'id': event_id, 'title': 'Субботник', 'address': 'Университетская наб., 7-9'}
+
+    return app
+
+
+async def empty_app(scope, receive, send):
+    await send({'type': 'http.response.start', 'status': 200, 'headers': []})
+    await send({'type': 'http.response.body', 'body': b''})
+
+
+async def call(app, event_id: int) -> None:
+    scope = {
+        'type': 'http',
+        'asgi': {'version': '3.0'},
+        'http_version': '1.1',
+        'method': 'GET',
+        'scheme': 'http',
+        'path': f'/events/{event_id}',
+        'raw_path': f'/events/{event_id}'.encode(),
+        'root_path': '',
+        'query_string': b'',
+        'headers': [],
+        'client': ('127.0.0.1', 50000),
+        'server': ('127.0.0.1', 8080),
+    }
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        pass
+
+    await app(scope, receive, send)
+
+
+async def measure(app, requests: int, rounds: int) -> float:
+    """
+    Медиана времени на запрос в микросекундах по нескольким прогонам
+    """
+    for event_id in range(1000):
+        await call(app, event_id)
+
+    results = []
+
+    for _ in range(rounds):
+        started = time.perf_counter()
+
+        for index in range(requests):
+            await call(app, index % 1000)
+
+        results.append((time.perf_counter() - started) / requests * 1e6)
+
+    return statistics.median(results)
+
+
+async def run(requests: int, rounds: int) -> dict:
+    plain_app = make_app(with_metrics=False)
+    metrics_app = make_app(with_metrics=True)
+
+    # Приложение собирает стек middleware при первом запросе
+    plain_us = await measure(plain_app, requests, rounds)
+    metrics_us = await measure(metrics_app, requests, rounds)
+
+    empty_us = await measure(empty_app, requests, rounds)
+    middleware_us = await measure(MetricsMiddleware(empty_app, service='benchmark'), requests, rounds)
+
+    return {
+        'requests': requests,
+        'rounds': rounds,
+        'app_us': round(plain_us, 2),
+        'app_with_metrics_us': round(metrics_us, 2),
+        'app_overhead_percent': round((metrics_us - plain_us) / plain_us * 100, 2),
+        'middleware_only_us': round(middleware_us - empty_us, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=20000)
+    parser.add_argument('--rounds', type=int, default=5)
+    args = parser.parse_args()
+
+    result = asyncio.run(run(args.requests, args.rounds))
+
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,423 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Микробенчмарки горячих участков сервисов на SQLite (aiosqlite).
+
+Группы запускаются в отдельных процессах, потому что пакеты всех
+сервисов называются app:
+    events     EventsService.get_all_events, add_member_to_event
+    users      UsersService.create_user (хэширование bcrypt), get_password_hash
+    front_end  FrontEndService.get_index_page с N событиями, _sort_events, update_query_params
+    maps       MapsService: попадание в кэш геокодирования и в индекс обратного геокодирования
+
+Каждый бенчмарк калибрует число итераций в раунде и сообщает min, median,
+mean и stddev времени одной операции. Данные генерируются с фиксированным
+seed и масштабируются параметром --rows (от 1000 до 1000000).
+
+Код выхода 1, если какая-то группа завершилась с ошибкой (результаты
+тогда не сохраняются) или при --compare медиана выросла больше порога
+либо бенчмарк из базовых результатов отсутствует.
+
+Запуск:
+    python benchmarks/microbench.py --rows 10000 --save results/microbench.json
+    python benchmarks/microbench.py --rows 10000 --compare results/microbench.json --threshold 15
+    python benchmarks/microbench.py --group front_end --page-events 10,100,1000
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from typing import *
+
+from bootstrap import REPO_ROOT, use_service
+
+
+GROUPS = ['events', 'users', 'front_end', 'maps']
+
+
+class Bench:
+    """
+    Сбор результатов группы
+    """
+
+    def __init__(self, rounds: int, min_round_time: float):
+        self.rounds = rounds
+        self.min_round_time = min_round_time
+        self.results: Dict[str, Dict[str, Any]] = {}
+
+    async def run(self, name: str, fn: Callable[[], Awaitable[Any]], max_iterations: Optional[int] = None) -> None:
+        """
+        Измерить асинхронную операцию fn
+        """
+        await fn()
+
+        iterations = 1
+
+        while True:
+            started = time.perf_counter()
+
+            for _ in range(iterations):
+                await fn()
+
+            elapsed = time.perf_counter() - started
+
+            if elapsed >= self.min_round_time or (max_iterations and iterations >= max_iterations):
+                break
+
+            iterations = min(iterations * 2, max_iterations or sys.maxsize)
+
+        timings = []
+
+        for _ in range(self.rounds):
+            started = time.perf_counter()
+
+            for _ in range(iterations):
+                await fn()
+
+            timings.append((time.perf_counter() - started) / iterations)
+
+        self.results[name] = {
+            'iterations': iterations,
+            'rounds': self.rounds,
+            'min_us': round(min(timings) * 1e6, 3),
+            'median_us': round(statistics.median(timings) * 1e6, 3),
+            'mean_us': round(statistics.mean(timings) * 1e6, 3),
+            'stddev_us': round(statistics.stdev(timings) * 1e6, 3) if len(timings) > 1 else 0.0,
+        }
+
+        print(f'{name:50} {self.results[name]["median_us"]:>14.3f} us', file=sys.stderr)
+
+    async def run_sync(self, name: str, fn: Callable[[], Any], max_iterations: Optional[int] = None) -> None:
+        async def wrapper():
+            fn()
+
+        await self.run(name, wrapper, max_iterations)
+
+
+def sqlite_url(workdir: str, name: str) -> str:
+    return f'sqlite+aiosqlite:///{os.path.join(workdir, name)}'
+
+
+async def bench_events(bench: Bench, args, workdir: str) -> None:
+    os.environ['POSTGRES_EVENTS_URL'] = sqlite_url(workdir, 'events.db')
+
+    use_service('events')
+
+    import httpx
+
+    import app.models.outbox  # noqa: F401
+    import app.services.events_service as events_module
+    import ryadom_schemas.members as schemas_members
+
+    from app.database import async_session_maker, engine
+    from app.models.base import Base
+    from app.models.event import EventModel
+    from app.models.member import MemberModel
+    from app.services.events_service import EventsService
+    from datagen import generate_events, generate_members, insert_rows
+
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
+    events = generate_events(args.rows, seed=args.seed)
+    await insert_rows(engine, EventModel.__table__, events)
+    await insert_rows(
+        engine,
+        MemberModel.__table__,
+        generate_members([event['id'] for event in events[:1000]], users_count=1000, per_event=5, seed=args.seed)
+    )
+
+    # Клиент сервиса строит URL из USERS_SERVICE_URL, а ответ подменяет MockTransport
+    os.environ['USERS_SERVICE_URL'] = 'http://users.invalid'
+
+    # Проверка пользователя в сервисе пользователей заменена локальным ответом:
+    # ResilientTransport сервиса получает MockTransport вместо сетевого транспорта.
+    # Процесс группы изолирован, поэтому подмена ни на что больше не влияет
+    transport = httpx.MockTransport(lambda request: httpx.Response(200, json={'id': 1}))
+    real_transport = events_module.ResilientTransport
+    events_module.ResilientTransport = lambda service, **kwargs: real_transport(service, transport=transport, **kwargs)
+
+    async def get_all_events():
+        async with async_session_maker() as session:
+            await EventsService(session).get_all_events()
+
+    await bench.run(f'events.get_all_events[rows={args.rows}]', get_all_events, max_iterations=1000)
+
+    counter = iter(range(10 ** 6, 10 ** 9))
+
+    async def add_member_to_event():
+        user_id = next(counter)
+        member = schemas_members.MemberCreate(user_id=user_id, role='participant')
+
+        async with async_session_maker() as session:
+            await EventsService(session).add_member_to_event(1 + user_id % len(events), member)
+
+    await bench.run('events.add_member_to_event', add_member_to_event, max_iterations=2000)
+
+
+async def bench_users(bench: Bench, args, workdir: str) -> None:
+    os.environ['POSTGRES_USERS_URL'] = sqlite_url(workdir, 'users.db')
+
+    use_service('users')
+
+    import ryadom_schemas.users as schemas_users
+
+    from app.database import async_session_maker, engine
+    from app.models.user import Base, UserModel
+    from app.services.users_service import UsersService
+    from datagen import generate_users, insert_rows
+
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
+    await insert_rows(engine, UserModel.__table__, generate_users(args.rows, seed=args.seed, password_hash='x'))
+
+    counter = iter(range(10 ** 9))
+
+    async def create_user():
+        user = schemas_users.UserCreate(
+            name='Бенчмарк',
+            surname='Тестовый',
+            email=f'bench{next(counter)}@example.com',
+            password='benchmark-password',
+            is_spbsu_student=True,
+            university='СПбГУ',
+            faculty='Математико-механический',
+            speciality='Программная инженерия',
+            course=3,
+            photo=None,
+            email_verified=False
+        )
+
+        async with async_session_maker() as session:
+            await UsersService(session).create_user(user)
+
+    await bench.run(f'users.create_user[rows={args.rows}]', create_user, max_iterations=200)
+
+    async with async_session_maker() as session:
+        service = UsersService(session)
+
+        await bench.run_sync('users.get_password_hash', lambda: service.get_password_hash('benchmark-password'), max_iterations=50)
+
+
+async def bench_front_end(bench: Bench, args, workdir: str) -> None:
+    use_service('front_end')
+
+    from starlette.requests import Request
+
+    from app.services.front_end_service import FrontEndService
+    from app.utils.url import update_query_params
+    from datagen import event_response, generate_events
+
+    def make_request(query_string: bytes = b'') -> Request:
+        return Request({
+            'type': 'http',
+            'method': 'GET',
+            'scheme': 'http',
+            'server': ('127.0.0.1', 8081),
+            'path': '/',
+            'root_path': '',
+            'query_string': query_string,
+            'headers': [(b'host', b'127.0.0.1:8081')],
+        })
+
+    service = FrontEndService()
+
+    for page_events in args.page_events:
+        events = [event_response(row) for row in generate_events(page_events, seed=args.seed)]
+
+        async def get_all_events(events=events):
+            return [dict(event) for event in events]
+
+        service.get_all_events = get_all_events
+
+        async def get_index_page():
+            await service.get_index_page(make_request(b'category=science'), category='science')
+
+        await bench.run(f'front_end.get_index_page[events={page_events}]', get_index_page, max_iterations=1000)
+
+    events = [event_response(row) for row in generate_events(args.rows, seed=args.seed)]
+
+    await bench.run_sync(f'front_end._sort_events[rows={args.rows}]', lambda: service._sort_events(events), max_iterations=1000)
+
+    await bench.run_sync(
+        'front_end.update_query_params',
+        lambda: update_query_params('http://127.0.0.1:8081/?category=science&date=2025-09-01', date='2025-09-02')
+    )
+
+
+async def bench_maps(bench: Bench, args, workdir: str) -> None:
+    os.environ['GEOCODER_PROVIDERS'] = 'stub'
+    os.environ['STATIC_MAP_CACHE_DIR'] = os.path.join(workdir, 'static_map_cache')
+    os.environ['GEOCODE_STORE_PATH'] = os.path.join(workdir, 'geocode_store.jsonl')
+    os.environ['ADDRESS_INDEX_SIZE'] = str(args.rows + 1000)
+
+    use_service('maps')
+
+    import random
+
+    from app.services.maps_service import MapsService, address_index
+    from datagen import STREETS
+
+    service = MapsService()
+    rng = random.Random(args.seed)
+
+    address = 'Университетская наб., 7-9'
+    await service.get_coordinates_by_address(address)
+
+    await bench.run('maps.get_coordinates_by_address[cache hit]', lambda: service.get_coordinates_by_address(address))
+
+    points = [(59.85 + rng.random() * 0.2, 30.2 + rng.random() * 0.3) for _ in range(args.rows)]
+
+    for index, (point_lat, point_lon) in enumerate(points):
+        address_index.add(f'{rng.choice(STREETS)}, {index}', point_lat, point_lon)
+
+    lat, lon = points[0]
+
+    await bench.run(
+        f'maps.get_address_by_coordinates[index hit, rows={args.rows}]',
+        lambda: service.get_address_by_coordinates(lat + 0.0001, lon)
+    )
+
+
+GROUP_FUNCTIONS = {
+    'events': bench_events,
+    'users': bench_users,
+    'front_end': bench_front_end,
+    'maps': bench_maps,
+}
+
+
+def run_group(group: str, args) -> None:
+    """
+    Выполнить группу в текущем процессе и вывести результаты в stdout
+    """
+    bench = Bench(args.rounds, args.min_round_time)
+
+    with tempfile.TemporaryDirectory(prefix='ryadom-microbench-') as workdir:
+        asyncio.run(GROUP_FUNCTIONS[group](bench, args, workdir))
+
+    print(json.dumps(bench.results))
+
+
+def run_all(args) -> Tuple[Dict[str, Any], List[str]]:
+    """
+    Выполнить группы в отдельных процессах
+
+    Returns:
+        Tuple[Dict[str, Any], List[str]]: результаты и группы, завершившиеся с ошибкой
+    """
+    results = {}
+    failed = []
+
+    for group in args.group or GROUPS:
+        command = [
+            sys.executable, os.path.abspath(__file__), '--run-group', group,
+            '--rows', str(args.rows),
+            '--page-events', ','.join(map(str, args.page_events)),
+            '--rounds', str(args.rounds),
+            '--min-round-time', str(args.min_round_time),
+            '--seed', str(args.seed),
+        ]
+
+        completed = subprocess.run(command, stdout=subprocess.PIPE, text=True, env={**os.environ, 'ENVIRONMENT': 'production'})
+
+        if completed.returncode != 0:
+            print(f'group {group} failed with code {completed.returncode}', file=sys.stderr)
+            failed.append(group)
+            continue
+
+        results.update(json.loads(completed.stdout.strip().splitlines()[-1]))
+
+    return results, failed
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], threshold: float, groups: Iterable[str] = GROUPS) -> List[str]:
+    """
+    Бенчмарки, медиана которых выросла больше чем на threshold процентов,
+    и бенчмарки выполненных групп, которые есть в базовых результатах,
+    но отсутствуют в текущих
+    """
+    regressions = [
+        f'{name}: missing'
+        for name in baseline
+        if name not in current and name.split('.', 1)[0] in groups
+    ]
+
+    for name, stats in current.items():
+        old = baseline.get(name)
+
+        if not old or not old['median_us']:
+            continue
+
+        change = (stats['median_us'] - old['median_us']) / old['median_us'] * 100
+
+        if change > threshold:
+            regressions.append(f'{name}: {old["median_us"]} -> {stats["median_us"]} us (+{change:.1f}%)')
+
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--group', action='append', choices=GROUPS, help='Группа бенчмарков (можно несколько)')
+    parser.add_argument('--rows', type=int, default=1000, help='Количество строк в базах и индексах')
+    parser.add_argument('--page-events', default='10,100,1000', help='Количества событий для рендера главной')
+    parser.add_argument('--rounds', type=int, default=5)
+    parser.add_argument('--min-round-time', type=float, default=0.2, help='Минимальная длительность раунда, с')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--save', help='Сохранить результаты как базовые')
+    parser.add_argument('--compare', help='Сравнить с базовыми результатами')
+    parser.add_argument('--threshold', type=float, default=15.0, help='Допустимое замедление медианы, %%')
+    parser.add_argument('--run-group', choices=GROUPS, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    args.page_events = [int(value) for value in args.page_events.split(',') if value]
+
+    if args.run_group:
+        run_group(args.run_group, args)
+        return
+
+    results, failed = run_all(args)
+
+    report = {
+        'commit': subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=REPO_ROOT, stdout=subprocess.PIPE, text=True).stdout.strip() or None,
+        'rows': args.rows,
+        'seed': args.seed,
+        'results': results,
+    }
+
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+
+    # Неполные результаты не сохраняются как базовые и не сравниваются
+    if failed:
+        print(f'FAILED groups: {", ".join(failed)}', file=sys.stderr)
+        sys.exit(1)
+
+    if args.save:
+        os.makedirs(os.path.dirname(os.path.abspath(args.save)), exist_ok=True)
+
+        with open(args.save, 'w', encoding='utf-8') as file:
+            json.dump(report, file, indent=2, ensure_ascii=False)
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as file:
+            regressions = compare(results, json.load(file)['results'], args.threshold, args.group or GROUPS)
+
+        for regression in regressions:
+            print(f'REGRESSION {regression}', file=sys.stderr)
+
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,315 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Контроль допуска запросов к бэкендам и сброс нагрузки.
+
+На каждый бэкенд заводится AdmissionController с адаптивным пределом
+одновременных запросов (AIMD): предел растет на 1/limit после каждого
+успешного запроса, пока он используется полностью, и уменьшается в
+ADMISSION_BACKOFF раз при признаке перегрузки — таймауте, открытом
+breaker'е, ответе 503/504 или задержке дольше ADMISSION_LATENCY_THRESHOLD.
+
+Запросы делятся на классы маршрутов:
+
+    read   дешевые чтения по id     приоритет 0, вся квота бэкенда
+    list   списки                   приоритет 1, половина квоты
+    write  запросы на изменение     приоритет 2, половина квоты
+
+Если свободных мест нет, запрос ждет в очереди не дольше
+ADMISSION_QUEUE_TIMEOUT (и не дольше дедлайна запроса); места
+освобождаются в порядке приоритета. При заполненной очереди новый
+запрос вытесняет ожидающий запрос менее приоритетного класса или
+сразу получает OverloadedError, который edge-router отдает как 503
+с Retry-After.
+"""
+
+import asyncio
+import httpx
+import itertools
+import time
+
+from contextlib import asynccontextmanager
+from prometheus_client import Counter, Gauge
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.common.resilience import CircuitOpenError, remaining_time
+from app.config import get_config
+
+
+ROUTE_CLASS_PRIORITY = {'read': 0, 'list': 1, 'write': 2}
+
+# Доля предела бэкенда, которую может занять один класс
+ROUTE_CLASS_SHARE = {'read': 1.0, 'list': 0.5, 'write': 0.5}
+
+OVERLOAD_STATUSES = {503, 504}
+
+ADMISSION_LIMIT = Gauge(
+    'admission_limit',
+    'Текущий предел одновременных запросов к бэкенду',
+    ('backend',),
+    multiprocess_mode='livesum',
+)
+
+ADMISSION_IN_FLIGHT = Gauge(
+    'admission_in_flight',
+    'Допущенные и еще не завершенные запросы к бэкенду',
+    ('backend', 'route_class'),
+    multiprocess_mode='livesum',
+)
+
+ADMISSION_QUEUE_DEPTH = Gauge(
+    'admission_queue_depth',
+    'Запросы, ожидающие допуска к бэкенду',
+    ('backend', 'route_class'),
+    multiprocess_mode='livesum',
+)
+
+ADMISSION_ADMITTED_TOTAL = Counter(
+    'admission_admitted_total',
+    'Запросы, допущенные к бэкенду',
+    ('backend', 'route_class'),
+)
+
+ADMISSION_SHED_TOTAL = Counter(
+    'admission_shed_total',
+    'Запросы, отклоненные из-за перегрузки: queue_full, evicted, timeout',
+    ('backend', 'route_class', 'reason'),
+)
+
+
+class OverloadedError(Exception):
+    """
+    Бэкенд перегружен, запрос к нему не отправлялся
+    """
+
+    def __init__(self, backend: str, retry_after: int):
+        super().__init__(f'Backend {backend} is overloaded')
+        self.backend = backend
+        self.retry_after = retry_after
+
+
+class _Waiter:
+
+    def __init__(self, route_class: str, sequence: int):
+        self.route_class = route_class
+        self.priority = ROUTE_CLASS_PRIORITY[route_class]
+        self.sequence = sequence
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+
+    def sort_key(self) -> Tuple[int, int]:
+        return self.priority, self.sequence
+
+
+def is_overload(error: BaseException) -> bool:
+    """
+    Является ли ошибка запроса к бэкенду признаком его перегрузки
+    """
+    if isinstance(error, (httpx.TimeoutException, CircuitOpenError)):
+        return True
+
+    return isinstance(error, httpx.HTTPStatusError) and error.response.status_code in OVERLOAD_STATUSES
+
+
+class AdmissionController:
+    """
+    Адаптивный (AIMD) предел одновременных запросов к одному бэкенду
+    с приоритетной очередью по классам маршрутов
+    """
+
+    def __init__(self, backend: str, config=None):
+        self.config = config or get_config()
+
+        self.backend = backend
+        self.limit = float(self.config.ADMISSION_INITIAL_LIMIT)
+
+        self.in_flight = 0
+        self.in_flight_by_class: Dict[str, int] = dict.fromkeys(ROUTE_CLASS_PRIORITY, 0)
+
+        self._waiters: List[_Waiter] = []
+        self._sequence = itertools.count()
+        self._last_decrease = 0.0
+
+        ADMISSION_LIMIT.labels(backend).set(self.limit)
+
+    def _class_limit(self, route_class: str) -> int:
+        return max(1, int(self.limit * ROUTE_CLASS_SHARE[route_class]))
+
+    def _can_admit(self, route_class: str) -> bool:
+        return self.in_flight < int(self.limit) and self.in_flight_by_class[route_class] < self._class_limit(route_class)
+
+    def _admit(self, route_class: str) -> None:
+        self.in_flight += 1
+        self.in_flight_by_class[route_class] += 1
+
+        ADMISSION_IN_FLIGHT.labels(self.backend, route_class).inc()
+        ADMISSION_ADMITTED_TOTAL.labels(self.backend, route_class).inc()
+
+    def _shed(self, route_class: str, reason: str) -> OverloadedError:
+        ADMISSION_SHED_TOTAL.labels(self.backend, route_class, reason).inc()
+
+        return OverloadedError(self.backend, self.config.ADMISSION_RETRY_AFTER)
+
+    def _enqueue(self, route_class: str) -> _Waiter:
+        waiter = _Waiter(route_class, next(self._sequence))
+
+        if len(self._waiters) >= self.config.ADMISSION_QUEUE_SIZE:
+            victim = max(self._waiters, key=_Waiter.sort_key)
+
+            if victim.priority <= waiter.priority:
+                raise self._shed(route_class, 'queue_full')
+
+            self._remove(victim)
+            victim.future.set_exception(self._shed(victim.route_class, 'evicted'))
+
+        self._waiters.append(waiter)
+        ADMISSION_QUEUE_DEPTH.labels(self.backend, route_class).inc()
+
+        return waiter
+
+    def _remove(self, waiter: _Waiter) -> None:
+        self._waiters.remove(waiter)
+        ADMISSION_QUEUE_DEPTH.labels(self.backend, waiter.route_class).dec()
+
+    def _wake(self) -> None:
+        for waiter in sorted(self._waiters, key=_Waiter.sort_key):
+            if self.in_flight >= int(self.limit):
+                break
+
+            if self._can_admit(waiter.route_class):
+                self._remove(waiter)
+                self._admit(waiter.route_class)
+                waiter.future.set_result(None)
+
+    async def acquire(self, route_class: str) -> None:
+        """
+        Занять место для запроса класса route_class
+
+        Raises:
+            OverloadedError: очередь заполнена, запрос вытеснен
+                более приоритетным или не дождался места
+        """
+        queued_ahead = any(waiter.priority <= ROUTE_CLASS_PRIORITY[route_class] for waiter in self._waiters)
+
+        if not queued_ahead and self._can_admit(route_class):
+            self._admit(route_class)
+            return
+
+        waiter = self._enqueue(route_class)
+
+        timeout = self.config.ADMISSION_QUEUE_TIMEOUT
+        remaining = remaining_time()
+
+        if remaining is not None:
+            timeout = min(timeout, max(0.0, remaining))
+
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), timeout)
+
+        except asyncio.TimeoutError:
+            if not waiter.future.done():
+                self._remove(waiter)
+                waiter.future.cancel()
+            elif waiter.future.exception() is None:
+                # Место освободилось одновременно с таймаутом
+                self.release(route_class)
+
+            raise self._shed(route_class, 'timeout')
+
+        except asyncio.CancelledError:
+            if waiter.future.done() and not waiter.future.cancelled() and waiter.future.exception() is None:
+                self.release(route_class)
+            elif not waiter.future.done():
+                self._remove(waiter)
+                waiter.future.cancel()
+
+            raise
+
+    def _adjust_limit(self, latency: float, overloaded: bool, started: float, saturated: bool) -> None:
+        if overloaded or latency > self.config.ADMISSION_LATENCY_THRESHOLD:
+            # Запросы, начатые до прошлого снижения, не снижают предел повторно
+            if started > self._last_decrease:
+                self.limit = max(self.config.ADMISSION_MIN_LIMIT, self.limit * self.config.ADMISSION_BACKOFF)
+                self._last_decrease = time.monotonic()
+
+        elif saturated:
+            self.limit = min(self.config.ADMISSION_MAX_LIMIT, self.limit + 1 / self.limit)
+
+        ADMISSION_LIMIT.labels(self.backend).set(self.limit)
+
+    def release(self, route_class: str, latency: Optional[float] = None, overloaded: bool = False, started: float = 0.0) -> None:
+        """
+        Освободить место и, если передана задержка latency, скорректировать
+        предел по результату запроса
+        """
+        saturated = self.in_flight >= int(self.limit)
+
+        self.in_flight -= 1
+        self.in_flight_by_class[route_class] -= 1
+        ADMISSION_IN_FLIGHT.labels(self.backend, route_class).dec()
+
+        if latency is not None:
+            self._adjust_limit(latency, overloaded, started, saturated)
+
+        self._wake()
+
+    @asynccontextmanager
+    async def slot(self, route_class: str):
+        """
+        Контекст запроса к бэкенду: ожидание допуска, затем учет
+        задержки и ошибок для корректировки предела
+        """
+        await self.acquire(route_class)
+
+        started = time.monotonic()
+        overloaded = False
+
+        try:
+            yield
+
+        except BaseException as e:
+            overloaded = is_overload(e)
+            raise
+
+        finally:
+            self.release(route_class, time.monotonic() - started, overloaded, started)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'limit': round(self.limit, 2),
+            'in_flight': dict(self.in_flight_by_class),
+            'queued': len(self._waiters),
+        }
+
+
+class AdmissionRegistry:
+    """
+    Контроллеры допуска по бэкендам, общие для всех запросов процесса
+    """
+
+    def __init__(self, config=None):
+        self.config = config or get_config()
+        self.controllers: Dict[str, AdmissionController] = {}
+
+    def controller(self, backend: str) -> AdmissionController:
+        controller = self.controllers.get(backend)
+
+        if controller is None:
+            controller = self.controllers[backend] = AdmissionController(backend, self.config)
+
+        return controller
+
+    @asynccontextmanager
+    async def slot(self, backend: str, route_class: str):
+        if not self.config.ADMISSION_ENABLED:
+            yield
+            return
+
+        async with self.controller(backend).slot(route_class):
+            yield
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        return {backend: controller.stats() for backend, controller in self.controllers.items()}
+
+
+admission = AdmissionRegistry()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Адрес клиента, от имени которого выполняется запрос.
+
+nginx выставляет X-Real-IP сам, а сервисы передают его дальше в запросах
+к другим сервисам, поэтому на любом шаге цепочки адрес клиента — это
+X-Real-IP, иначе последний адрес X-Forwarded-For (первые адреса в нем
+передает клиент и может подменить), иначе адрес соединения.
+
+По этому адресу ограничивается частота запросов, закрепляются за
+основной базой записи (read-your-writes) и разделяются ключи
+идемпотентности.
+
+ClientAddressMiddleware сохраняет адрес входящего запроса в контексте,
+forwarding_headers() возвращает заголовки для запросов к другим сервисам
+от имени этого клиента.
+"""
+
+from contextvars import ContextVar
+from starlette.datastructures import Headers
+from typing import *
+
+
+CLIENT_ADDRESS_HEADER = 'X-Real-IP'
+
+current_client_address: ContextVar[Optional[str]] = ContextVar('current_client_address', default=None)
+
+
+def resolve_client_address(headers: Mapping[str, str], peer: Optional[str]) -> str:
+    real_ip = headers.get('x-real-ip')
+
+    if real_ip:
+        return real_ip.strip()
+
+    forwarded_for = headers.get('x-forwarded-for')
+
+    if forwarded_for:
+        return forwarded_for.rsplit(',', 1)[-1].strip()
+
+    return peer or ''
+
+
+def request_client_address(request) -> str:
+    """
+    Адрес клиента запроса FastAPI
+    """
+    return resolve_client_address(request.headers, request.client.host if request.client else None)
+
+
+def scope_client_address(scope) -> str:
+    """
+    Адрес клиента по ASGI scope
+    """
+    client = scope.get('client')
+
+    return resolve_client_address(Headers(scope=scope), client[0] if client else None)
+
+
+def forwarding_headers() -> Dict[str, str]:
+    """
+    Заголовки с адресом клиента текущего запроса для запросов к другим сервисам
+    """
+    address = current_client_address.get()
+
+    return {CLIENT_ADDRESS_HEADER: address} if address else {}
+
+
+class ClientAddressMiddleware:
+    """
+    ASGI-middleware, сохраняющее адрес клиента запроса в current_client_address
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        token = current_client_address.set(scope_client_address(scope))
+
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            current_client_address.reset(token)
+
+
+def setup_client_address(app) -> None:
+    app.add_middleware(ClientAddressMiddleware)
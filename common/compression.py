@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Сжатие ответов по Accept-Encoding (zstd, brotli, gzip).
+
+CompressionMiddleware сжимает целиком сформированные ответы текстовых
+типов (JSON, HTML, CSS, JS, SVG) размером от COMPRESSION_MIN_SIZE байт.
+Потоковые ответы (SSE, файлы) и ответы с Content-Encoding (заранее
+сжатая статика) передаются без изменений.
+
+Сжатые варианты ответов с ETag сохраняются в VariantCache по пути,
+ETag и кодировке: повторный запрос той же версии ресурса не сжимается
+заново. ETag сжатого ответа становится слабым (W/"..."), потому что
+байты представления отличаются от несжатого.
+
+brotli и zstandard — необязательные зависимости: без них
+соответствующая кодировка просто не предлагается.
+"""
+
+import asyncio
+import gzip
+
+from collections import OrderedDict
+from starlette.datastructures import Headers, MutableHeaders
+from typing import Callable, Dict, Optional, Sequence, Tuple
+
+from app.config import get_config
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+# Порядок предпочтения при одинаковом q: zstd быстрее brotli при сопоставимой степени сжатия
+ENCODING_PREFERENCE = ('zstd', 'br', 'gzip')
+
+COMPRESSIBLE_TYPES = {
+    'application/json',
+    'application/javascript',
+    'application/xml',
+    'image/svg+xml',
+}
+
+# Тела больше этого размера сжимаются в пуле потоков, чтобы не блокировать цикл событий
+OFFLOAD_MIN_SIZE = 256 * 1024
+
+
+def _compress_gzip(data: bytes, level: int) -> bytes:
+    return gzip.compress(data, compresslevel=level, mtime=0)
+
+
+def _compress_brotli(data: bytes, level: int) -> bytes:
+    return brotli.compress(data, quality=level)
+
+
+def _compress_zstd(data: bytes, level: int) -> bytes:
+    return zstandard.ZstdCompressor(level=level).compress(data)
+
+
+COMPRESSORS: Dict[str, Callable[[bytes, int], bytes]] = {'gzip': _compress_gzip}
+
+if brotli is not None:
+    COMPRESSORS['br'] = _compress_brotli
+
+if zstandard is not None:
+    COMPRESSORS['zstd'] = _compress_zstd
+
+
+def negotiate_encoding(accept_encoding: str, available: Sequence[str]) -> Optional[str]:
+    """
+    Выбрать кодировку по Accept-Encoding: наибольший q, при равенстве —
+    порядок available. Кодировки с q=0 исключаются, * задает q для остальных
+
+    Пример:
+        negotiate_encoding('gzip, br;q=0.9', ['zstd', 'br', 'gzip']) -> 'gzip'
+    """
+    qualities: Dict[str, float] = {}
+
+    for value in accept_encoding.split(','):
+        coding, _, params = value.partition(';')
+        coding = coding.strip().lower()
+
+        if not coding:
+            continue
+
+        quality = 1.0
+        params = params.strip()
+
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+
+        qualities[coding] = quality
+
+    wildcard = qualities.get('*', 0.0)
+
+    best, best_quality = None, 0.0
+
+    for coding in available:
+        quality = qualities.get(coding, wildcard)
+
+        if quality > best_quality:
+            best, best_quality = coding, quality
+
+    return best
+
+
+def is_compressible(content_type: str) -> bool:
+    media_type = content_type.split(';', 1)[0].strip().lower()
+
+    if media_type.startswith('text/'):
+        return media_type != 'text/event-stream'
+
+    return media_type in COMPRESSIBLE_TYPES or media_type.endswith('+json')
+
+
+class VariantCache:
+    """
+    LRU-кэш сжатых вариантов, ограниченный суммарным размером
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+
+        self.hits = 0
+        self.misses = 0
+
+        self._entries: 'OrderedDict[Tuple[str, str, str], bytes]' = OrderedDict()
+        self._size = 0
+
+    def get(self, key: Tuple[str, str, str]) -> Optional[bytes]:
+        data = self._entries.get(key)
+
+        if data is None:
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+
+        return data
+
+    def put(self, key: Tuple[str, str, str], data: bytes) -> None:
+        if len(data) > self.max_bytes:
+            return
+
+        previous = self._entries.pop(key, None)
+
+        if previous is not None:
+            self._size -= len(previous)
+
+        self._entries[key] = data
+        self._size += len(data)
+
+        while self._size > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._size -= len(evicted)
+
+    def stats(self) -> Dict[str, int]:
+        return {'entries': len(self._entries), 'bytes': self._size, 'hits': self.hits, 'misses': self.misses}
+
+
+class CompressionMiddleware:
+    """
+    ASGI-middleware сжатия ответов с выбором кодировки по Accept-Encoding
+    """
+
+    def __init__(self, app, minimum_size: Optional[int] = None, config=None):
+        config = config or get_config()
+
+        self.app = app
+        self.minimum_size = minimum_size or config.COMPRESSION_MIN_SIZE
+        self.levels = {
+            'gzip': config.COMPRESSION_GZIP_LEVEL,
+            'br': config.COMPRESSION_BROTLI_QUALITY,
+            'zstd': config.COMPRESSION_ZSTD_LEVEL,
+        }
+        self.encodings = [encoding for encoding in ENCODING_PREFERENCE if encoding in COMPRESSORS]
+        self.variants = VariantCache(config.COMPRESSION_CACHE_MAX_BYTES)
+
+    def _is_eligible(self, message) -> bool:
+        if message['status'] in (204, 206, 304) or message['status'] < 200:
+            return False
+
+        headers = Headers(raw=message['headers'])
+
+        return 'content-encoding' not in headers and \
+            is_compressible(headers.get('content-type', '')) and \
+            'no-transform' not in headers.get('cache-control', '')
+
+    async def compress(self, data: bytes, encoding: str) -> bytes:
+        compressor, level = COMPRESSORS[encoding], self.levels[encoding]
+
+        if len(data) >= OFFLOAD_MIN_SIZE:
+            return await asyncio.to_thread(compressor, data, level)
+
+        return compressor(data, level)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        encoding = negotiate_encoding(Headers(scope=scope).get('accept-encoding', ''), self.encodings)
+
+        start_message = None
+        passthrough = False
+
+        async def send_wrapper(message):
+            nonlocal start_message, passthrough
+
+            if passthrough:
+                await send(message)
+                return
+
+            if message['type'] == 'http.response.start':
+                if self._is_eligible(message):
+                    start_message = message
+                else:
+                    passthrough = True
+                    await send(message)
+                return
+
+            if message['type'] != 'http.response.body' or message.get('more_body', False):
+                # Потоковый ответ отдается как есть
+                passthrough = True
+                await send(start_message)
+                await send(message)
+                return
+
+            await self._send_body(scope, start_message, message.get('body', b''), encoding, send)
+
+        await self.app(scope, receive, send_wrapper)
+
+    async def _send_body(self, scope, start_message, body: bytes, encoding: Optional[str], send) -> None:
+        if len(body) < self.minimum_size:
+            await send(start_message)
+            await send({'type': 'http.response.body', 'body': body})
+            return
+
+        headers = MutableHeaders(raw=start_message['headers'])
+        headers.add_vary_header('Accept-Encoding')
+
+        if encoding is not None:
+            etag = headers.get('etag')
+            key = None
+
+            if etag:
+                query_string = scope.get('query_string', b'').decode('latin-1')
+                key = (f"{scope['path']}?{query_string}", etag.removeprefix('W/'), encoding)
+
+            compressed = self.variants.get(key) if key else None
+
+            if compressed is None:
+                compressed = await self.compress(body, encoding)
+
+                if key:
+                    self.variants.put(key, compressed)
+
+            if len(compressed) < len(body):
+                body = compressed
+
+                headers['Content-Encoding'] = encoding
+                headers['Content-Length'] = str(len(body))
+
+                if etag and not etag.startswith('W/'):
+                    headers['ETag'] = f'W/{etag}'
+
+        await send(start_message)
+        await send({'type': 'http.response.body', 'body': body})
+
+
+def setup_compression(app, config=None) -> None:
+    """
+    Подключить сжатие ответов к приложению FastAPI, если оно включено в конфигурации
+    """
+    config = config or get_config()
+
+    if config.COMPRESSION_ENABLED:
+        app.add_middleware(CompressionMiddleware)
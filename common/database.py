@@ -0,0 +1,443 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import asyncio
+import itertools
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+from collections import OrderedDict
+from sqlalchemy import MetaData, func, inspect, select, text
+from sqlalchemy.engine import Connection
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, NullPool
+from sqlalchemy.schema import CreateColumn
+from typing import Any, Dict, List, Optional, Sequence, Union
+
+from app.common.query_stats import instrument_queries
+from app.common.tracing import instrument_engine
+from app.config import get_config
+
+
+class PoolStats:
+    """
+    Счетчики пула соединений: количество выдач соединения
+    и время ожидания свободного соединения
+    """
+
+    def __init__(self):
+        self.checkouts = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+        self.failures = 0
+
+        self._lock = threading.Lock()
+
+    def record_wait(self, seconds: float, failed: bool = False) -> None:
+        with self._lock:
+            if failed:
+                self.failures += 1
+            else:
+                self.checkouts += 1
+
+            self.wait_seconds_total += seconds
+            self.wait_seconds_max = max(self.wait_seconds_max, seconds)
+
+
+class InstrumentedQueuePool(AsyncAdaptedQueuePool):
+    """
+    Пул соединений, замеряющий время ожидания соединения
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        self.stats = PoolStats()
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.stats = self.stats
+
+        return pool
+
+    def _do_get(self):
+        started = time.perf_counter()
+
+        try:
+            connection = super()._do_get()
+        except Exception:
+            self.stats.record_wait(time.perf_counter() - started, failed=True)
+            raise
+
+        self.stats.record_wait(time.perf_counter() - started)
+
+        return connection
+
+
+def create_engine(database_url: str, config=None) -> AsyncEngine:
+    """
+    Создать движок базы данных с параметрами пула из конфигурации
+
+    Args:
+        database_url: URL подключения SQLAlchemy
+        config: конфигурация (по умолчанию get_config())
+
+    Returns:
+        AsyncEngine: движок базы данных
+    """
+    config = config or get_config()
+
+    log_level = config.DB_LOG_LEVEL.upper()
+    echo: Union[bool, str] = 'debug' if log_level == 'DEBUG' else log_level == 'INFO'
+
+    if not database_url.startswith('postgresql'):
+        engine = create_async_engine(database_url, echo=echo)
+        instrument_engine(engine)
+        instrument_queries(engine, config)
+
+        return engine
+
+    engine_kwargs: Dict[str, Any] = {
+        'echo': echo,
+        'pool_pre_ping': config.DB_POOL_PRE_PING,
+    }
+
+    connect_args: Dict[str, Any] = {}
+
+    if config.DB_PGBOUNCER_MODE:
+        # В транзакционном режиме PgBouncer соединение сервера меняется
+        # между транзакциями, поэтому подготовленные выражения не кэшируются
+        # и получают уникальные имена
+        connect_args['statement_cache_size'] = 0
+        connect_args['prepared_statement_cache_size'] = 0
+        connect_args['prepared_statement_name_func'] = lambda: f'__asyncpg_{uuid.uuid4()}__'
+    else:
+        connect_args['statement_cache_size'] = config.DB_STATEMENT_CACHE_SIZE
+        connect_args['prepared_statement_cache_size'] = config.DB_STATEMENT_CACHE_SIZE
+
+    if config.DB_POOL_SIZE > 0:
+        engine_kwargs.update(
+            poolclass=InstrumentedQueuePool,
+            pool_size=config.DB_POOL_SIZE,
+            max_overflow=config.DB_MAX_OVERFLOW,
+            pool_timeout=config.DB_POOL_TIMEOUT,
+            pool_recycle=config.DB_POOL_RECYCLE,
+        )
+    else:
+        engine_kwargs['poolclass'] = NullPool
+
+    engine = create_async_engine(database_url, connect_args=connect_args, **engine_kwargs)
+    instrument_engine(engine)
+    instrument_queries(engine, config)
+
+    return engine
+
+
+def create_session_maker(engine: AsyncEngine) -> sessionmaker:
+    return sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+
+# Ключ advisory-блокировки, под которой воркеры по очереди обновляют схему
+SCHEMA_LOCK_ID = 0x736368656d61
+
+
+def create_schema(connection: Connection, metadata: MetaData) -> None:
+    """
+    Создать таблицы и дополнить уже существующие столбцами и индексами,
+    добавленными в модели позже. Скрипты docker-entrypoint-initdb.d
+    выполняются только на пустом томе, поэтому существующие базы
+    обновляются здесь, при старте сервиса. Вызывается через run_sync
+
+        async with engine.begin() as conn:
+            await conn.run_sync(create_schema, Base.metadata)
+
+    Новый столбец NOT NULL должен иметь server_default
+    """
+    # Воркеры стартуют одновременно, и второй не должен добавлять тот же столбец
+    if connection.dialect.name == 'postgresql':
+        connection.execute(select(func.pg_advisory_xact_lock(SCHEMA_LOCK_ID)))
+
+    inspector = inspect(connection)
+    existing_tables = set(inspector.get_table_names())
+
+    metadata.create_all(connection)
+
+    for table in metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+
+        columns = {column['name'] for column in inspector.get_columns(table.name)}
+
+        for column in table.columns:
+            if column.name not in columns:
+                connection.execute(text(
+                    f'ALTER TABLE {connection.dialect.identifier_preparer.format_table(table)} '
+                    f'ADD COLUMN {CreateColumn(column).compile(dialect=connection.dialect)}'
+                ))
+
+        indexes = {index['name'] for index in inspector.get_indexes(table.name)}
+
+        for index in table.indexes:
+            if index.name not in indexes:
+                index.create(connection)
+
+
+def get_pool_stats(engine: AsyncEngine) -> Dict[str, Any]:
+    """
+    Получить состояние пула соединений движка
+
+    Returns:
+        Dict[str, Any]: размер пула, занятые соединения и время ожидания
+    """
+    pool = engine.sync_engine.pool
+
+    stats = {
+        'pool_class': type(pool).__name__,
+    }
+
+    if isinstance(pool, AsyncAdaptedQueuePool):
+        stats.update(
+            size=pool.size(),
+            checked_in=pool.checkedin(),
+            checked_out=pool.checkedout(),
+            overflow=pool.overflow(),
+        )
+
+    if isinstance(pool, InstrumentedQueuePool):
+        stats.update(
+            checkouts=pool.stats.checkouts,
+            checkout_failures=pool.stats.failures,
+            checkout_wait_seconds_total=round(pool.stats.wait_seconds_total, 6),
+            checkout_wait_seconds_max=round(pool.stats.wait_seconds_max, 6),
+        )
+
+    return stats
+
+
+REPLICA_LAG_QUERY = text(
+    "SELECT CASE "
+    "WHEN NOT pg_is_in_recovery() THEN 0 "
+    "WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) "
+    "END"
+)
+
+
+class MemoryPins:
+    """
+    Закрепления клиентов за основной базой в памяти процесса
+    """
+
+    blocking = False
+
+    def __init__(self, max_pins: int = 100000):
+        self.max_pins = max_pins
+
+        self._pins: 'OrderedDict[str, float]' = OrderedDict()
+
+    def pin(self, client_key: str, window: float) -> None:
+        self._pins[client_key] = time.monotonic() + window
+        self._pins.move_to_end(client_key)
+
+        while len(self._pins) > self.max_pins:
+            self._pins.popitem(last=False)
+
+    def is_pinned(self, client_key: str) -> bool:
+        pinned_until = self._pins.get(client_key)
+
+        if pinned_until is None:
+            return False
+
+        if pinned_until < time.monotonic():
+            self._pins.pop(client_key, None)
+            return False
+
+        return True
+
+
+class SQLitePins:
+    """
+    Закрепления клиентов в файле SQLite, общем для воркеров одной машины.
+    Если файл занят дольше busy_timeout, клиент считается закрепленным:
+    лишнее чтение с основной базы лучше чтения с отстающей реплики.
+
+    Методы блокирующие (ожидание занятого файла до busy_timeout),
+    DatabaseRouter вызывает их в потоке
+    """
+
+    blocking = True
+
+    def __init__(self, path: str, sweep_interval: float = 60.0, busy_timeout: float = 0.05):
+        self.path = path
+        self.sweep_interval = sweep_interval
+        self.busy_timeout = busy_timeout
+
+        # Соединение одно на воркер, а вызовы приходят из разных потоков
+        self._lock = threading.Lock()
+        self._connection: Optional[sqlite3.Connection] = None
+        self._pid = None
+        self._last_sweep = time.time()
+
+    def _connect(self) -> sqlite3.Connection:
+        # Соединение не переживает fork: у каждого воркера свое
+        if self._connection is None or self._pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=self.busy_timeout, isolation_level=None, check_same_thread=False)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=OFF')
+            connection.execute('CREATE TABLE IF NOT EXISTS db_pins (key TEXT PRIMARY KEY, until REAL NOT NULL) WITHOUT ROWID')
+
+            self._connection, self._pid = connection, os.getpid()
+
+        return self._connection
+
+    def pin(self, client_key: str, window: float) -> None:
+        now = time.time()
+
+        try:
+            with self._lock:
+                connection = self._connect()
+
+                if now - self._last_sweep >= self.sweep_interval:
+                    self._last_sweep = now
+                    connection.execute('DELETE FROM db_pins WHERE until < ?', (now,))
+
+                connection.execute('INSERT OR REPLACE INTO db_pins (key, until) VALUES (?, ?)', (client_key, now + window))
+
+        except sqlite3.OperationalError:
+            pass
+
+    def is_pinned(self, client_key: str) -> bool:
+        try:
+            with self._lock:
+                row = self._connect().execute('SELECT until FROM db_pins WHERE key = ?', (client_key,)).fetchone()
+        except sqlite3.OperationalError:
+            return True
+
+        return row is not None and row[0] >= time.time()
+
+
+class DatabaseRouter:
+    """
+    Маршрутизация сессий между основной базой и репликами.
+
+    Запросы на чтение уходят на реплики по кругу, запись — на основную
+    базу. После записи клиент на DB_READ_YOUR_WRITES_WINDOW секунд
+    закрепляется за основной базой, чтобы видеть свои изменения.
+    Реплики с отставанием больше DB_REPLICA_MAX_LAG не используются.
+
+    Закрепления хранятся в памяти воркера или, если задан DB_PIN_BACKEND,
+    в файле SQLite, общем для воркеров: иначе чтение, попавшее в другой
+    воркер, ушло бы на реплику сразу после записи.
+    """
+
+    def __init__(self, primary_url: str, replica_urls: Sequence[str] = (), config=None):
+        self.config = config or get_config()
+
+        self.primary = create_engine(primary_url, self.config)
+        self.primary_session_maker = create_session_maker(self.primary)
+
+        self.replicas = [create_engine(url, self.config) for url in replica_urls]
+        self.replica_session_makers = [create_session_maker(engine) for engine in self.replicas]
+        self.replica_lag: List[Optional[float]] = [0.0] * len(self.replicas)
+
+        self.pins = SQLitePins(self.config.DB_PIN_BACKEND) if self.config.DB_PIN_BACKEND else MemoryPins()
+        self._round_robin = itertools.count()
+        self._monitor_task: Optional[asyncio.Task] = None
+
+    @classmethod
+    def from_env_urls(cls, primary_url: str, replica_urls: Optional[str], config=None) -> 'DatabaseRouter':
+        """
+        Создать маршрутизатор по URL основной базы и списку реплик через запятую
+        """
+        return cls(primary_url, [url.strip() for url in (replica_urls or '').split(',') if url.strip()], config)
+
+    async def _call_pins(self, method, *args):
+        # SQLitePins ждет занятый файл до busy_timeout: не на event loop
+        if self.pins.blocking:
+            return await asyncio.to_thread(method, *args)
+
+        return method(*args)
+
+    async def pin(self, client_key: str) -> None:
+        """
+        Закрепить клиента за основной базой после записи
+        """
+        await self._call_pins(self.pins.pin, client_key, self.config.DB_READ_YOUR_WRITES_WINDOW)
+
+    async def is_pinned(self, client_key: str) -> bool:
+        return await self._call_pins(self.pins.is_pinned, client_key)
+
+    def _healthy_replicas(self) -> List[int]:
+        return [
+            index for index, lag in enumerate(self.replica_lag)
+            if lag is not None and lag <= self.config.DB_REPLICA_MAX_LAG
+        ]
+
+    async def session_maker_for(self, read_only: bool, client_key: Optional[str] = None) -> sessionmaker:
+        """
+        Выбрать фабрику сессий для запроса
+
+            async with (await db_router.session_maker_for(read_only, client_key))() as session:
+                ...
+
+        Args:
+            read_only: обработчик только читает данные
+            client_key: идентификатор клиента для read-your-writes
+
+        Returns:
+            sessionmaker: фабрика сессий основной базы или реплики
+        """
+        if not read_only or not self.replicas or (client_key and await self.is_pinned(client_key)):
+            return self.primary_session_maker
+
+        healthy = self._healthy_replicas()
+
+        if not healthy:
+            return self.primary_session_maker
+
+        return self.replica_session_makers[healthy[next(self._round_robin) % len(healthy)]]
+
+    async def check_replicas(self) -> None:
+        """
+        Обновить отставание реплик; недоступная реплика получает None
+        """
+        for index, engine in enumerate(self.replicas):
+            try:
+                async with engine.connect() as conn:
+                    self.replica_lag[index] = float((await conn.execute(REPLICA_LAG_QUERY)).scalar() or 0)
+            except Exception:
+                self.replica_lag[index] = None
+
+    async def _monitor(self) -> None:
+        while True:
+            await self.check_replicas()
+            await asyncio.sleep(self.config.DB_REPLICA_CHECK_INTERVAL)
+
+    def start(self) -> None:
+        if self.replicas and self._monitor_task is None:
+            self._monitor_task = asyncio.create_task(self._monitor())
+
+    async def stop(self) -> None:
+        if self._monitor_task is not None:
+            self._monitor_task.cancel()
+
+            try:
+                await self._monitor_task
+            except asyncio.CancelledError:
+                pass
+
+            self._monitor_task = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'primary': get_pool_stats(self.primary),
+            'replicas': [
+                {**get_pool_stats(engine), 'lag_seconds': lag}
+                for engine, lag in zip(self.replicas, self.replica_lag)
+            ],
+        }
+
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Ограничение размера дисковых кэшей (изображения front-end, статические
+карты maps).
+
+DiskCacheLimit считает байты, записанные в каталог кэша, и когда сумма
+превышает max_bytes, удаляет самые давно использованные файлы (по mtime;
+touch() обновляет его при попадании в кэш), пока размер не опустится до
+low_watermark * max_bytes. Каталог общий для воркеров, а счетчик у
+каждого свой, поэтому не реже чем раз в rescan_interval секунд размер
+пересчитывается по диску.
+
+    limit = DiskCacheLimit('app/images_cache', max_bytes=1024 ** 3)
+
+    await limit.added(len(data))
+"""
+
+import asyncio
+import os
+import time
+
+from typing import List, Optional, Tuple
+
+
+class DiskCacheLimit:
+    """
+    Ограничение размера каталога кэша с вытеснением давно использованных файлов
+    """
+
+    def __init__(self, directory: str, max_bytes: int, low_watermark: float = 0.9, rescan_interval: float = 60.0):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.low_watermark = low_watermark
+        self.rescan_interval = rescan_interval
+
+        self.evicted = 0
+
+        self._size: Optional[int] = None
+        self._scanned_at = 0.0
+        self._trimming = False
+
+    def _scan(self) -> List[Tuple[float, int, str]]:
+        files = []
+
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                # Временные файлы еще пишутся и будут переименованы
+                if name.endswith('.tmp'):
+                    continue
+
+                path = os.path.join(root, name)
+
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+
+                files.append((stat.st_mtime, stat.st_size, path))
+
+        return files
+
+    def trim(self) -> int:
+        """
+        Пересчитать размер по диску и при превышении max_bytes удалить
+        самые старые файлы. Блокирующая, выполняется в потоке
+
+        Returns:
+            int: освобождено байт
+        """
+        files = self._scan()
+        size = sum(file_size for _, file_size, _ in files)
+        freed = 0
+
+        if size > self.max_bytes:
+            target = self.max_bytes * self.low_watermark
+
+            for _, file_size, path in sorted(files):
+                if size - freed <= target:
+                    break
+
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+
+                freed += file_size
+                self.evicted += 1
+
+        self._size = size - freed
+        self._scanned_at = time.monotonic()
+
+        return freed
+
+    async def added(self, nbytes: int) -> None:
+        """
+        Учесть записанный в кэш файл и при необходимости освободить место
+        """
+        if self._size is not None:
+            self._size += nbytes
+
+        stale = self._size is None or time.monotonic() - self._scanned_at >= self.rescan_interval
+
+        if (stale or self._size > self.max_bytes) and not self._trimming:
+            self._trimming = True
+
+            try:
+                await asyncio.to_thread(self.trim)
+            finally:
+                self._trimming = False
+
+    @staticmethod
+    def touch(path: str) -> None:
+        """
+        Отметить использование файла, чтобы он вытеснялся позже
+        """
+        try:
+            os.utime(path)
+        except OSError:
+            pass
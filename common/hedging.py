@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Хеджирование идемпотентных GET-запросов к другим сервисам.
+
+Если ответ не пришел за HEDGE_PERCENTILE-перцентиль задержки маршрута,
+отправляется второй такой же запрос; используется первый успешный
+ответ, второй запрос отменяется. Перцентиль оценивается по скользящему
+окну последних задержек отдельно для каждого маршрута.
+
+Хеджирование включается флагом HEDGE_ENABLED и только для запросов,
+помеченных маршрутом в расширении httpx hedge_route:
+
+    await client.get(url, extensions={'hedge_route': 'events.detail'})
+
+Число дополнительных запросов ограничено общим на процесс бюджетом:
+каждый запрос добавляет HEDGE_BUDGET_RATIO токена, хедж тратит один,
+так что нагрузка на бэкенды вырастает не больше чем на эту долю.
+"""
+
+import asyncio
+import httpx
+import time
+
+from collections import deque
+from prometheus_client import Counter
+from typing import Awaitable, Callable, Deque, Dict, List, Optional
+
+from app.common.resilience import RetryBudget, remaining_time
+from app.config import get_config
+
+
+UPSTREAM_HEDGES_TOTAL = Counter(
+    'upstream_hedges_total',
+    'Хеджированные запросы к другим сервисам: won — первым ответил хедж, lost — основной запрос, no_budget — хедж не отправлен',
+    ('service', 'route', 'outcome'),
+)
+
+
+class LatencyTracker:
+    """
+    Скользящее окно задержек маршрута или провайдера для оценки перцентилей.
+    Перцентили пересчитываются не чаще чем раз в refresh новых замеров
+    """
+
+    def __init__(self, window: int = 200, min_samples: int = 20, refresh: int = 20):
+        self.samples: Deque[float] = deque(maxlen=window)
+        self.min_samples = min_samples
+        self.refresh = refresh
+
+        self._percentiles: Dict[float, float] = {}
+        self._since_refresh = 0
+
+    def record(self, latency: float) -> None:
+        self.samples.append(latency)
+        self._since_refresh += 1
+
+        if self._since_refresh >= self.refresh:
+            self._percentiles.clear()
+            self._since_refresh = 0
+
+    def percentile(self, q: float) -> Optional[float]:
+        if len(self.samples) < self.min_samples:
+            return None
+
+        value = self._percentiles.get(q)
+
+        if value is None:
+            ordered = sorted(self.samples)
+            value = self._percentiles[q] = ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+        return value
+
+
+def _succeeded(task: asyncio.Task) -> bool:
+    return task.exception() is None and task.result().status_code < 500
+
+
+class Hedger:
+    """
+    Хеджирование запросов одного сервиса с задержкой по перцентилю маршрута
+    и общим бюджетом дополнительных запросов
+    """
+
+    def __init__(self, service: str, config=None):
+        self.config = config or get_config()
+
+        self.service = service
+        self.trackers: Dict[str, LatencyTracker] = {}
+        self.budget = RetryBudget(self.config.HEDGE_BUDGET_RATIO, 0.0, capacity=self.config.HEDGE_BUDGET_BURST)
+
+    def tracker(self, route: str) -> LatencyTracker:
+        tracker = self.trackers.get(route)
+
+        if tracker is None:
+            tracker = self.trackers[route] = LatencyTracker()
+
+        return tracker
+
+    def delay(self, route: str) -> Optional[float]:
+        """
+        Через сколько секунд отправлять хедж или None, если задержки маршрута еще неизвестны
+        """
+        value = self.tracker(route).percentile(self.config.HEDGE_PERCENTILE)
+
+        return None if value is None else max(value, self.config.HEDGE_MIN_DELAY)
+
+    async def send(
+        self,
+        route: str,
+        attempt: Callable[[], Awaitable[httpx.Response]],
+        hedge: Optional[Callable[[], Awaitable[httpx.Response]]] = None
+    ) -> httpx.Response:
+        """
+        Выполнить attempt, при необходимости продублировав его хеджем.
+        hedge выполняет дополнительный запрос (по умолчанию attempt);
+        попытки выполняются одновременно, поэтому им нужны разные
+        объекты запроса.
+
+        Returns:
+            httpx.Response: первый ответ без ошибки 5xx или, если таких нет,
+            ответ последней завершившейся попытки
+        """
+        if not self.config.HEDGE_ENABLED:
+            return await attempt()
+
+        tracker = self.tracker(route)
+        delay = self.delay(route)
+
+        self.budget.deposit()
+
+        async def timed(primary: bool) -> httpx.Response:
+            started = time.monotonic()
+            cancelled = False
+
+            try:
+                return await (attempt() if primary else (hedge or attempt)())
+
+            except asyncio.CancelledError:
+                cancelled = True
+                raise
+
+            finally:
+                # Отмененный основной запрос учитывается временем до отмены,
+                # иначе медленные ответы выпадали бы из окна и занижали задержку хеджа
+                if primary or not cancelled:
+                    tracker.record(time.monotonic() - started)
+
+        tasks = [asyncio.create_task(timed(primary=True))]
+
+        try:
+            remaining = remaining_time()
+
+            if delay is None or (remaining is not None and remaining <= delay):
+                return await tasks[0]
+
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+
+            if not done:
+                if self.budget.try_withdraw():
+                    tasks.append(asyncio.create_task(timed(primary=False)))
+                else:
+                    UPSTREAM_HEDGES_TOTAL.labels(self.service, route, 'no_budget').inc()
+
+            return await self._first_success(route, tasks)
+
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    async def _first_success(self, route: str, tasks: List[asyncio.Task]) -> httpx.Response:
+        pending = set(tasks)
+        finished: List[asyncio.Task] = []
+        winner = None
+
+        while winner is None:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            finished.extend(task for task in tasks if task in done)
+
+            winner = next((task for task in finished if _succeeded(task)), None)
+
+            if winner is None and not pending:
+                winner = finished[-1]
+
+        for task in finished:
+            if task is not winner and task.exception() is None:
+                await task.result().aclose()
+
+        if len(tasks) > 1:
+            UPSTREAM_HEDGES_TOTAL.labels(self.service, route, 'won' if winner is tasks[1] else 'lost').inc()
+
+        return winner.result()
@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Условные GET-запросы (ETag / If-None-Match).
+
+На стороне сервиса make_etag() строит валидатор из дешевой версии данных
+(номер последнего изменения, версия строки) до того, как тело ответа
+выбрано из базы и сериализовано. Если валидатор совпадает с
+If-None-Match, обработчик сразу отвечает not_modified().
+
+На стороне клиента ValidatorCache хранит последние ответы с ETag и
+перепроверяет их у сервиса: на 304 возвращается сохраненная копия,
+а сервис не выбирает и не сериализует тело повторно.
+"""
+
+import httpx
+
+from collections import OrderedDict
+from fastapi.responses import Response
+from typing import Any, Dict, Optional
+
+from app.config import get_config
+
+
+VALIDATOR_HEADERS = ('etag', 'cache-control', 'last-modified')
+
+# Заголовки, которые сохраняются вместе с телом: content-length и
+# content-encoding не подходят, потому что httpx хранит тело уже распакованным
+CACHED_HEADERS = ('content-type',) + VALIDATOR_HEADERS
+
+
+def make_etag(*parts: Any) -> str:
+    """
+    Сильный валидатор из частей версии, например make_etag('event', 5, 120) -> "event-5-120"
+    """
+    return '"' + '-'.join(str(part) for part in parts) + '"'
+
+
+def _opaque_tag(tag: str) -> str:
+    tag = tag.strip()
+
+    return tag[2:] if tag.startswith('W/') else tag
+
+
+def etag_matches(if_none_match: Optional[str], etag: Optional[str]) -> bool:
+    """
+    Совпадает ли ETag с одним из значений If-None-Match (слабое сравнение, RFC 9110)
+    """
+    if not if_none_match or not etag:
+        return False
+
+    if if_none_match.strip() == '*':
+        return True
+
+    etag = _opaque_tag(etag)
+
+    return any(_opaque_tag(candidate) == etag for candidate in if_none_match.split(','))
+
+
+def validator_headers(etag: str, cache_control: str = 'no-cache') -> Dict[str, str]:
+    """
+    Заголовки ответа с валидатором. no-cache разрешает хранить копию,
+    но требует перепроверять ее перед каждым использованием
+    """
+    return {'ETag': etag, 'Cache-Control': cache_control}
+
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers=validator_headers(etag))
+
+
+class ValidatorCache:
+    """
+    LRU-кэш ответов GET с ETag для повторной проверки у сервиса.
+
+    Размер ограничен количеством записей и суммарным объемом тел.
+    Ответы без ETag и с кодом, отличным от 200, не сохраняются.
+    """
+
+    def __init__(self, max_entries: Optional[int] = None, max_bytes: Optional[int] = None, config=None):
+        config = config or get_config()
+
+        self.max_entries = max_entries or config.VALIDATOR_CACHE_MAX_ENTRIES
+        self.max_bytes = max_bytes or config.VALIDATOR_CACHE_MAX_BYTES
+
+        self.revalidated = 0
+        self.fetched = 0
+
+        self._entries: 'OrderedDict[str, httpx.Response]' = OrderedDict()
+        self._size = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    async def get(
+        self,
+        client: httpx.AsyncClient,
+        url: str,
+        params: Optional[Dict[str, Any]] = None,
+        headers: Optional[Dict[str, str]] = None,
+        extensions: Optional[Dict[str, Any]] = None
+    ) -> httpx.Response:
+        """
+        GET с If-None-Match из сохраненной копии
+
+        Returns:
+            httpx.Response: ответ сервиса или, если сервис ответил 304,
+            сохраненная копия с кодом 200
+        """
+        key = str(httpx.URL(url, params=params))
+        cached = self._entries.get(key)
+
+        request_headers = dict(headers or {})
+
+        if cached is not None:
+            request_headers['If-None-Match'] = cached.headers['etag']
+
+        response = await client.get(key, headers=request_headers, extensions=extensions)
+
+        if response.status_code == 304 and cached is not None:
+            self._entries.move_to_end(key)
+            self.revalidated += 1
+
+            return httpx.Response(200, headers=cached.headers, content=cached.content, request=response.request)
+
+        self.fetched += 1
+
+        if response.status_code == 200 and 'etag' in response.headers:
+            self._store(key, response)
+        elif cached is not None:
+            self._discard(key)
+
+        return response
+
+    def _store(self, key: str, response: httpx.Response) -> None:
+        if len(response.content) > self.max_bytes:
+            self._discard(key)
+            return
+
+        self._discard(key)
+
+        self._entries[key] = httpx.Response(
+            200,
+            headers={name: value for name, value in response.headers.items() if name in CACHED_HEADERS},
+            content=response.content
+        )
+        self._size += len(response.content)
+
+        while len(self._entries) > self.max_entries or self._size > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._size -= len(evicted.content)
+
+    def _discard(self, key: str) -> None:
+        evicted = self._entries.pop(key, None)
+
+        if evicted is not None:
+            self._size -= len(evicted.content)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'entries': len(self._entries),
+            'bytes': self._size,
+            'revalidated': self.revalidated,
+            'fetched': self.fetched,
+        }
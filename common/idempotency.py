@@ -0,0 +1,445 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Ключи идемпотентности для POST-запросов (заголовок Idempotency-Key).
+
+IdempotencyMiddleware запоминает ответ на POST с Idempotency-Key и на
+повтор с тем же ключом и путем от того же клиента (адрес из
+app.common.client_address) отдает сохраненный ответ с заголовком
+Idempotent-Replayed: true, не вызывая обработчик. Повтор, пришедший,
+пока первый запрос еще выполняется, ждет его результата.
+
+Ответы 5xx не сохраняются: повтор после ошибки выполняется заново.
+Повтор с тем же ключом, но другим телом запроса получает 422.
+
+Ключи хранятся не дольше IDEMPOTENCY_TTL секунд и не больше
+IDEMPOTENCY_MAX_ENTRIES штук. По умолчанию они живут в памяти воркера, и
+повтор, попавший в другой воркер, выполняется заново. IDEMPOTENCY_BACKEND —
+путь к файлу SQLite (например, в /dev/shm), общему для воркеров одной
+машины: ключ занимается в нем атомарно, а повтор из другого воркера
+опрашивает файл, пока первый запрос не сохранит ответ. Обращения к файлу
+блокирующие и выполняются в потоке.
+
+Ключ запроса, который еще выполняется, не вытесняется ни по сроку, ни по
+числу ключей; в файле SQLite он освобождается через
+IDEMPOTENCY_PENDING_TIMEOUT секунд, если воркер, занявший ключ, завершился
+аварийно. Между машинами ключи не разделяются, поэтому защиту от дублей на
+уровне данных (уникальные ограничения) они не заменяют, а
+ResilientTransport не повторяет POST-запросы даже с ключом.
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+from collections import OrderedDict
+from starlette.datastructures import Headers
+from typing import Dict, List, Optional, Tuple, Union
+
+from app.common.client_address import scope_client_address
+from app.config import get_config
+
+
+IDEMPOTENCY_HEADER = 'idempotency-key'
+
+MAX_KEY_LENGTH = 255
+
+
+class _Entry:
+
+    __slots__ = ('fingerprint', 'expires', 'status', 'headers', 'body', 'ready', 'owner')
+
+    def __init__(self, fingerprint: bytes, expires: float, ready: Optional[asyncio.Future] = None, owner: Optional[str] = None):
+        self.fingerprint = fingerprint
+        self.expires = expires
+
+        # 0 — запрос еще выполняется
+        self.status = 0
+        self.headers: List[Tuple[bytes, bytes]] = []
+        self.body = b''
+
+        # Пока запрос выполняется, повторы в том же воркере ждут этого future
+        self.ready = ready
+        # Метка запроса, занявшего ключ в общем файле
+        self.owner = owner
+
+    @property
+    def pending(self) -> bool:
+        return self.status == 0
+
+
+def _storable(status: Optional[int], body: Optional[bytes]) -> bool:
+    # 5xx, незавершенный или слишком большой ответ не повторяется
+    return status is not None and status < 500 and body is not None
+
+
+class IdempotencyStore:
+    """
+    Ответы по ключам идемпотентности в памяти воркера
+    с ограничением по времени жизни и числу ключей
+    """
+
+    def __init__(self, ttl: float, max_entries: int):
+        self.ttl = ttl
+        self.max_entries = max_entries
+
+        self.replayed = 0
+
+        # Порядок вставки совпадает с порядком истечения срока
+        self._entries: 'OrderedDict[str, _Entry]' = OrderedDict()
+
+    def _purge(self, now: float) -> None:
+        excess = len(self._entries) - self.max_entries
+        stale = []
+
+        for key, entry in self._entries.items():
+            # Выполняющийся запрос не вытесняется: иначе повтор с тем же
+            # ключом не нашел бы его и выполнил обработчик второй раз.
+            # Таких ключей не больше, чем одновременных запросов
+            if entry.pending:
+                continue
+
+            if entry.expires > now and excess <= 0:
+                break
+
+            stale.append(key)
+            excess -= 1
+
+        for key in stale:
+            del self._entries[key]
+
+    async def claim(self, key: str, fingerprint: bytes) -> Tuple[_Entry, bool]:
+        """
+        Занять ключ или получить запись запроса, занявшего его раньше
+
+        Returns:
+            Tuple[_Entry, bool]: запись и True, если ключ занят этим запросом
+        """
+        now = time.monotonic()
+
+        self._purge(now)
+
+        entry = self._entries.get(key)
+
+        if entry is not None:
+            return entry, False
+
+        entry = self._entries[key] = _Entry(fingerprint, now + self.ttl, ready=asyncio.get_running_loop().create_future())
+
+        self._purge(now)
+
+        return entry, True
+
+    async def wait(self, key: str, entry: _Entry) -> None:
+        """
+        Дождаться завершения запроса, занявшего ключ
+        """
+        # Отмена ожидающего повтора не должна отменять future первого запроса
+        await asyncio.shield(entry.ready)
+
+    async def finish(self, key: str, entry: _Entry, status: Optional[int], headers: List[Tuple[bytes, bytes]], body: Optional[bytes]) -> None:
+        """
+        Сохранить ответ или, если его нельзя повторить (5xx, ответ не
+        завершен или слишком велик), забыть ключ. Ждущие повторы просыпаются
+        """
+        if _storable(status, body):
+            entry.status, entry.headers, entry.body = status, headers, body
+        elif self._entries.get(key) is entry:
+            del self._entries[key]
+
+        if not entry.ready.done():
+            entry.ready.set_result(None)
+
+    def stats(self) -> Dict[str, int]:
+        return {'entries': len(self._entries), 'replayed': self.replayed}
+
+
+class SQLiteIdempotencyStore:
+    """
+    Ответы по ключам идемпотентности в файле SQLite, общем для воркеров
+    одной машины. Если файл занят дольше busy_timeout, запрос выполняется
+    без ключа, как с отключенными ключами
+    """
+
+    def __init__(
+            self,
+            path: str,
+            ttl: float,
+            max_entries: int,
+            pending_timeout: float = 60.0,
+            poll_interval: float = 0.05,
+            sweep_interval: float = 60.0,
+            busy_timeout: float = 0.05
+        ):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.pending_timeout = pending_timeout
+        self.poll_interval = poll_interval
+        self.sweep_interval = sweep_interval
+        self.busy_timeout = busy_timeout
+
+        self.replayed = 0
+
+        # Соединение одно на воркер, а вызовы приходят из разных потоков
+        self._lock = threading.Lock()
+        self._connection: Optional[sqlite3.Connection] = None
+        self._pid = None
+        self._last_sweep = time.time()
+
+    def _connect(self) -> sqlite3.Connection:
+        # Соединение не переживает fork: у каждого воркера свое
+        if self._connection is None or self._pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=self.busy_timeout, isolation_level=None, check_same_thread=False)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=OFF')
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS idempotency ('
+                'key TEXT PRIMARY KEY, fingerprint BLOB NOT NULL, owner TEXT NOT NULL, expires REAL NOT NULL, '
+                'status INTEGER NOT NULL, headers TEXT, body BLOB)'
+            )
+
+            self._connection, self._pid = connection, os.getpid()
+
+        return self._connection
+
+    def _sweep(self, connection: sqlite3.Connection, now: float) -> None:
+        self._last_sweep = now
+
+        connection.execute('DELETE FROM idempotency WHERE expires < ?', (now,))
+        # Лишние ключи вытесняются по сроку, выполняющиеся не трогаются
+        connection.execute(
+            'DELETE FROM idempotency WHERE key IN ('
+            'SELECT key FROM idempotency WHERE status > 0 ORDER BY expires '
+            'LIMIT max(0, (SELECT count(*) FROM idempotency) - ?))',
+            (self.max_entries,)
+        )
+
+    def _claim(self, key: str, fingerprint: bytes) -> Tuple[_Entry, bool]:
+        now = time.time()
+
+        try:
+            with self._lock:
+                connection = self._connect()
+                connection.execute('BEGIN IMMEDIATE')
+
+                try:
+                    if now - self._last_sweep >= self.sweep_interval:
+                        self._sweep(connection, now)
+
+                    row = connection.execute(
+                        'SELECT fingerprint, expires, status, headers, body FROM idempotency WHERE key = ?', (key,)
+                    ).fetchone()
+
+                    # Просроченный ключ, в том числе брошенный упавшим воркером, занимается заново
+                    if row is not None and row[1] >= now:
+                        entry = _Entry(row[0], row[1])
+                        entry.status, entry.body = row[2], row[4] or b''
+                        entry.headers = [(name.encode('latin-1'), value.encode('latin-1')) for name, value in json.loads(row[3] or '[]')]
+
+                        return entry, False
+
+                    entry = _Entry(fingerprint, now + self.pending_timeout, owner=uuid.uuid4().hex)
+
+                    connection.execute(
+                        'INSERT OR REPLACE INTO idempotency (key, fingerprint, owner, expires, status) VALUES (?, ?, ?, ?, 0)',
+                        (key, fingerprint, entry.owner, entry.expires)
+                    )
+
+                    return entry, True
+                finally:
+                    connection.execute('COMMIT')
+
+        except sqlite3.OperationalError:
+            return _Entry(fingerprint, now), True
+
+    def _finish(self, key: str, entry: _Entry, status: Optional[int], headers: List[Tuple[bytes, bytes]], body: Optional[bytes]) -> None:
+        if entry.owner is None:
+            return
+
+        try:
+            with self._lock:
+                connection = self._connect()
+
+                # owner в условии: ключ, занятый заново после pending_timeout, не перезаписывается
+                if _storable(status, body):
+                    connection.execute(
+                        'UPDATE idempotency SET status = ?, headers = ?, body = ?, expires = ? WHERE key = ? AND owner = ?',
+                        (
+                            status,
+                            json.dumps([(name.decode('latin-1'), value.decode('latin-1')) for name, value in headers]),
+                            body,
+                            time.time() + self.ttl,
+                            key,
+                            entry.owner,
+                        )
+                    )
+                else:
+                    connection.execute('DELETE FROM idempotency WHERE key = ? AND owner = ?', (key, entry.owner))
+
+        except sqlite3.OperationalError:
+            pass
+
+    async def claim(self, key: str, fingerprint: bytes) -> Tuple[_Entry, bool]:
+        return await asyncio.to_thread(self._claim, key, fingerprint)
+
+    async def wait(self, key: str, entry: _Entry) -> None:
+        # Первый запрос может выполняться в другом воркере: файл опрашивается
+        await asyncio.sleep(self.poll_interval)
+
+    async def finish(self, key: str, entry: _Entry, status: Optional[int], headers: List[Tuple[bytes, bytes]], body: Optional[bytes]) -> None:
+        await asyncio.to_thread(self._finish, key, entry, status, headers, body)
+
+    def stats(self) -> Dict[str, int]:
+        return {'replayed': self.replayed}
+
+
+async def _read_body(receive) -> bytes:
+    chunks = []
+
+    while True:
+        message = await receive()
+        chunks.append(message.get('body', b''))
+
+        if not message.get('more_body', False):
+            return b''.join(chunks)
+
+
+async def _send_json(send, status: int, body: bytes) -> None:
+    await send({'type': 'http.response.start', 'status': status, 'headers': [(b'content-type', b'application/json')]})
+    await send({'type': 'http.response.body', 'body': body})
+
+
+class IdempotencyMiddleware:
+    """
+    ASGI-middleware повтора ответов на POST-запросы с Idempotency-Key
+    """
+
+    def __init__(self, app, store: Optional[Union[IdempotencyStore, SQLiteIdempotencyStore]] = None, config=None):
+        config = config or get_config()
+
+        self.app = app
+        self.store = store or create_idempotency_store(config)
+        self.max_body = config.IDEMPOTENCY_MAX_BODY
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or scope['method'] != 'POST':
+            await self.app(scope, receive, send)
+            return
+
+        idempotency_key = Headers(scope=scope).get(IDEMPOTENCY_HEADER)
+
+        if idempotency_key is None:
+            await self.app(scope, receive, send)
+            return
+
+        if not idempotency_key or len(idempotency_key) > MAX_KEY_LENGTH:
+            await _send_json(send, 400, b'{"detail":"Invalid Idempotency-Key"}')
+            return
+
+        body = await _read_body(receive)
+        fingerprint = hashlib.sha256(body).digest()
+        # Ключ выбирает клиент, поэтому ключи разных клиентов не должны совпадать
+        key = f"{scope_client_address(scope)} {scope['path']} {idempotency_key}"
+
+        while True:
+            entry, claimed = await self.store.claim(key, fingerprint)
+
+            if claimed:
+                break
+
+            if entry.fingerprint != fingerprint:
+                await _send_json(send, 422, b'{"detail":"Idempotency-Key reused with a different request"}')
+                return
+
+            if not entry.pending:
+                self.store.replayed += 1
+
+                await send({
+                    'type': 'http.response.start',
+                    'status': entry.status,
+                    'headers': entry.headers + [(b'idempotent-replayed', b'true')],
+                })
+                await send({'type': 'http.response.body', 'body': entry.body})
+                return
+
+            await self.store.wait(key, entry)
+
+        await self._run(scope, receive, send, key, body, entry)
+
+    async def _run(self, scope, receive, send, key: str, body: bytes, entry: _Entry) -> None:
+        body_sent = False
+
+        async def receive_wrapper():
+            nonlocal body_sent
+
+            if not body_sent:
+                body_sent = True
+                return {'type': 'http.request', 'body': body, 'more_body': False}
+
+            return await receive()
+
+        status = None
+        headers: List[Tuple[bytes, bytes]] = []
+        chunks: Optional[List[bytes]] = []
+        size = 0
+        complete = False
+
+        async def send_wrapper(message):
+            nonlocal status, headers, chunks, size, complete
+
+            if message['type'] == 'http.response.start':
+                status, headers = message['status'], list(message.get('headers', []))
+
+            elif message['type'] == 'http.response.body' and chunks is not None:
+                chunk = message.get('body', b'')
+                size += len(chunk)
+
+                if size > self.max_body:
+                    chunks = None
+                else:
+                    chunks.append(chunk)
+
+                complete = not message.get('more_body', False)
+
+            await send(message)
+
+        try:
+            await self.app(scope, receive_wrapper, send_wrapper)
+        finally:
+            stored = b''.join(chunks) if chunks is not None and complete else None
+            await self.store.finish(key, entry, status, headers, stored)
+
+
+def create_idempotency_store(config=None) -> Union[IdempotencyStore, SQLiteIdempotencyStore]:
+    """
+    Создать хранилище ключей: общий файл SQLite, если задан
+    IDEMPOTENCY_BACKEND, иначе память воркера
+    """
+    config = config or get_config()
+
+    if config.IDEMPOTENCY_BACKEND:
+        return SQLiteIdempotencyStore(
+            config.IDEMPOTENCY_BACKEND,
+            config.IDEMPOTENCY_TTL,
+            config.IDEMPOTENCY_MAX_ENTRIES,
+            pending_timeout=config.IDEMPOTENCY_PENDING_TIMEOUT
+        )
+
+    return IdempotencyStore(config.IDEMPOTENCY_TTL, config.IDEMPOTENCY_MAX_ENTRIES)
+
+
+def setup_idempotency(app, config=None) -> None:
+    """
+    Подключить ключи идемпотентности POST-запросов к приложению FastAPI
+    """
+    config = config or get_config()
+
+    if config.IDEMPOTENCY_ENABLED:
+        app.add_middleware(IdempotencyMiddleware)
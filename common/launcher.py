@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Запуск сервиса в зависимости от конфигурации.
+
+В разработке — один процесс uvicorn с перезагрузкой при изменении файлов.
+В продакшене — gunicorn с воркерами uvicorn (uvloop + httptools),
+предзагрузкой приложения до fork, перезапуском воркеров после
+MAX_REQUESTS запросов и ожиданием незавершенных запросов при остановке.
+Метрики воркеров собираются в общий каталог PROMETHEUS_MULTIPROC_DIR.
+
+Использование:
+    python -m app.common.launcher app.main:app --port ${EVENTS_SERVICE_PORT}
+"""
+
+import argparse
+import os
+import shutil
+import tempfile
+
+from uvicorn.workers import UvicornWorker
+
+from app.config import get_config
+
+
+class RyadomUvicornWorker(UvicornWorker):
+    CONFIG_KWARGS = {
+        'loop': 'uvloop',
+        'http': 'httptools',
+        'lifespan': 'on',
+        'timeout_graceful_shutdown': get_config().GRACEFUL_TIMEOUT,
+    }
+
+
+def get_workers_count(config) -> int:
+    """
+    Количество воркеров: WORKERS из конфигурации или число доступных CPU
+    """
+    if config.WORKERS:
+        return config.WORKERS
+
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+
+    return max(1, cpus * config.WORKERS_PER_CPU)
+
+
+def run_development(app_path: str, host: str, port: int, config) -> None:
+    import uvicorn
+
+    uvicorn.run(app_path, host=host, port=port, reload=config.RELOAD)
+
+
+def prepare_metrics_dir() -> None:
+    """
+    Подготовить каталог для метрик воркеров prometheus_client.
+    Должен вызываться до импорта приложения.
+    """
+    metrics_dir = os.environ.setdefault(
+        'PROMETHEUS_MULTIPROC_DIR',
+        os.path.join(tempfile.gettempdir(), 'ryadom-metrics')
+    )
+
+    shutil.rmtree(metrics_dir, ignore_errors=True)
+    os.makedirs(metrics_dir, exist_ok=True)
+
+
+def child_exit(server, worker) -> None:
+    from prometheus_client import multiprocess
+
+    multiprocess.mark_process_dead(worker.pid)
+
+
+def run_production(app_path: str, host: str, port: int, config) -> None:
+    from gunicorn.app.base import BaseApplication
+
+    prepare_metrics_dir()
+
+    options = {
+        'bind': f'{host}:{port}',
+        'workers': get_workers_count(config),
+        'worker_class': 'app.common.launcher.RyadomUvicornWorker',
+        'preload_app': config.PRELOAD_APP,
+        'max_requests': config.MAX_REQUESTS,
+        'max_requests_jitter': config.MAX_REQUESTS_JITTER,
+        'graceful_timeout': config.GRACEFUL_TIMEOUT,
+        'timeout': config.WORKER_TIMEOUT,
+        'keepalive': config.KEEPALIVE_TIMEOUT,
+        'accesslog': '-' if config.ACCESS_LOG else None,
+        'errorlog': '-',
+        'child_exit': child_exit,
+    }
+
+    class Application(BaseApplication):
+
+        def load_config(self):
+            for key, value in options.items():
+                if value is not None:
+                    self.cfg.set(key, value)
+
+        def load(self):
+            from gunicorn.util import import_app
+
+            return import_app(app_path)
+
+    Application().run()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Запуск сервиса Ryadom')
+    parser.add_argument('app', help='Путь к приложению, например app.main:app')
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, required=True)
+    args = parser.parse_args()
+
+    config = get_config()
+
+    if config.RELOAD:
+        run_development(args.app, args.host, args.port, config)
+    else:
+        run_production(args.app, args.host, args.port, config)
+
+
+if __name__ == '__main__':
+    main()
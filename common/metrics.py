@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Метрики Prometheus для сервисов Ryadom.
+
+setup_metrics(app, service) подключает ASGI-middleware, которое считает
+задержку, количество и статусы запросов по шаблону маршрута, а также
+эндпоинт /metrics. upstream_event_hooks() замеряет исходящие запросы
+httpx к другим сервисам.
+
+При запуске через gunicorn метрики воркеров собираются через каталог
+PROMETHEUS_MULTIPROC_DIR (см. app.common.launcher).
+"""
+
+import os
+import time
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    REGISTRY,
+    generate_latest,
+)
+from typing import Any, Callable, Dict, Iterable, List, Tuple
+
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+REQUEST_DURATION = Histogram(
+    'http_request_duration_seconds',
+    'Время обработки HTTP-запроса',
+    ('service', 'method', 'route'),
+    buckets=LATENCY_BUCKETS,
+)
+
+REQUESTS_TOTAL = Counter(
+    'http_requests_total',
+    'Количество HTTP-запросов',
+    ('service', 'method', 'route', 'status'),
+)
+
+REQUESTS_IN_PROGRESS = Gauge(
+    'http_requests_in_progress',
+    'Количество обрабатываемых HTTP-запросов',
+    ('service',),
+    multiprocess_mode='livesum',
+)
+
+UPSTREAM_DURATION = Histogram(
+    'upstream_request_duration_seconds',
+    'Время запроса к другому сервису до получения заголовков ответа',
+    ('service', 'backend', 'method'),
+    buckets=LATENCY_BUCKETS,
+)
+
+UPSTREAM_REQUESTS_TOTAL = Counter(
+    'upstream_requests_total',
+    'Количество запросов к другим сервисам',
+    ('service', 'backend', 'method', 'status'),
+)
+
+UNMATCHED_ROUTE = '__unmatched__'
+
+
+class MetricsMiddleware:
+    """
+    ASGI-middleware с метриками запросов.
+    Маршрут берется из шаблона FastAPI (/events/{event_id}), а не из пути,
+    чтобы количество рядов метрик не росло с числом id.
+    """
+
+    def __init__(self, app, service: str, skip_paths: Iterable[str] = ('/metrics',)):
+        self.app = app
+        self.service = service
+        self.skip_paths = set(skip_paths)
+
+        self._in_progress = REQUESTS_IN_PROGRESS.labels(service)
+        self._children: Dict[Tuple[str, str], Tuple[Any, Any]] = {}
+
+    def _route_label(self, scope) -> str:
+        route = scope.get('route')
+
+        if route is not None:
+            return getattr(route, 'path', UNMATCHED_ROUTE)
+
+        root_path = scope.get('root_path')
+
+        return root_path or UNMATCHED_ROUTE
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or scope['path'] in self.skip_paths:
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+
+            if message['type'] == 'http.response.start':
+                status_code = message['status']
+
+            await send(message)
+
+        self._in_progress.inc()
+        started = time.perf_counter()
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            self._in_progress.dec()
+
+            method = scope['method']
+            route = self._route_label(scope)
+
+            key = (method, route)
+            children = self._children.get(key)
+
+            if children is None:
+                children = self._children[key] = (
+                    REQUEST_DURATION.labels(self.service, method, route),
+                    {},
+                )
+
+            duration, counters = children
+            duration.observe(elapsed)
+
+            counter = counters.get(status_code)
+
+            if counter is None:
+                counter = counters[status_code] = REQUESTS_TOTAL.labels(self.service, method, route, str(status_code))
+
+            counter.inc()
+
+
+def upstream_event_hooks(service: str) -> Dict[str, List[Callable]]:
+    """
+    Хуки httpx, замеряющие запросы к другим сервисам.
+    Бэкенд определяется по хосту URL (users, events, maps, ...).
+
+    Пример:
+        httpx.AsyncClient(event_hooks=upstream_event_hooks('edge_router'))
+    """
+
+    async def on_request(request):
+        request.extensions['metrics_started'] = time.perf_counter()
+
+    async def on_response(response):
+        request = response.request
+        started = request.extensions.get('metrics_started')
+
+        if started is None:
+            return
+
+        backend = request.url.host or 'unknown'
+
+        UPSTREAM_DURATION.labels(service, backend, request.method).observe(time.perf_counter() - started)
+        UPSTREAM_REQUESTS_TOTAL.labels(service, backend, request.method, str(response.status_code)).inc()
+
+    return {'request': [on_request], 'response': [on_response]}
+
+
+def record_upstream_error(service: str, backend: str, method: str) -> None:
+    UPSTREAM_REQUESTS_TOTAL.labels(service, backend, method, 'error').inc()
+
+
+def metrics_response_body() -> bytes:
+    if os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+        from prometheus_client import multiprocess
+
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+
+        return generate_latest(registry)
+
+    return generate_latest(REGISTRY)
+
+
+def setup_metrics(app, service: str) -> None:
+    """
+    Подключить метрики к приложению FastAPI
+
+    Args:
+        app: приложение FastAPI
+        service: имя сервиса для метки service
+    """
+    from fastapi.responses import Response
+
+    async def metrics():
+        return Response(content=metrics_response_body(), media_type=CONTENT_TYPE_LATEST)
+
+    app.add_api_route('/metrics', metrics, methods=['GET'], include_in_schema=False)
+    app.add_middleware(MetricsMiddleware, service=service)
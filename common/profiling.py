@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Профилирование отдельных запросов по требованию.
+
+Запрос профилируется семплирующим профайлером pyinstrument (с учетом
+await), если в нем есть подписанный заголовок X-Debug-Profile. Подпись —
+HMAC от срока действия на ключе PROFILING_SECRET; без ключа
+профилирование выключено и middleware не подключается. Параметром
+запроса подпись не принимается: URL попадает в журналы доступа.
+
+Профили сохраняются в каталог PROFILING_DIR, хранятся последние
+PROFILING_MAX_FILES. Список — GET /debug/profiles, профиль —
+GET /debug/profiles/{name}, оба с тем же подписанным значением.
+
+Получить значение заголовка на час:
+    python -m app.common.profiling sign --ttl 3600
+"""
+
+import argparse
+import asyncio
+import hashlib
+import hmac
+import os
+import re
+import time
+
+from typing import *
+
+from app.config import get_config
+
+
+PROFILE_HEADER = b'x-debug-profile'
+
+NAME_RE = re.compile(r'^[0-9]+-[A-Za-z0-9_.-]+\.html$')
+SLUG_RE = re.compile(r'[^A-Za-z0-9]+')
+
+
+def sign(secret: str, ttl: int = 3600) -> str:
+    """
+    Подписанное значение для X-Debug-Profile, действующее ttl секунд
+    """
+    expires = int(time.time()) + ttl
+    signature = hmac.new(secret.encode(), str(expires).encode(), hashlib.sha256).hexdigest()
+
+    return f'{expires}.{signature}'
+
+
+def verify(secret: str, token: Optional[str]) -> bool:
+    if not secret or not token or '.' not in token:
+        return False
+
+    expires, signature = token.split('.', 1)
+
+    if not expires.isdigit() or int(expires) < time.time():
+        return False
+
+    expected = hmac.new(secret.encode(), expires.encode(), hashlib.sha256).hexdigest()
+
+    return hmac.compare_digest(expected, signature)
+
+
+class ProfileStore:
+    """
+    Кольцевой буфер профилей на диске
+    """
+
+    def __init__(self, directory: str, max_files: int):
+        self.directory = directory
+        self.max_files = max_files
+
+    def _save(self, method: str, path: str, html: str) -> str:
+        os.makedirs(self.directory, exist_ok=True)
+
+        slug = SLUG_RE.sub('_', path).strip('_')[:80] or 'root'
+        name = f'{time.time_ns()}-{method}-{slug}.html'
+
+        with open(os.path.join(self.directory, name), 'w', encoding='utf-8') as file:
+            file.write(html)
+
+        for old_name in self.list()[self.max_files:]:
+            try:
+                os.remove(os.path.join(self.directory, old_name))
+            except FileNotFoundError:
+                pass
+
+        return name
+
+    async def save(self, method: str, path: str, render: Callable[[], str]) -> str:
+        """
+        Отрисовать профиль вызовом render и сохранить его в отдельном
+        потоке: построение HTML по большому профилю занимает заметное время
+        """
+        return await asyncio.to_thread(lambda: self._save(method, path, render()))
+
+    def list(self) -> List[str]:
+        """
+        Имена профилей, начиная с последнего
+        """
+        try:
+            names = [name for name in os.listdir(self.directory) if NAME_RE.match(name)]
+        except FileNotFoundError:
+            return []
+
+        return sorted(names, key=lambda name: int(name.split('-', 1)[0]), reverse=True)
+
+    def path(self, name: str) -> Optional[str]:
+        if not NAME_RE.match(name):
+            return None
+
+        path = os.path.join(self.directory, name)
+
+        return path if os.path.isfile(path) else None
+
+
+def get_token(scope) -> Optional[str]:
+    for key, value in scope['headers']:
+        if key == PROFILE_HEADER:
+            return value.decode('latin-1')
+
+    return None
+
+
+class ProfilingMiddleware:
+    """
+    ASGI-middleware, запускающее профайлер для подписанных запросов
+    """
+
+    def __init__(self, app, secret: str, store: ProfileStore, interval: float = 0.001):
+        self.app = app
+        self.secret = secret
+        self.store = store
+        self.interval = interval
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or scope['path'].startswith('/debug/profiles'):
+            await self.app(scope, receive, send)
+            return
+
+        token = get_token(scope)
+
+        if token is None or not verify(self.secret, token):
+            await self.app(scope, receive, send)
+            return
+
+        from pyinstrument import Profiler
+
+        profiler = Profiler(interval=self.interval, async_mode='enabled')
+        profiler.start()
+
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            profiler.stop()
+
+            try:
+                await self.store.save(scope['method'], scope['path'], profiler.output_html)
+            except OSError:
+                pass
+
+
+def setup_profiling(app, config=None) -> None:
+    """
+    Подключить профилирование по требованию, если задан PROFILING_SECRET
+    """
+    config = config or get_config()
+
+    if not config.PROFILING_SECRET:
+        return
+
+    from fastapi import HTTPException, Request
+    from fastapi.responses import FileResponse
+
+    secret = config.PROFILING_SECRET
+    store = ProfileStore(config.PROFILING_DIR, config.PROFILING_MAX_FILES)
+
+    def check_access(request: Request) -> None:
+        token = request.headers.get('x-debug-profile')
+
+        if not verify(secret, token):
+            raise HTTPException(status_code=404, detail='Not found')
+
+    async def list_profiles(request: Request):
+        check_access(request)
+
+        return {'profiles': store.list()}
+
+    async def get_profile(name: str, request: Request):
+        check_access(request)
+
+        path = store.path(name)
+
+        if path is None:
+            raise HTTPException(status_code=404, detail='Profile not found')
+
+        return FileResponse(path, media_type='text/html')
+
+    app.add_api_route('/debug/profiles', list_profiles, methods=['GET'], include_in_schema=False)
+    app.add_api_route('/debug/profiles/{name}', get_profile, methods=['GET'], include_in_schema=False)
+    app.add_middleware(
+        ProfilingMiddleware,
+        secret=secret,
+        store=store,
+        interval=config.PROFILING_INTERVAL
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Подписанное значение заголовка X-Debug-Profile')
+    parser.add_argument('command', choices=['sign'])
+    parser.add_argument('--ttl', type=int, default=3600, help='Срок действия в секундах')
+    args = parser.parse_args()
+
+    secret = get_config().PROFILING_SECRET
+
+    if not secret:
+        raise SystemExit('PROFILING_SECRET is not set')
+
+    print(sign(secret, args.ttl))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Учет SQL-запросов в рамках одного HTTP-запроса.
+
+instrument_queries(engine) считает количество и время запросов движка,
+пишет в журнал ryadom.sql медленные запросы (DB_SLOW_QUERY_MS) с формой
+параметров без значений. setup_query_stats(app) подключает middleware,
+которое сообщает о повторах одного и того же запроса больше
+DB_N_PLUS_ONE_THRESHOLD раз (N+1), а при DB_QUERY_HEADERS добавляет
+в ответ заголовки X-DB-Query-Count и X-DB-Time-Ms.
+"""
+
+import logging
+import re
+import time
+
+from collections import Counter
+from contextvars import ContextVar
+from typing import Any, List, Optional, Tuple
+
+from app.config import get_config
+
+
+logger = logging.getLogger('ryadom.sql')
+
+WHITESPACE_RE = re.compile(r'\s+')
+
+
+class NPlusOneError(AssertionError):
+    pass
+
+
+class QueryStats:
+    """
+    Статистика SQL-запросов одного HTTP-запроса
+    """
+
+    __slots__ = ('count', 'seconds', 'shapes')
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.shapes: Counter = Counter()
+
+    def record(self, statement: str, seconds: float) -> None:
+        self.count += 1
+        self.seconds += seconds
+        self.shapes[statement] += 1
+
+    def repeated(self, threshold: int) -> List[Tuple[str, int]]:
+        """
+        Запросы, выполненные больше threshold раз
+        """
+        return [(statement, count) for statement, count in self.shapes.most_common() if count > threshold]
+
+
+query_stats: ContextVar[Optional[QueryStats]] = ContextVar('query_stats', default=None)
+
+
+def statement_shape(statement: str) -> str:
+    return WHITESPACE_RE.sub(' ', statement).strip()
+
+
+def parameters_shape(parameters: Any) -> Any:
+    """
+    Форма параметров запроса: типы значений без самих значений
+    """
+    if isinstance(parameters, dict):
+        return {key: type(value).__name__ for key, value in parameters.items()}
+
+    if isinstance(parameters, (list, tuple)):
+        if parameters and isinstance(parameters[0], (dict, list, tuple)):
+            return [parameters_shape(parameters[0]), f'x{len(parameters)}']
+
+        return [type(value).__name__ for value in parameters]
+
+    return type(parameters).__name__
+
+
+def instrument_queries(engine, config=None) -> None:
+    """
+    Подключить учет запросов к движку SQLAlchemy
+    """
+    from sqlalchemy import event
+
+    config = config or get_config()
+    slow_seconds = config.DB_SLOW_QUERY_MS / 1000
+
+    sync_engine = engine.sync_engine
+
+    @event.listens_for(sync_engine, 'before_cursor_execute')
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        context._query_started = time.perf_counter()
+
+    @event.listens_for(sync_engine, 'after_cursor_execute')
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        started = getattr(context, '_query_started', None)
+
+        if started is None:
+            return
+
+        elapsed = time.perf_counter() - started
+        stats = query_stats.get()
+
+        if stats is not None:
+            stats.record(statement_shape(statement), elapsed)
+
+        if elapsed >= slow_seconds:
+            logger.warning(
+                'Slow query %.1f ms: %s; parameters: %s',
+                elapsed * 1000,
+                statement_shape(statement),
+                parameters_shape(parameters)
+            )
+
+
+class QueryStatsMiddleware:
+    """
+    ASGI-middleware, собирающее статистику SQL-запросов каждого HTTP-запроса
+    """
+
+    def __init__(self, app, config=None):
+        self.app = app
+
+        config = config or get_config()
+
+        self.add_headers = config.DB_QUERY_HEADERS
+        self.threshold = config.DB_N_PLUS_ONE_THRESHOLD
+        self.raise_on_repeat = config.DB_N_PLUS_ONE_RAISE
+
+    def check_repeated(self, scope, stats: QueryStats) -> None:
+        repeated = stats.repeated(self.threshold)
+
+        if not repeated:
+            return
+
+        for statement, count in repeated:
+            logger.warning('Possible N+1 in %s %s: %d x %s', scope['method'], scope['path'], count, statement)
+
+        if self.raise_on_repeat:
+            raise NPlusOneError(f'{len(repeated)} statement(s) repeated more than {self.threshold} times')
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        stats = QueryStats()
+        token = query_stats.set(stats)
+
+        async def send_wrapper(message):
+            if message['type'] == 'http.response.start':
+                self.check_repeated(scope, stats)
+
+                if self.add_headers:
+                    message['headers'] = list(message.get('headers', [])) + [
+                        (b'x-db-query-count', str(stats.count).encode()),
+                        (b'x-db-time-ms', f'{stats.seconds * 1000:.2f}'.encode()),
+                    ]
+
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            query_stats.reset(token)
+
+
+def setup_query_stats(app) -> None:
+    app.add_middleware(QueryStatsMiddleware)
@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Ограничение частоты запросов по клиенту и маршруту (token bucket).
+
+Корзина хранится в виде одного числа — теоретического времени
+прибытия следующего запроса (GCRA): rate токенов в секунду, запас
+burst запросов подряд. Корзина, время которой уже прошло, полна и
+ничего не хранит, поэтому периодическая очистка просто удаляет такие
+ключи. Число ключей в памяти ограничено RATE_LIMIT_MAX_KEYS, при
+переполнении удаляются давно не использованные.
+
+Правила задаются в RATE_LIMIT_RULES по методу и шаблону пути без
+префикса API, например 'POST /users/': (1.0, 5); остальные маршруты
+ограничиваются RATE_LIMIT_DEFAULT.
+
+По умолчанию корзины живут в памяти воркера, и с N воркерами клиент
+получает до N-кратного лимита. RATE_LIMIT_BACKEND — путь к файлу SQLite
+(например, в /dev/shm), общему для воркеров одной машины; обращения
+к нему блокирующие и выполняются в потоке, а не на event loop.
+
+Клиент определяется по адресу из app.common.client_address: за nginx
+это адрес браузера, в том числе для запросов, которые front-end делает
+от имени браузера.
+"""
+
+import asyncio
+import math
+import os
+import sqlite3
+import threading
+import time
+
+from collections import OrderedDict
+from fastapi import HTTPException, Request
+from prometheus_client import Counter
+from typing import Dict, Optional, Tuple
+
+from app.common.client_address import request_client_address
+from app.config import get_config
+
+
+RATE_LIMITED_TOTAL = Counter(
+    'rate_limited_total',
+    'Запросы, отклоненные ограничением частоты',
+    ('route',),
+)
+
+
+def gcra(tat: Optional[float], now: float, rate: float, burst: int) -> Tuple[float, float]:
+    """
+    Шаг GCRA для корзины с сохраненным временем tat
+
+    Returns:
+        Tuple[float, float]: новое время корзины и секунд до разрешения
+            запроса (0.0, если запрос разрешен)
+    """
+    interval = 1.0 / rate
+    new_tat = max(tat or now, now) + interval
+    allow_at = new_tat - burst * interval
+
+    if now < allow_at:
+        return tat, allow_at - now
+
+    return new_tat, 0.0
+
+
+class MemoryBuckets:
+    """
+    Корзины в памяти процесса с вытеснением давно не использованных ключей
+    """
+
+    blocking = False
+
+    def __init__(self, max_keys: int, sweep_interval: float):
+        self.max_keys = max_keys
+        self.sweep_interval = sweep_interval
+
+        self._tats: 'OrderedDict[str, float]' = OrderedDict()
+        self._last_sweep = time.monotonic()
+
+    def hit(self, key: str, rate: float, burst: int) -> float:
+        now = time.monotonic()
+
+        if now - self._last_sweep >= self.sweep_interval:
+            self.sweep(now)
+
+        tat, retry_after = gcra(self._tats.get(key), now, rate, burst)
+
+        if not retry_after:
+            self._tats[key] = tat
+            self._tats.move_to_end(key)
+
+            if len(self._tats) > self.max_keys:
+                self._tats.popitem(last=False)
+
+        return retry_after
+
+    def sweep(self, now: Optional[float] = None) -> int:
+        """
+        Удалить полные корзины, время которых уже прошло
+        """
+        now = time.monotonic() if now is None else now
+        idle = [key for key, tat in self._tats.items() if tat <= now]
+
+        for key in idle:
+            del self._tats[key]
+
+        self._last_sweep = now
+
+        return len(idle)
+
+    def __len__(self) -> int:
+        return len(self._tats)
+
+
+class SQLiteBuckets:
+    """
+    Корзины в файле SQLite, общем для воркеров одной машины.
+    Если файл занят дольше busy_timeout, запрос пропускается.
+    hit() блокирующий, RateLimiter вызывает его в потоке
+    """
+
+    blocking = True
+
+    def __init__(self, path: str, sweep_interval: float, busy_timeout: float = 0.05):
+        self.path = path
+        self.sweep_interval = sweep_interval
+        self.busy_timeout = busy_timeout
+
+        # Соединение одно на воркер, а вызовы приходят из разных потоков
+        self._lock = threading.RLock()
+        self._connection: Optional[sqlite3.Connection] = None
+        self._pid = None
+        self._last_sweep = time.time()
+
+    def _connect(self) -> sqlite3.Connection:
+        # Соединение не переживает fork: у каждого воркера свое
+        if self._connection is None or self._pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=self.busy_timeout, isolation_level=None, check_same_thread=False)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=OFF')
+            connection.execute('CREATE TABLE IF NOT EXISTS rate_limit (key TEXT PRIMARY KEY, tat REAL NOT NULL) WITHOUT ROWID')
+
+            self._connection, self._pid = connection, os.getpid()
+
+        return self._connection
+
+    def hit(self, key: str, rate: float, burst: int) -> float:
+        with self._lock:
+            return self._hit(key, rate, burst)
+
+    def _hit(self, key: str, rate: float, burst: int) -> float:
+        now = time.time()
+
+        try:
+            connection = self._connect()
+
+            if now - self._last_sweep >= self.sweep_interval:
+                self.sweep(now)
+
+            connection.execute('BEGIN IMMEDIATE')
+
+            try:
+                row = connection.execute('SELECT tat FROM rate_limit WHERE key = ?', (key,)).fetchone()
+                tat, retry_after = gcra(row[0] if row else None, now, rate, burst)
+
+                if not retry_after:
+                    connection.execute('INSERT OR REPLACE INTO rate_limit (key, tat) VALUES (?, ?)', (key, tat))
+            finally:
+                connection.execute('COMMIT')
+
+        except sqlite3.OperationalError:
+            return 0.0
+
+        return retry_after
+
+    def sweep(self, now: Optional[float] = None) -> int:
+        now = time.time() if now is None else now
+        self._last_sweep = now
+
+        with self._lock:
+            return self._connect().execute('DELETE FROM rate_limit WHERE tat <= ?', (now,)).rowcount
+
+
+class RateLimiter:
+    """
+    Лимиты по маршрутам поверх хранилища корзин
+    """
+
+    def __init__(self, config=None):
+        self.config = config or get_config()
+
+        self.rules: Dict[str, Tuple[float, int]] = dict(self.config.RATE_LIMIT_RULES)
+        self.default = self.config.RATE_LIMIT_DEFAULT
+
+        if self.config.RATE_LIMIT_BACKEND:
+            self.buckets = SQLiteBuckets(self.config.RATE_LIMIT_BACKEND, self.config.RATE_LIMIT_SWEEP_INTERVAL)
+        else:
+            self.buckets = MemoryBuckets(self.config.RATE_LIMIT_MAX_KEYS, self.config.RATE_LIMIT_SWEEP_INTERVAL)
+
+    async def check(self, client: str, route: str) -> float:
+        """
+        Учесть запрос клиента к маршруту
+
+        Returns:
+            float: 0.0, если запрос разрешен, иначе секунд до разрешения
+        """
+        rule = self.rules.get(route, self.default)
+
+        if rule is None:
+            return 0.0
+
+        rate, burst = rule
+
+        # SQLiteBuckets ждет занятый файл до busy_timeout: не на event loop
+        if self.buckets.blocking:
+            return await asyncio.to_thread(self.buckets.hit, f'{client} {route}', rate, burst)
+
+        return self.buckets.hit(f'{client} {route}', rate, burst)
+
+
+rate_limiter = RateLimiter()
+
+
+def rate_limit_dependency(prefix: str = '', limiter: Optional[RateLimiter] = None):
+    """
+    Зависимость FastAPI для роутера: 429 с Retry-After при превышении лимита
+    маршрута. prefix — префикс, с которым роутер подключен к приложению
+    """
+    limiter = limiter or rate_limiter
+
+    async def rate_limit(request: Request) -> None:
+        if not limiter.config.RATE_LIMIT_ENABLED:
+            return
+
+        route = request.scope.get('route')
+        route_key = f"{request.method} {getattr(route, 'path', request.url.path).removeprefix(prefix)}"
+
+        retry_after = await limiter.check(request_client_address(request), route_key)
+
+        if retry_after:
+            RATE_LIMITED_TOTAL.labels(route_key).inc()
+
+            raise HTTPException(
+                status_code=429,
+                detail='Too many requests',
+                headers={'Retry-After': str(max(1, math.ceil(retry_after)))}
+            )
+
+    return rate_limit
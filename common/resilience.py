@@ -0,0 +1,465 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Устойчивость запросов между сервисами.
+
+ResilientTransport — транспорт httpx для запросов к другим сервисам:
+
+    httpx.AsyncClient(transport=ResilientTransport('front_end'), event_hooks=UPSTREAM_EVENT_HOOKS)
+
+- CircuitBreaker на каждый бэкенд (хост URL): после
+  BREAKER_FAILURE_THRESHOLD ошибок подряд запросы к бэкенду сразу
+  завершаются CircuitOpenError, через BREAKER_RESET_TIMEOUT секунд
+  пропускается один пробный запрос;
+- ошибкой для breaker'а считаются только ошибки транспорта и ответы
+  502/503/504: ответ 500 или 4xx значит, что бэкенд доступен;
+- повторы только для идемпотентных методов, при ошибке соединения
+  или ответе 502/503/504, кроме 503 с Retry-After, с экспоненциальной
+  задержкой со случайным разбросом (full jitter). Общее число повторов ограничено RetryBudget:
+  не больше RETRY_BUDGET_RATIO от числа запросов плюс небольшой
+  минимум в секунду, чтобы повторы не умножали нагрузку на
+  перегруженный бэкенд;
+- оставшееся до дедлайна время передается в заголовке
+  X-Request-Timeout-Ms, а таймаут запроса не превышает его.
+- GET-запросы с расширением hedge_route хеджируются, если транспорту
+  передан Hedger (app.common.hedging).
+
+DeadlineMiddleware читает X-Request-Timeout-Ms входящего запроса и
+отменяет обработчик, если дедлайн наступил раньше, чем начался ответ:
+вызывающий сервис уже не ждет результата.
+"""
+
+import asyncio
+import httpx
+import random
+import time
+
+from contextvars import ContextVar
+from prometheus_client import Counter, Gauge
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from app.common.tracing import end_client_span
+from app.config import get_config
+
+
+DEADLINE_HEADER = 'x-request-timeout-ms'
+_DEADLINE_HEADER_RAW = DEADLINE_HEADER.encode()
+
+# DELETE не повторяется: повторное удаление отвечает 404 и скрывает успех первой попытки
+IDEMPOTENT_METHODS = {'GET', 'HEAD', 'OPTIONS', 'PUT'}
+RETRYABLE_STATUSES = {502, 503, 504}
+RETRYABLE_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout, httpx.RemoteProtocolError)
+
+CIRCUIT_STATES = {'closed': 0, 'half_open': 1, 'open': 2}
+
+CIRCUIT_STATE = Gauge(
+    'upstream_circuit_state',
+    'Состояние circuit breaker бэкенда: 0 — закрыт, 1 — пробный запрос, 2 — открыт',
+    ('service', 'backend'),
+    multiprocess_mode='max',
+)
+
+UPSTREAM_RETRIES_TOTAL = Counter(
+    'upstream_retries_total',
+    'Количество повторных запросов к другим сервисам',
+    ('service', 'backend'),
+)
+
+UPSTREAM_REJECTED_TOTAL = Counter(
+    'upstream_rejected_total',
+    'Запросы к другим сервисам, не отправленные из-за открытого breaker или истекшего дедлайна',
+    ('service', 'backend', 'reason'),
+)
+
+request_deadline: ContextVar[Optional[float]] = ContextVar('request_deadline', default=None)
+
+
+class CircuitOpenError(httpx.TransportError):
+    """
+    Бэкенд считается недоступным, запрос не отправлялся.
+    retry_after — секунд до пробного запроса
+    """
+
+    def __init__(self, message: str, *, request: Optional[httpx.Request] = None, retry_after: float = 0.0):
+        super().__init__(message, request=request)
+        self.retry_after = retry_after
+
+
+class DeadlineExceededError(httpx.TimeoutException):
+    """
+    Дедлайн исходного запроса истек до отправки запроса к бэкенду
+    """
+
+
+def remaining_time() -> Optional[float]:
+    """
+    Секунд до дедлайна текущего запроса или None, если дедлайна нет
+    """
+    deadline = request_deadline.get()
+
+    return None if deadline is None else deadline - time.monotonic()
+
+
+class CircuitBreaker:
+    """
+    Автомат closed → open → half-open для одного бэкенда или провайдера.
+    Общий для запросов между сервисами и геокодеров сервиса maps
+    """
+
+    def __init__(self, failure_threshold: int, reset_timeout: float, on_state_change: Optional[Callable[[str], None]] = None):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.on_state_change = on_state_change
+
+        self.state = 'closed'
+        self.failures = 0
+        self.opened_at = 0.0
+
+        self._probe_in_flight = False
+
+    def _set_state(self, state: str) -> None:
+        if state != self.state:
+            self.state = state
+
+            if self.on_state_change is not None:
+                self.on_state_change(state)
+
+    def allow(self) -> bool:
+        """
+        Можно ли отправить запрос. В открытом состоянии после reset_timeout
+        пропускается один пробный запрос
+        """
+        if self.state == 'closed':
+            return True
+
+        if self.state == 'open' and time.monotonic() - self.opened_at >= self.reset_timeout:
+            self._set_state('half_open')
+
+        if self.state == 'half_open' and not self._probe_in_flight:
+            self._probe_in_flight = True
+            return True
+
+        return False
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self._probe_in_flight = False
+        self._set_state('closed')
+
+    def release(self) -> None:
+        """
+        Запрос отменен до получения результата: пробный запрос можно отправить снова
+        """
+        self._probe_in_flight = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        self._probe_in_flight = False
+
+        if self.state == 'half_open' or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+            self._set_state('open')
+
+    def retry_after(self) -> float:
+        return max(0.0, self.reset_timeout - (time.monotonic() - self.opened_at))
+
+
+class RetryBudget:
+    """
+    Бюджет повторов: каждый запрос добавляет ratio токена, повтор тратит один,
+    кроме того, min_per_second токенов добавляется каждую секунду.
+    Запас ограничен min_per_second * ttl, чтобы за тихий период
+    не накопилось право на лавину повторов
+    """
+
+    def __init__(self, ratio: float, min_per_second: float, ttl: float = 10.0, capacity: Optional[float] = None):
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.capacity = capacity or max(1.0, min_per_second * ttl)
+
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.min_per_second)
+        self._updated = now
+
+    def deposit(self) -> None:
+        self._refill()
+        self._tokens = min(self.capacity, self._tokens + self.ratio)
+
+    def try_withdraw(self) -> bool:
+        self._refill()
+
+        if self._tokens < 1.0:
+            return False
+
+        self._tokens -= 1.0
+        return True
+
+
+class ResilienceRegistry:
+    """
+    Breaker'ы и бюджеты повторов по бэкендам, общие для всех клиентов процесса
+    """
+
+    def __init__(self, config=None):
+        self.config = config or get_config()
+
+        self.breakers: Dict[Tuple[str, str], CircuitBreaker] = {}
+        self.budgets: Dict[Tuple[str, str], RetryBudget] = {}
+
+    def breaker(self, service: str, backend: str) -> CircuitBreaker:
+        key = (service, backend)
+        breaker = self.breakers.get(key)
+
+        if breaker is None:
+            gauge = CIRCUIT_STATE.labels(service, backend)
+            gauge.set(0)
+
+            breaker = self.breakers[key] = CircuitBreaker(
+                self.config.BREAKER_FAILURE_THRESHOLD,
+                self.config.BREAKER_RESET_TIMEOUT,
+                on_state_change=lambda state: gauge.set(CIRCUIT_STATES[state])
+            )
+
+        return breaker
+
+    def budget(self, service: str, backend: str) -> RetryBudget:
+        key = (service, backend)
+        budget = self.budgets.get(key)
+
+        if budget is None:
+            budget = self.budgets[key] = RetryBudget(self.config.RETRY_BUDGET_RATIO, self.config.RETRY_BUDGET_MIN_PER_SECOND)
+
+        return budget
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        return {
+            f'{service}->{backend}': {'state': breaker.state, 'failures': breaker.failures}
+            for (service, backend), breaker in self.breakers.items()
+        }
+
+
+registry = ResilienceRegistry()
+
+
+def backoff_delay(attempt: int, base: float, cap: float) -> float:
+    """
+    Задержка перед повтором attempt (с 1): случайная в [0, min(cap, base * 2^(attempt-1))]
+    """
+    return random.uniform(0, min(cap, base * 2 ** (attempt - 1)))
+
+
+def copy_request(request: httpx.Request) -> httpx.Request:
+    """
+    Копия запроса для хеджа: _apply_deadline меняет заголовки и расширения
+    запроса, поэтому одновременные попытки не должны делить один объект.
+    Тело не копируется — хеджируются только запросы идемпотентными методами
+    """
+    extensions = dict(request.extensions)
+    extensions['timeout'] = dict(extensions.get('timeout') or {})
+
+    return httpx.Request(request.method, request.url, headers=request.headers.copy(), stream=request.stream, extensions=extensions)
+
+
+class ResilientTransport(httpx.AsyncBaseTransport):
+    """
+    Транспорт httpx с breaker'ом, повторами и передачей дедлайна
+    """
+
+    def __init__(self, service: str, transport: Optional[httpx.AsyncBaseTransport] = None, hedger=None, config=None):
+        self.config = config or get_config()
+
+        self.service = service
+        self.transport = transport or httpx.AsyncHTTPTransport()
+        self.hedger = hedger
+
+    def _apply_deadline(self, request: httpx.Request, backend: str) -> None:
+        remaining = remaining_time()
+        timeout = dict(request.extensions.get('timeout') or {})
+
+        if remaining is not None:
+            if remaining <= 0:
+                UPSTREAM_REJECTED_TOTAL.labels(self.service, backend, 'deadline').inc()
+                raise DeadlineExceededError('Request deadline exceeded', request=request)
+
+            timeout = {key: remaining if value is None else min(value, remaining) for key, value in timeout.items()}
+            request.extensions['timeout'] = timeout
+
+        budget = [value for value in (timeout.get('read'), remaining) if value is not None]
+
+        if budget:
+            request.headers[DEADLINE_HEADER] = str(max(1, int(min(budget) * 1000)))
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        backend = request.url.host or 'unknown'
+
+        breaker = registry.breaker(self.service, backend)
+        budget = registry.budget(self.service, backend)
+
+        budget.deposit()
+
+        route = request.extensions.get('hedge_route')
+
+        try:
+            if self.hedger is not None and route is not None and request.method in IDEMPOTENT_METHODS:
+                return await self.hedger.send(
+                    route,
+                    lambda: self._send(request, backend, breaker, budget),
+                    hedge=lambda: self._send(copy_request(request), backend, breaker, budget)
+                )
+
+            return await self._send(request, backend, breaker, budget)
+
+        except BaseException as e:
+            end_client_span(request, e)
+            raise
+
+    async def _send(self, request: httpx.Request, backend: str, breaker: CircuitBreaker, budget: RetryBudget) -> httpx.Response:
+        # POST с Idempotency-Key не повторяется: ключи общие только для воркеров
+        # одной машины, и повтор, попавший на другую, выполнил бы запрос второй раз
+        retryable = request.method in IDEMPOTENT_METHODS
+        attempt = 0
+
+        while True:
+            # Дедлайн проверяется до breaker'а, чтобы не занять пробный запрос впустую
+            self._apply_deadline(request, backend)
+
+            if not breaker.allow():
+                UPSTREAM_REJECTED_TOTAL.labels(self.service, backend, 'circuit_open').inc()
+                raise CircuitOpenError(f'Circuit for {backend} is open', request=request, retry_after=breaker.retry_after())
+
+            try:
+                response = await self.transport.handle_async_request(request)
+
+            except asyncio.CancelledError:
+                breaker.release()
+                raise
+
+            except httpx.TransportError as e:
+                breaker.record_failure()
+
+                if not (retryable and isinstance(e, RETRYABLE_ERRORS)):
+                    raise
+
+                if not await self._before_retry(attempt := attempt + 1, budget, backend):
+                    raise
+
+                continue
+
+            # Ответ 500 и 4xx означают, что бэкенд доступен и ошибся на этом
+            # запросе, поэтому breaker открывают только ошибки транспорта и 502/503/504
+            if response.status_code in RETRYABLE_STATUSES:
+                breaker.record_failure()
+            else:
+                breaker.record_success()
+
+            if not (retryable and response.status_code in RETRYABLE_STATUSES):
+                return response
+
+            # 503 с Retry-After — бэкенд сам просит не приходить раньше срока
+            # (перегрузка, admission control); ответ передается вызывающему
+            if response.status_code == 503 and 'retry-after' in response.headers:
+                return response
+
+            if not await self._before_retry(attempt := attempt + 1, budget, backend):
+                return response
+
+            await response.aclose()
+
+    async def _before_retry(self, attempt: int, budget: RetryBudget, backend: str) -> bool:
+        """
+        Решить, делать ли повтор, и выждать задержку перед ним
+        """
+        if attempt > self.config.RETRY_MAX_ATTEMPTS:
+            return False
+
+        delay = backoff_delay(attempt, self.config.RETRY_BACKOFF_BASE, self.config.RETRY_BACKOFF_MAX)
+        remaining = remaining_time()
+
+        if remaining is not None and remaining <= delay:
+            return False
+
+        if not budget.try_withdraw():
+            return False
+
+        UPSTREAM_RETRIES_TOTAL.labels(self.service, backend).inc()
+
+        await asyncio.sleep(delay)
+
+        return True
+
+    async def aclose(self) -> None:
+        await self.transport.aclose()
+
+
+class DeadlineMiddleware:
+    """
+    ASGI-middleware дедлайна из заголовка X-Request-Timeout-Ms.
+    Если дедлайн наступил до начала ответа, обработчик отменяется
+    и возвращается 504. Начатый ответ (потоки, long-poll) не прерывается
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        timeout_ms = None
+
+        for name, value in scope['headers']:
+            if name == _DEADLINE_HEADER_RAW:
+                try:
+                    timeout_ms = int(value)
+                except ValueError:
+                    pass
+                break
+
+        if timeout_ms is None:
+            await self.app(scope, receive, send)
+            return
+
+        token = request_deadline.set(time.monotonic() + timeout_ms / 1000)
+
+        started = False
+        context = asyncio.timeout(timeout_ms / 1000)
+
+        async def send_wrapper(message):
+            nonlocal started
+
+            if message['type'] == 'http.response.start':
+                started = True
+                context.reschedule(None)
+
+            await send(message)
+
+        try:
+            async with context:
+                await self.app(scope, receive, send_wrapper)
+
+        except TimeoutError:
+            if started or not context.expired():
+                raise
+
+            await send({
+                'type': 'http.response.start',
+                'status': 504,
+                'headers': [(b'content-type', b'application/json')],
+            })
+            await send({'type': 'http.response.body', 'body': b'{"detail":"Request deadline exceeded"}'})
+
+        finally:
+            request_deadline.reset(token)
+
+
+def setup_resilience(app) -> None:
+    """
+    Подключить соблюдение дедлайнов входящих запросов к приложению FastAPI
+    """
+    app.add_middleware(DeadlineMiddleware)
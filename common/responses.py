@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Быстрая сериализация JSON-ответов.
+
+ORJSONResponse сериализует словари и списки через orjson. Если обработчик
+возвращает экземпляр Response, FastAPI не проверяет его по response_model:
+строки из БД, выбранные через select_schema_columns() и rows_as_dicts(),
+сериализуются один раз, без построения и проверки моделей pydantic.
+response_model остается в маршруте только для документации, поэтому
+расхождение столбцов со схемой ответа ничем не обнаруживается и должно
+исключаться самим select_schema_columns().
+
+RawJSONResponse отдает уже сериализованные байты без разбора,
+например ответ другого сервиса в edge-router.
+
+FieldSelection — параметр ?fields=id,name,date: из БД выбираются и в
+ответ попадают только перечисленные столбцы схемы ответа.
+"""
+
+import orjson
+
+from fastapi import HTTPException, Query
+from fastapi.responses import JSONResponse, Response
+from typing import *
+
+
+def _default(value: Any) -> Any:
+    model_dump = getattr(value, 'model_dump', None)
+
+    if model_dump is not None:
+        return model_dump(mode='json')
+
+    raise TypeError(f'Type is not JSON serializable: {type(value).__name__}')
+
+
+def dumps(content: Any) -> bytes:
+    return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
+
+
+class ORJSONResponse(JSONResponse):
+    media_type = 'application/json'
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+class RawJSONResponse(Response):
+    media_type = 'application/json'
+
+
+def select_schema_columns(model, schema) -> List[Any]:
+    """
+    Столбцы таблицы модели, которые есть в схеме ответа, в порядке полей схемы.
+    Позволяет выбрать из БД ровно то, что попадет в ответ, без
+    промежуточных ORM-объектов и моделей pydantic.
+    """
+    table = model.__table__
+
+    return [table.c[name] for name in schema.model_fields if name in table.c]
+
+
+def rows_as_dicts(result) -> List[Dict[str, Any]]:
+    """
+    Строки результата SQLAlchemy в виде словарей
+    """
+    return [dict(row) for row in result.mappings()]
+
+
+class FieldSelection:
+    """
+    Зависимость FastAPI для параметра fields: список полей через запятую
+    из разрешенных столбцов columns. Возвращает выбранные столбцы в порядке
+    columns или None, если параметр не передан
+
+    Raises:
+        HTTPException: 400 - поле не входит в список разрешенных
+    """
+
+    def __init__(self, columns: List[Any]):
+        self.columns = columns
+        self.names = {column.name for column in columns}
+
+    def __call__(self, fields: Optional[str] = Query(None, description='Поля ответа через запятую')) -> Optional[List[Any]]:
+        if not fields:
+            return None
+
+        requested = {name.strip() for name in fields.split(',')} - {''}
+        unknown = requested - self.names
+
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(sorted(unknown))}")
+
+        return [column for column in self.columns if column.name in requested] or None
+
+
+def fields_tag(columns: Optional[List[Any]]) -> Tuple[str, ...]:
+    """
+    Части ETag для выбранных полей: ответы с разными fields не совпадают по ETag
+    """
+    return () if columns is None else (','.join(column.name for column in columns),)
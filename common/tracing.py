@@ -0,0 +1,651 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Трассировка запросов между сервисами Ryadom по W3C Trace Context.
+
+setup_tracing(app, service) подключает ASGI-middleware, которое принимает
+заголовок traceparent и открывает span обработчика. Исходящие запросы httpx
+(traceparent_event_hooks), запросы к БД (instrument_engine) и рендер
+шаблонов (tracer.span) создают дочерние span'ы, которые записываются
+в JSON-lines файлы каталога TRACE_EXPORT_DIR, по файлу на процесс.
+Файл больше TRACE_FILE_MAX_BYTES переименовывается в <имя>.1.jsonl,
+хранится не больше TRACE_FILE_BACKUPS таких копий.
+
+Флаг sampled входящего traceparent учитывается только для запросов
+других сервисов: соединение из частной сети без X-Forwarded-For, который
+выставляет nginx. Для остальных запросов trace_id сохраняется, а решение
+о сэмплировании принимается по TRACE_SAMPLE_RATIO, чтобы внешний клиент
+не мог включить запись каждого своего запроса.
+
+Отчет по трассе с критическим путем:
+    python -m common.tracing traces/ --trace <trace_id>
+    python -m common.tracing traces/ --name "GET /event/{event_id}"
+"""
+
+import argparse
+import atexit
+import contextlib
+import ipaddress
+import json
+import os
+import random
+import re
+import secrets
+import threading
+import time
+
+from contextvars import ContextVar
+from typing import *
+
+
+TRACEPARENT_RE = re.compile(r'^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$')
+
+MAX_STATEMENT_LENGTH = 500
+
+
+class Span:
+    """
+    Операция внутри трассы. Несэмплированные span'ы не экспортируются,
+    но передают trace_id дальше по цепочке сервисов.
+    """
+
+    __slots__ = (
+        'name', 'trace_id', 'span_id', 'parent_id', 'sampled', 'kind',
+        'attributes', 'status', 'start_time', 'duration', '_started',
+    )
+
+    def __init__(
+        self,
+        name: str,
+        trace_id: str,
+        parent_id: Optional[str],
+        sampled: bool,
+        kind: str = 'internal',
+        attributes: Optional[Dict[str, Any]] = None
+    ):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.sampled = sampled
+        self.kind = kind
+        self.attributes = attributes or {}
+        self.status = 'ok'
+
+        self.start_time = time.time()
+        self.duration: Optional[float] = None
+        self._started = time.perf_counter()
+
+    @property
+    def traceparent(self) -> str:
+        return f'00-{self.trace_id}-{self.span_id}-{"01" if self.sampled else "00"}'
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    def set_error(self, exc: BaseException) -> None:
+        self.status = 'error'
+        self.attributes['error.type'] = type(exc).__name__
+        self.attributes['error.message'] = str(exc)[:200]
+
+    def end(self) -> None:
+        if self.duration is not None:
+            return
+
+        self.duration = time.perf_counter() - self._started
+
+        if self.sampled:
+            tracer.export(self)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'trace_id': self.trace_id,
+            'span_id': self.span_id,
+            'parent_id': self.parent_id,
+            'name': self.name,
+            'kind': self.kind,
+            'service': tracer.service,
+            'start': self.start_time,
+            'duration_ms': round(self.duration * 1000, 3),
+            'status': self.status,
+            'attributes': self.attributes,
+        }
+
+
+current_span: ContextVar[Optional[Span]] = ContextVar('current_span', default=None)
+
+
+class JsonLinesExporter:
+    """
+    Запись span'ов в файл <directory>/<service>-<pid>.jsonl.
+    Span'ы копятся в памяти и сбрасываются фоновым потоком,
+    чтобы запись на диск не блокировала цикл событий.
+
+    Файл, который превысил бы max_bytes, сдвигается в <service>-<pid>.1.jsonl,
+    предыдущие копии — на номер дальше; копии старше backups удаляются.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        service: str,
+        flush_interval: float = 1.0,
+        max_buffer: int = 10000,
+        max_bytes: Optional[int] = None,
+        backups: int = 2
+    ):
+        self.directory = directory
+        self.service = service
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.dropped = 0
+
+        self._buffer: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+        self._pid: Optional[int] = None
+        self._thread: Optional[threading.Thread] = None
+
+    def export(self, span: Span) -> None:
+        self._ensure_thread()
+
+        with self._lock:
+            if len(self._buffer) >= self.max_buffer:
+                self.dropped += 1
+                return
+
+            self._buffer.append(span.to_dict())
+
+    def _ensure_thread(self) -> None:
+        # После fork воркера gunicorn поток нужно запустить заново
+        pid = os.getpid()
+
+        if self._pid == pid:
+            return
+
+        with self._lock:
+            if self._pid == pid:
+                return
+
+            self._pid = pid
+            self._buffer = []
+            self._thread = threading.Thread(target=self._run, name='trace-exporter', daemon=True)
+            self._thread.start()
+
+        atexit.register(self.flush)
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(self.flush_interval)
+            self.flush()
+
+    def flush(self) -> None:
+        with self._lock:
+            spans, self._buffer = self._buffer, []
+
+        if not spans:
+            return
+
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f'{self.service}-{os.getpid()}.jsonl')
+
+        data = ''.join(json.dumps(span, ensure_ascii=False) + '\n' for span in spans).encode('utf-8')
+
+        if self.max_bytes:
+            try:
+                size = os.path.getsize(path)
+            except OSError:
+                size = 0
+
+            if size and size + len(data) > self.max_bytes:
+                self._rotate(path)
+
+        with open(path, 'ab') as file:
+            file.write(data)
+
+    def _rotate(self, path: str) -> None:
+        base = path[:-len('.jsonl')]
+
+        if not self.backups:
+            os.remove(path)
+            return
+
+        for index in range(self.backups, 0, -1):
+            source = f'{base}.{index - 1}.jsonl' if index > 1 else path
+
+            if os.path.exists(source):
+                os.replace(source, f'{base}.{index}.jsonl')
+
+
+class Tracer:
+    """
+    Создание span'ов и решение о сэмплировании.
+    Пока сервис не вызвал setup_tracing, span'ы не создаются.
+    """
+
+    def __init__(self):
+        self.service: Optional[str] = None
+        self.sample_ratio = 1.0
+        self.exporter: Optional[JsonLinesExporter] = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.service is not None
+
+    def configure(self, service: str, sample_ratio: float, exporter: Optional[JsonLinesExporter]) -> None:
+        self.service = service
+        self.sample_ratio = sample_ratio
+        self.exporter = exporter
+
+    def start_span(
+        self,
+        name: str,
+        parent: Optional[Span] = None,
+        kind: str = 'internal',
+        attributes: Optional[Dict[str, Any]] = None,
+        traceparent: Optional[str] = None,
+        trust_sampled: bool = True
+    ) -> Span:
+        """
+        Начать span. Родитель — переданный span, заголовок traceparent
+        входящего запроса или, если нет ни того ни другого, новая трасса.
+        При trust_sampled=False флаг sampled из traceparent не используется.
+        Span не становится текущим, для этого используется span().
+        """
+        if parent is not None:
+            return Span(name, parent.trace_id, parent.span_id, parent.sampled, kind, attributes)
+
+        remote = parse_traceparent(traceparent) if traceparent else None
+
+        if remote is not None:
+            trace_id, parent_id, sampled = remote
+
+            if not trust_sampled:
+                sampled = self._sample()
+
+            return Span(name, trace_id, parent_id, sampled, kind, attributes)
+
+        return Span(name, secrets.token_hex(16), None, self._sample(), kind, attributes)
+
+    def _sample(self) -> bool:
+        return self.sample_ratio >= 1.0 or random.random() < self.sample_ratio
+
+    @contextlib.contextmanager
+    def span(self, name: str, **attributes) -> Iterator[Optional[Span]]:
+        """
+        Выполнить блок кода внутри дочернего span'а текущего запроса
+
+        Пример:
+            with tracer.span('render_template', template=template_name):
+                ...
+        """
+        parent = current_span.get()
+
+        if parent is None or not self.enabled:
+            yield None
+            return
+
+        span = self.start_span(name, parent, attributes=attributes)
+        token = current_span.set(span)
+
+        try:
+            yield span
+        except BaseException as e:
+            span.set_error(e)
+            raise
+        finally:
+            current_span.reset(token)
+            span.end()
+
+    def export(self, span: Span) -> None:
+        if self.exporter is not None:
+            self.exporter.export(span)
+
+
+tracer = Tracer()
+
+
+def parse_traceparent(value: str) -> Optional[Tuple[str, str, bool]]:
+    """
+    Разобрать заголовок traceparent
+
+    Returns:
+        Optional[Tuple[str, str, bool]]: (trace_id, parent_id, sampled) или None для некорректного заголовка
+    """
+    match = TRACEPARENT_RE.match(value.strip().lower())
+
+    if match is None:
+        return None
+
+    trace_id, parent_id, flags = match.groups()
+
+    if trace_id == '0' * 32 or parent_id == '0' * 16:
+        return None
+
+    return trace_id, parent_id, bool(int(flags, 16) & 1)
+
+
+def is_internal_caller(scope) -> bool:
+    """
+    Запрос пришел от другого сервиса: соединение из частной сети или
+    localhost и без X-Forwarded-For, который добавляет nginx
+    """
+    client = scope.get('client')
+
+    try:
+        address = ipaddress.ip_address(client[0]) if client else None
+    except ValueError:
+        return False
+
+    if address is None or not (address.is_private or address.is_loopback):
+        return False
+
+    return all(key != b'x-forwarded-for' for key, _ in scope['headers'])
+
+
+class TracingMiddleware:
+    """
+    ASGI-middleware, открывающее span обработки входящего запроса
+    """
+
+    def __init__(self, app, skip_paths: Iterable[str] = ('/metrics',)):
+        self.app = app
+        self.skip_paths = set(skip_paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or scope['path'] in self.skip_paths or not tracer.enabled:
+            await self.app(scope, receive, send)
+            return
+
+        traceparent = None
+
+        for key, value in scope['headers']:
+            if key == b'traceparent':
+                traceparent = value.decode('latin-1')
+                break
+
+        span = tracer.start_span(
+            f'{scope["method"]} {scope["path"]}',
+            kind='server',
+            attributes={'http.method': scope['method'], 'http.target': scope['path']},
+            traceparent=traceparent,
+            trust_sampled=traceparent is None or is_internal_caller(scope)
+        )
+
+        async def send_wrapper(message):
+            if message['type'] == 'http.response.start':
+                span.set_attribute('http.status_code', message['status'])
+
+                if message['status'] >= 500:
+                    span.status = 'error'
+
+            await send(message)
+
+        token = current_span.set(span)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except BaseException as e:
+            span.set_error(e)
+            raise
+        finally:
+            current_span.reset(token)
+
+            route = scope.get('route')
+
+            if route is not None and hasattr(route, 'path'):
+                span.name = f'{scope["method"]} {route.path}'
+
+            span.end()
+
+
+def traceparent_event_hooks() -> Dict[str, List[Callable]]:
+    """
+    Хуки httpx: span на исходящий запрос и заголовок traceparent
+    """
+
+    async def on_request(request):
+        parent = current_span.get()
+
+        if parent is None or not tracer.enabled:
+            return
+
+        span = tracer.start_span(
+            f'HTTP {request.method} {request.url.host}',
+            parent,
+            kind='client',
+            attributes={
+                'http.method': request.method,
+                'http.url': str(request.url.copy_with(query=None)),
+                'peer.service': request.url.host,
+            }
+        )
+
+        request.headers['traceparent'] = span.traceparent
+        request.extensions['trace_span'] = span
+
+    async def on_response(response):
+        span = response.request.extensions.get('trace_span')
+
+        if span is None:
+            return
+
+        span.set_attribute('http.status_code', response.status_code)
+
+        if response.status_code >= 500:
+            span.status = 'error'
+
+        span.end()
+
+    return {'request': [on_request], 'response': [on_response]}
+
+
+def end_client_span(request, error: BaseException) -> None:
+    """
+    Завершить с ошибкой span исходящего запроса, на который не пришел
+    ответ: хук response httpx в этом случае не вызывается. Вызывается
+    транспортом, через который идут запросы (ResilientTransport)
+    """
+    span = request.extensions.get('trace_span')
+
+    if span is not None:
+        span.set_error(error)
+        span.end()
+
+
+def combine_event_hooks(*hooks: Dict[str, List[Callable]]) -> Dict[str, List[Callable]]:
+    """
+    Объединить наборы хуков httpx в один
+    """
+    combined: Dict[str, List[Callable]] = {'request': [], 'response': []}
+
+    for hook in hooks:
+        for event, callbacks in hook.items():
+            combined.setdefault(event, []).extend(callbacks)
+
+    return combined
+
+
+def instrument_engine(engine) -> None:
+    """
+    Создавать span на каждый SQL-запрос движка внутри сэмплированного запроса
+    """
+    from sqlalchemy import event
+
+    sync_engine = engine.sync_engine
+
+    @event.listens_for(sync_engine, 'before_cursor_execute')
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        parent = current_span.get()
+
+        if parent is None or not parent.sampled:
+            return
+
+        context._trace_span = tracer.start_span(
+            'db.query',
+            parent,
+            kind='client',
+            attributes={
+                'db.system': conn.dialect.name,
+                'db.statement': statement[:MAX_STATEMENT_LENGTH],
+                'db.executemany': executemany,
+            }
+        )
+
+    @event.listens_for(sync_engine, 'after_cursor_execute')
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        span = getattr(context, '_trace_span', None)
+
+        if span is not None:
+            span.end()
+
+    @event.listens_for(sync_engine, 'handle_error')
+    def handle_error(exception_context):
+        span = getattr(exception_context.execution_context, '_trace_span', None)
+
+        if span is not None:
+            span.set_error(exception_context.original_exception)
+            span.end()
+
+
+def setup_tracing(app, service: str, config=None) -> None:
+    """
+    Подключить трассировку к приложению FastAPI
+
+    Args:
+        app: приложение FastAPI
+        service: имя сервиса в span'ах
+        config: конфигурация (по умолчанию get_config())
+    """
+    from app.config import get_config
+
+    config = config or get_config()
+
+    if not config.TRACE_ENABLED:
+        return
+
+    exporter = None
+
+    if config.TRACE_EXPORT_DIR:
+        exporter = JsonLinesExporter(
+            config.TRACE_EXPORT_DIR,
+            service,
+            max_bytes=config.TRACE_FILE_MAX_BYTES,
+            backups=config.TRACE_FILE_BACKUPS
+        )
+
+    tracer.configure(service, config.TRACE_SAMPLE_RATIO, exporter)
+    app.add_middleware(TracingMiddleware)
+
+
+def load_traces(directory: str) -> Dict[str, List[Dict[str, Any]]]:
+    traces: Dict[str, List[Dict[str, Any]]] = {}
+
+    for filename in sorted(os.listdir(directory)):
+        if not filename.endswith('.jsonl'):
+            continue
+
+        with open(os.path.join(directory, filename), encoding='utf-8') as file:
+            for line in file:
+                if line.strip():
+                    span = json.loads(line)
+                    traces.setdefault(span['trace_id'], []).append(span)
+
+    return traces
+
+
+def critical_path(spans: List[Dict[str, Any]]) -> Set[str]:
+    """
+    Span'ы критического пути. От конца span'а идем назад: берем дочерний
+    span, завершившийся последним, затем тот, что завершился до его начала,
+    и так далее; внутри выбранных span'ов повторяем то же самое
+    """
+    ids = {span['span_id'] for span in spans}
+    children: Dict[Optional[str], List[Dict[str, Any]]] = {}
+
+    for span in spans:
+        parent_id = span['parent_id'] if span['parent_id'] in ids else None
+        children.setdefault(parent_id, []).append(span)
+
+    def end(span: Dict[str, Any]) -> float:
+        return span['start'] + span['duration_ms'] / 1000
+
+    path = set()
+
+    def walk(span: Dict[str, Any]) -> None:
+        path.add(span['span_id'])
+        cursor = end(span)
+
+        for child in sorted(children.get(span['span_id'], []), key=end, reverse=True):
+            if end(child) <= cursor:
+                walk(child)
+                cursor = child['start']
+
+    for root in children.get(None, []):
+        walk(root)
+
+    return path
+
+
+def format_trace(spans: List[Dict[str, Any]]) -> str:
+    ids = {span['span_id'] for span in spans}
+    children: Dict[Optional[str], List[Dict[str, Any]]] = {}
+
+    for span in sorted(spans, key=lambda span: span['start']):
+        parent_id = span['parent_id'] if span['parent_id'] in ids else None
+        children.setdefault(parent_id, []).append(span)
+
+    path = critical_path(spans)
+    trace_start = min(span['start'] for span in spans)
+    lines = []
+
+    def walk(parent_id: Optional[str], depth: int) -> None:
+        for span in children.get(parent_id, []):
+            marker = '*' if span['span_id'] in path else ' '
+            offset = (span['start'] - trace_start) * 1000
+            status = '' if span['status'] == 'ok' else f' [{span["status"]}]'
+
+            lines.append(
+                f'{marker} {offset:9.2f} ms {span["duration_ms"]:9.2f} ms  '
+                f'{"  " * depth}{span["service"]}: {span["name"]}{status}'
+            )
+
+            walk(span['span_id'], depth + 1)
+
+    walk(None, 0)
+
+    return '\n'.join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Отчет по трассам из JSON-lines файлов (* — критический путь)')
+    parser.add_argument('directory', help='Каталог TRACE_EXPORT_DIR')
+    parser.add_argument('--trace', help='trace_id трассы')
+    parser.add_argument('--name', help='Имя корневого span\'а, например "GET /event/{event_id}"')
+    parser.add_argument('--limit', type=int, default=5, help='Количество последних трасс')
+    args = parser.parse_args()
+
+    traces = load_traces(args.directory)
+
+    if args.trace:
+        selected = [traces.get(args.trace, [])]
+    else:
+        roots = [
+            (span['start'], trace_id)
+            for trace_id, spans in traces.items()
+            for span in spans
+            if span['parent_id'] is None and (args.name is None or span['name'] == args.name)
+        ]
+        selected = [traces[trace_id] for _, trace_id in sorted(roots)[-args.limit:]]
+
+    for spans in selected:
+        if spans:
+            print(f'trace {spans[0]["trace_id"]}')
+            print(format_trace(spans))
+            print()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,5 @@
 from pydantic_settings import BaseSettings
-from typing import Optional
+from typing import Dict, Optional, Tuple
 
 import os
 
@@ -13,6 +13,100 @@ class BaseConfig(BaseSettings):
     DOCS_URL: Optional[str] = None
     REDOC_URL: Optional[str] = None
     OPENAPI_URL: Optional[str] = None
+
+    RELOAD: bool = False
+
+    WORKERS: Optional[int] = None
+    WORKERS_PER_CPU: int = 1
+    PRELOAD_APP: bool = True
+    MAX_REQUESTS: int = 10000
+    MAX_REQUESTS_JITTER: int = 1000
+    GRACEFUL_TIMEOUT: int = 30
+    WORKER_TIMEOUT: int = 60
+    KEEPALIVE_TIMEOUT: int = 5
+    ACCESS_LOG: bool = False
+
+    DB_POOL_SIZE: int = 10
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT: int = 30
+    DB_POOL_RECYCLE: int = 1800
+    DB_POOL_PRE_PING: bool = True
+    DB_STATEMENT_CACHE_SIZE: int = 100
+    DB_PGBOUNCER_MODE: bool = False
+    DB_LOG_LEVEL: str = "WARNING"
+    DB_REPLICA_MAX_LAG: float = 5.0
+    DB_REPLICA_CHECK_INTERVAL: float = 2.0
+    DB_READ_YOUR_WRITES_WINDOW: float = 5.0
+    DB_PIN_BACKEND: Optional[str] = None
+    DB_SLOW_QUERY_MS: float = 100.0
+    DB_N_PLUS_ONE_THRESHOLD: int = 5
+    DB_N_PLUS_ONE_RAISE: bool = False
+    DB_QUERY_HEADERS: bool = False
+
+    PROFILING_SECRET: Optional[str] = None
+    PROFILING_DIR: str = "profiles"
+    PROFILING_MAX_FILES: int = 50
+    PROFILING_INTERVAL: float = 0.001
+
+    TRACE_ENABLED: bool = True
+    TRACE_SAMPLE_RATIO: float = 0.1
+    TRACE_EXPORT_DIR: Optional[str] = "traces"
+    TRACE_FILE_MAX_BYTES: int = 50 * 1024 * 1024
+    TRACE_FILE_BACKUPS: int = 2
+
+    VALIDATOR_CACHE_MAX_ENTRIES: int = 1000
+    VALIDATOR_CACHE_MAX_BYTES: int = 64 * 1024 * 1024
+
+    COMPRESSION_ENABLED: bool = True
+    COMPRESSION_MIN_SIZE: int = 1024
+    COMPRESSION_GZIP_LEVEL: int = 6
+    COMPRESSION_BROTLI_QUALITY: int = 4
+    COMPRESSION_ZSTD_LEVEL: int = 3
+    COMPRESSION_CACHE_MAX_BYTES: int = 32 * 1024 * 1024
+
+    BREAKER_FAILURE_THRESHOLD: int = 5
+    BREAKER_RESET_TIMEOUT: float = 10.0
+    RETRY_MAX_ATTEMPTS: int = 2
+    RETRY_BACKOFF_BASE: float = 0.05
+    RETRY_BACKOFF_MAX: float = 1.0
+    RETRY_BUDGET_RATIO: float = 0.1
+    RETRY_BUDGET_MIN_PER_SECOND: float = 1.0
+
+    HEDGE_ENABLED: bool = False
+    HEDGE_PERCENTILE: float = 0.95
+    HEDGE_MIN_DELAY: float = 0.005
+    HEDGE_BUDGET_RATIO: float = 0.05
+    HEDGE_BUDGET_BURST: float = 10.0
+
+    ADMISSION_ENABLED: bool = True
+    ADMISSION_INITIAL_LIMIT: int = 50
+    ADMISSION_MIN_LIMIT: int = 5
+    ADMISSION_MAX_LIMIT: int = 500
+    ADMISSION_BACKOFF: float = 0.9
+    ADMISSION_LATENCY_THRESHOLD: float = 2.0
+    ADMISSION_QUEUE_SIZE: int = 100
+    ADMISSION_QUEUE_TIMEOUT: float = 0.5
+    ADMISSION_RETRY_AFTER: int = 1
+
+    RATE_LIMIT_ENABLED: bool = True
+    RATE_LIMIT_RULES: Dict[str, Tuple[float, int]] = {
+        'POST /users/': (1.0, 5),
+        'PUT /users/{user_id}': (2.0, 10),
+        'POST /events/': (1.0, 10),
+        'PUT /events/{event_id}': (2.0, 10),
+        'POST /events/{event_id}/members/': (2.0, 10),
+    }
+    RATE_LIMIT_DEFAULT: Optional[Tuple[float, int]] = (50.0, 100)
+    RATE_LIMIT_MAX_KEYS: int = 100_000
+    RATE_LIMIT_SWEEP_INTERVAL: float = 60.0
+    RATE_LIMIT_BACKEND: Optional[str] = None
+
+    IDEMPOTENCY_ENABLED: bool = True
+    IDEMPOTENCY_TTL: float = 600.0
+    IDEMPOTENCY_MAX_ENTRIES: int = 10_000
+    IDEMPOTENCY_MAX_BODY: int = 64 * 1024
+    IDEMPOTENCY_PENDING_TIMEOUT: float = 60.0
+    IDEMPOTENCY_BACKEND: Optional[str] = None
     
     model_config = {
         'case_sensitive': True,
@@ -9,6 +9,11 @@ class DevelopmentConfig(BaseConfig):
     DEBUG: bool = True
     RELOAD: bool = True
 
+    DB_LOG_LEVEL: str = "INFO"
+    DB_QUERY_HEADERS: bool = True
+
+    TRACE_SAMPLE_RATIO: float = 1.0
+
     DOCS_URL: str = "/docs"
     REDOC_URL: str = "/redoc"
     OPENAPI_URL: str = "/openapi.json"
\ No newline at end of file
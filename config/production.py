@@ -1,4 +1,5 @@
 from .base import BaseConfig
+from typing import Optional
 
 import os
 
@@ -7,4 +8,8 @@ class ProductionConfig(BaseConfig):
     """Конфигурация для продакшена"""
     DEVELOPMENT: bool = False
     DEBUG: bool = False
-    RELOAD: bool = False
\ No newline at end of file
+    RELOAD: bool = False
+
+    RATE_LIMIT_BACKEND: Optional[str] = '/dev/shm/ryadom-rate-limit.sqlite3'
+    DB_PIN_BACKEND: Optional[str] = '/dev/shm/ryadom-db-pins.sqlite3'
+    IDEMPOTENCY_BACKEND: Optional[str] = '/dev/shm/ryadom-idempotency.sqlite3'
\ No newline at end of file
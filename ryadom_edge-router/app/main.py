@@ -1,13 +1,33 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
-from fastapi import FastAPI
+from fastapi import Depends, FastAPI
 
+from app.common.client_address import setup_client_address
+from app.common.compression import setup_compression
+from app.common.metrics import setup_metrics
+from app.common.profiling import setup_profiling
+from app.common.rate_limit import rate_limit_dependency
+from app.common.resilience import setup_resilience
+from app.common.responses import ORJSONResponse
+from app.common.tracing import setup_tracing
 from app.config import get_config
 from app.routes.routes import router
 
 
 config = get_config()
 
-app = FastAPI(docs_url=config.DOCS_URL, redoc_url=config.REDOC_URL, openapi_url=config.OPENAPI_URL)
-app.include_router(router, prefix=config.API_PREFIX)
\ No newline at end of file
+app = FastAPI(
+    docs_url=config.DOCS_URL, redoc_url=config.REDOC_URL, openapi_url=config.OPENAPI_URL,
+    default_response_class=ORJSONResponse
+)
+
+setup_metrics(app, 'edge_router')
+setup_tracing(app, 'edge_router')
+setup_profiling(app)
+setup_resilience(app)
+setup_client_address(app)
+setup_compression(app)
+
+
+app.include_router(router, prefix=config.API_PREFIX, dependencies=[Depends(rate_limit_dependency(config.API_PREFIX))])
\ No newline at end of file
@@ -1,9 +1,14 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
-from httpx import HTTPStatusError
-from fastapi import APIRouter, HTTPException, Request
+import math
 
+from httpx import HTTPStatusError, RequestError, TimeoutException
+from fastapi import APIRouter, HTTPException, Request, Response
+from typing import Optional
+
+from app.common.admission import OverloadedError
+from app.common.resilience import CircuitOpenError
 from app.services.router_service import RouterService
 import ryadom_schemas.events as schemas_events
 import ryadom_schemas.members as schemas_members
@@ -14,35 +19,59 @@ router = APIRouter()
 router_service = RouterService()
 
 
+def upstream_error(error: Exception) -> HTTPException:
+    """
+    Ответ клиенту по исключению при обращении к сервису: статус ошибки
+    сервиса передается как есть, недоступность и перегрузка — 502/503, таймаут — 504
+    """
+    if isinstance(error, HTTPException):
+        return error
+
+    if isinstance(error, HTTPStatusError):
+        return HTTPException(status_code=error.response.status_code, detail=str(error))
+
+    if isinstance(error, OverloadedError):
+        return HTTPException(status_code=503, detail=str(error), headers={'Retry-After': str(error.retry_after)})
+
+    if isinstance(error, CircuitOpenError):
+        return HTTPException(status_code=503, detail=str(error), headers={'Retry-After': str(max(1, math.ceil(error.retry_after)))})
+
+    if isinstance(error, TimeoutException):
+        return HTTPException(status_code=504, detail='Upstream request timed out')
+
+    if isinstance(error, RequestError):
+        return HTTPException(status_code=502, detail='Upstream request failed')
+
+    return HTTPException(status_code=500, detail=str(error))
+
+
 # USERS
 
 @router.post('/users/', response_model=schemas_users.UserResponse)
 async def post_user(request: Request, user: schemas_users.UserCreate):
     try:
-        user_data = await router_service.post_user_to_user_service(user)
+        user_data = await router_service.post_user_to_user_service(user, request.headers.get('idempotency-key'))
         return user_data
-    except HTTPStatusError as e:
-        raise HTTPException(status_code=e.response.status_code, detail=str(e))
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        raise upstream_error(e)
 
 
 @router.get('/users/')
-async def get_users(request: Request):
+async def get_users(request: Request, fields: Optional[str] = None):
     try:
-        users_data = await router_service.get_all_users_from_user_service()
+        users_data = await router_service.get_all_users_from_user_service(request.headers.get('if-none-match'), fields)
         return users_data
     except Exception as e:
-        raise HTTPException(status_code=404, detail=str(e))
+        raise upstream_error(e)
 
 
 @router.get('/users/{user_id}')
-async def get_user(request: Request, user_id: int):
+async def get_user(request: Request, user_id: int, fields: Optional[str] = None):
     try:
-        user_data = await router_service.get_user_from_user_service(user_id)
+        user_data = await router_service.get_user_from_user_service(user_id, request.headers.get('if-none-match'), fields)
         return user_data
     except Exception as e:
-        raise HTTPException(status_code=404, detail=str(e))
+        raise upstream_error(e)
 
 
 @router.put('/users/{user_id}')
@@ -51,7 +80,7 @@ async def update_user(request: Request, user_id: int, user_data: schemas_users.U
         user_data_ = await router_service.update_user_from_user_service(user_id, user_data)
         return user_data_
     except Exception as e:
-        raise HTTPException(status_code=404, detail=str(e))
+        raise upstream_error(e)
 
 
 @router.delete('/users/{user_id}')
@@ -60,7 +89,7 @@ async def delete_user(request: Request, user_id: int):
         user_data = await router_service.delete_user_from_user_service(user_id)
         return user_data
     except Exception as e:
-        raise HTTPException(status_code=404, detail=str(e))
+        raise upstream_error(e)
 
 
 # EVENTS    
@@ -68,30 +97,28 @@ async def delete_user(request: Request, user_id: int):
 @router.post('/events/', response_model=schemas_events.EventResponse)
 async def post_event(request: Request, event: schemas_events.EventCreate):
     try:
-        event_data = await router_service.post_event_to_event_service(event)
+        event_data = await router_service.post_event_to_event_service(event, request.headers.get('idempotency-key'))
         return event_data
-    except HTTPStatusError as e:
-        raise HTTPException(status_code=e.response.status_code, detail=str(e))
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        raise upstream_error(e)
 
 
 @router.get('/events/')
-async def get_events(request: Request):
+async def get_events(request: Request, fields: Optional[str] = None):
     try:
-        events_data = await router_service.get_all_events_from_event_service()
+        events_data = await router_service.get_all_events_from_event_service(request.headers.get('if-none-match'), fields)
         return events_data
     except Exception as e:
-        raise HTTPException(status_code=404, detail=str(e))
+        raise upstream_error(e)
 
 
 @router.get('/events/{event_id}')
-async def get_event(request: Request, event_id: int):
+async def get_event(request: Request, event_id: int, fields: Optional[str] = None):
     try:
-        event_data = await router_service.get_event_from_event_service(event_id)
+        event_data = await router_service.get_event_from_event_service(event_id, request.headers.get('if-none-match'), fields)
         return event_data
     except Exception as e:
-        raise HTTPException(status_code=404, detail=str(e))
+        raise upstream_error(e)
 
 
 @router.put('/events/{event_id}')
@@ -100,7 +127,7 @@ async def update_event(request: Request, event_id: int, event_data: schemas_even
         event_data_ = await router_service.update_event_from_event_service(event_id, event_data)
         return event_data_
     except Exception as e:
-        raise HTTPException(status_code=404, detail=str(e))
+        raise upstream_error(e)
 
 
 @router.delete('/events/{event_id}')
@@ -109,25 +136,52 @@ async def delete_event(request: Request, event_id: int):
         event_data = await router_service.delete_event_from_event_service(event_id)
         return event_data
     except Exception as e:
-        raise HTTPException(status_code=404, detail=str(e))
+        raise upstream_error(e)
 
 
 @router.post('/events/{event_id}/members/', response_model=schemas_members.MemberResponse)
 async def add_member_to_event(request: Request, event_id: int, member: schemas_members.MemberCreate):
     try:
-        member_data = await router_service.add_member_to_event_from_event_service(event_id, member)
+        member_data = await router_service.add_member_to_event_from_event_service(event_id, member, request.headers.get('idempotency-key'))
         return member_data
     except Exception as e:
-        raise HTTPException(status_code=404, detail=str(e))
+        raise upstream_error(e)
     
 
 @router.get('/events/{event_id}/members/')
 async def get_members_by_event_id(request: Request, event_id: int):
     try:
-        members_data = await router_service.get_members_by_event_id_from_event_service(event_id)
+        members_data = await router_service.get_members_by_event_id_from_event_service(event_id, request.headers.get('if-none-match'))
         return members_data
     except Exception as e:
-        raise HTTPException(status_code=404, detail=str(e))
+        raise upstream_error(e)
+
+
+@router.get('/events/{event_id}/members/count')
+async def count_members_by_event_id(request: Request, event_id: int, role: Optional[str] = None):
+    try:
+        count_data = await router_service.count_members_by_event_id_from_event_service(event_id, role, request.headers.get('if-none-match'))
+        return count_data
+    except Exception as e:
+        raise upstream_error(e)
+    
+
+@router.get('/changes')
+async def get_changes(request: Request, since: int = 0, limit: int = 100, wait: float = 0):
+    try:
+        changes_data = await router_service.get_changes_from_event_service(since, limit, wait)
+        return changes_data
+    except Exception as e:
+        raise upstream_error(e)
+
+
+@router.get('/changes/head')
+async def get_changes_head(request: Request):
+    try:
+        head_data = await router_service.get_changes_head_from_event_service()
+        return head_data
+    except Exception as e:
+        raise upstream_error(e)
     
 
 # MAPS
@@ -138,7 +192,16 @@ async def get_coordinates_by_address(request: Request, address: str):
         coordinates = await router_service.get_coordinates_by_address(address)
         return coordinates
     except Exception as e:
-        raise HTTPException(status_code=404, detail=str(e))
+        raise upstream_error(e)
+    
+
+@router.get('/reverse-geocode')
+async def get_address_by_coordinates(request: Request, lat: float, lon: float):
+    try:
+        address = await router_service.get_address_by_coordinates(lat, lon)
+        return address
+    except Exception as e:
+        raise upstream_error(e)
     
 
 @router.get('/static-map')
@@ -147,4 +210,30 @@ async def get_static_map(request: Request, lat: float, lon: float, zoom: int, si
         static_map = await router_service.get_static_map_url_by_coordinates(lat, lon, zoom, size)
         return static_map
     except Exception as e:
-        raise HTTPException(status_code=404, detail=str(e))
+        raise upstream_error(e)
+
+
+
+@router.get('/static-map/image')
+async def get_static_map_image(request: Request, lat: float, lon: float, zoom: int = 13, size: str = '650,450'):
+    conditional_headers = {
+        key: value for key, value in request.headers.items()
+        if key in ('if-none-match', 'if-modified-since')
+    }
+
+    try:
+        response = await router_service.get_static_map_image(lat, lon, zoom, size, conditional_headers)
+    except Exception as e:
+        raise upstream_error(e)
+
+    headers = {
+        key: value for key, value in response.headers.items()
+        if key in ('etag', 'last-modified', 'cache-control')
+    }
+
+    return Response(
+        content=response.content if response.status_code != 304 else b'',
+        status_code=response.status_code,
+        headers=headers,
+        media_type=response.headers.get('content-type')
+    )
\ No newline at end of file
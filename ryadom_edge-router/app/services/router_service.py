@@ -6,8 +6,28 @@ import ryadom_schemas.members as schemas_members
 import ryadom_schemas.users as schemas_users
 
 from fastapi import HTTPException
+from fastapi.responses import Response
 from typing import Optional
 
+from app.common.admission import admission
+from app.common.client_address import forwarding_headers
+from app.common.hedging import Hedger
+from app.common.http_cache import VALIDATOR_HEADERS, ValidatorCache, etag_matches
+from app.common.idempotency import IDEMPOTENCY_HEADER
+from app.common.metrics import upstream_event_hooks
+from app.common.resilience import ResilientTransport
+from app.common.responses import RawJSONResponse
+from app.common.tracing import combine_event_hooks, traceparent_event_hooks
+
+
+UPSTREAM_EVENT_HOOKS = combine_event_hooks(upstream_event_hooks('edge_router'), traceparent_event_hooks())
+
+# Последние ответы сервисов с ETag; повторные запросы перепроверяются через If-None-Match
+validator_cache = ValidatorCache()
+
+# Хеджирование идемпотентных GET к сервисам, включается HEDGE_ENABLED
+hedger = Hedger('edge_router')
+
 
 class RouterService:
 
@@ -17,35 +37,77 @@ class RouterService:
         self.events_service_url = os.getenv("EVENTS_SERVICE_URL")
         self.maps_service_url = os.getenv("MAPS_SERVICE_URL")
 
-    # USERS
+    def _client(self, **kwargs) -> httpx.AsyncClient:
+        """
+        HTTP-клиент для запросов к сервисам с адресом исходного клиента в X-Real-IP
+        """
+        return httpx.AsyncClient(headers=forwarding_headers(), transport=ResilientTransport('edge_router', hedger=hedger), event_hooks=UPSTREAM_EVENT_HOOKS, **kwargs)
 
-    async def post_user_to_user_service(self, user_data: schemas_users.UserCreate):
-        async with httpx.AsyncClient() as client:
-            response = await client.post(f'{self.users_service_url}/users/', json=user_data.model_dump())
+    @staticmethod
+    def _idempotency_headers(idempotency_key: Optional[str]) -> Optional[dict]:
+        return {IDEMPOTENCY_HEADER: idempotency_key} if idempotency_key else None
 
-            response.raise_for_status()
+    @staticmethod
+    def _fields_params(fields: Optional[str]) -> Optional[dict]:
+        return {'fields': fields} if fields else None
 
-            return response.json()
+    @staticmethod
+    def _passthrough(response: httpx.Response, if_none_match: Optional[str] = None) -> Response:
+        """
+        Ответ сервиса как есть, без разбора и повторной сериализации JSON.
+        Валидаторы передаются клиенту; если его If-None-Match совпадает
+        с ETag ответа, клиент получает 304 без тела
+        """
+        headers = {key: value for key, value in response.headers.items() if key in VALIDATOR_HEADERS}
+
+        if response.status_code == 200 and etag_matches(if_none_match, response.headers.get('etag')):
+            return Response(status_code=304, headers=headers)
 
-    async def get_all_users_from_user_service(self):
-        async with httpx.AsyncClient() as client:
-            response = await client.get(f'{self.users_service_url}/users/')
+        return RawJSONResponse(content=response.content, status_code=response.status_code, headers=headers)
+
+    # USERS
+
+    async def post_user_to_user_service(self, user_data: schemas_users.UserCreate, idempotency_key: Optional[str] = None):
+        async with admission.slot('users', 'write'), self._client() as client:
+            response = await client.post(
+                f'{self.users_service_url}/users/',
+                json=user_data.model_dump(),
+                headers=self._idempotency_headers(idempotency_key)
+            )
+
+            response.raise_for_status()
 
             return response.json()
 
-    async def get_user_from_user_service(self, user_id: int):
-        async with httpx.AsyncClient() as client:
-            response = await client.get(f'{self.users_service_url}/users/{user_id}')
+    async def get_all_users_from_user_service(self, if_none_match: Optional[str] = None, fields: Optional[str] = None):
+        async with admission.slot('users', 'list'), self._client() as client:
+            response = await validator_cache.get(
+                client,
+                f'{self.users_service_url}/users/',
+                params=self._fields_params(fields),
+                extensions={'hedge_route': 'users.list'}
+            )
+
+            return self._passthrough(response, if_none_match)
+
+    async def get_user_from_user_service(self, user_id: int, if_none_match: Optional[str] = None, fields: Optional[str] = None):
+        async with admission.slot('users', 'read'), self._client() as client:
+            response = await validator_cache.get(
+                client,
+                f'{self.users_service_url}/users/{user_id}',
+                params=self._fields_params(fields),
+                extensions={'hedge_route': 'users.detail'}
+            )
 
             if response.status_code == 404:
                 raise HTTPException(status_code=404, detail="User not found")
             
             response.raise_for_status()
 
-            return response.json()
+            return self._passthrough(response, if_none_match)
         
     async def update_user_from_user_service(self, user_id: int, user_data: schemas_users.UserCreate):
-        async with httpx.AsyncClient() as client:
+        async with admission.slot('users', 'write'), self._client() as client:
             response = await client.put(f'{self.users_service_url}/users/{user_id}', json=user_data.model_dump())
             
             response.raise_for_status()
@@ -53,7 +115,7 @@ class RouterService:
             return response.json()
 
     async def delete_user_from_user_service(self, user_id: int):
-        async with httpx.AsyncClient() as client:
+        async with admission.slot('users', 'write'), self._client() as client:
             response = await client.delete(f'{self.users_service_url}/users/{user_id}')
 
             response.raise_for_status()
@@ -62,33 +124,47 @@ class RouterService:
         
     # EVENTS
 
-    async def post_event_to_event_service(self, event_data: schemas_events.EventCreate):
-        async with httpx.AsyncClient() as client:
-            response = await client.post(f'{self.events_service_url}/events/', json=event_data.model_dump())
+    async def post_event_to_event_service(self, event_data: schemas_events.EventCreate, idempotency_key: Optional[str] = None):
+        async with admission.slot('events', 'write'), self._client() as client:
+            response = await client.post(
+                f'{self.events_service_url}/events/',
+                json=event_data.model_dump(),
+                headers=self._idempotency_headers(idempotency_key)
+            )
 
             response.raise_for_status()
 
             return response.json()
 
-    async def get_all_events_from_event_service(self):
-        async with httpx.AsyncClient() as client:
-            response = await client.get(f'{self.events_service_url}/events/')
+    async def get_all_events_from_event_service(self, if_none_match: Optional[str] = None, fields: Optional[str] = None):
+        async with admission.slot('events', 'list'), self._client() as client:
+            response = await validator_cache.get(
+                client,
+                f'{self.events_service_url}/events/',
+                params=self._fields_params(fields),
+                extensions={'hedge_route': 'events.list'}
+            )
             
-            return response.json()
+            return self._passthrough(response, if_none_match)
         
-    async def get_event_from_event_service(self, event_id: int):
-        async with httpx.AsyncClient() as client:
-            response = await client.get(f'{self.events_service_url}/events/{event_id}')
+    async def get_event_from_event_service(self, event_id: int, if_none_match: Optional[str] = None, fields: Optional[str] = None):
+        async with admission.slot('events', 'read'), self._client() as client:
+            response = await validator_cache.get(
+                client,
+                f'{self.events_service_url}/events/{event_id}',
+                params=self._fields_params(fields),
+                extensions={'hedge_route': 'events.detail'}
+            )
 
             if response.status_code == 404:
                 raise HTTPException(status_code=404, detail="Event not found")
             
             response.raise_for_status()
 
-            return response.json()
+            return self._passthrough(response, if_none_match)
         
     async def update_event_from_event_service(self, event_id: int, event_data: schemas_events.EventCreate):
-        async with httpx.AsyncClient() as client:
+        async with admission.slot('events', 'write'), self._client() as client:
             response = await client.put(f'{self.events_service_url}/events/{event_id}', json=event_data.model_dump())
             
             response.raise_for_status()
@@ -96,39 +172,93 @@ class RouterService:
             return response.json()
 
     async def delete_event_from_event_service(self, event_id: int):
-        async with httpx.AsyncClient() as client:
+        async with admission.slot('events', 'write'), self._client() as client:
             response = await client.delete(f'{self.events_service_url}/events/{event_id}')
 
             response.raise_for_status()
 
             return response.json()
 
-    async def add_member_to_event_from_event_service(self, event_id: int, member_data: schemas_members.MemberCreate):
-        async with httpx.AsyncClient() as client:
-            response = await client.post(f'{self.events_service_url}/events/{event_id}/members/', json=member_data.model_dump())
+    async def add_member_to_event_from_event_service(
+        self,
+        event_id: int,
+        member_data: schemas_members.MemberCreate,
+        idempotency_key: Optional[str] = None
+    ):
+        async with admission.slot('events', 'write'), self._client() as client:
+            response = await client.post(
+                f'{self.events_service_url}/events/{event_id}/members/',
+                json=member_data.model_dump(),
+                headers=self._idempotency_headers(idempotency_key)
+            )
 
             response.raise_for_status()
 
             return response.json()
         
-    async def get_members_by_event_id_from_event_service(self, event_id: int):
-        async with httpx.AsyncClient() as client:
-            response = await client.get(f'{self.events_service_url}/events/{event_id}/members/')
+    async def get_members_by_event_id_from_event_service(self, event_id: int, if_none_match: Optional[str] = None):
+        async with admission.slot('events', 'read'), self._client() as client:
+            response = await validator_cache.get(client, f'{self.events_service_url}/events/{event_id}/members/', extensions={'hedge_route': 'events.members'})
 
             response.raise_for_status()
 
-            return response.json()
+            return self._passthrough(response, if_none_match)
+
+    async def count_members_by_event_id_from_event_service(
+        self,
+        event_id: int,
+        role: Optional[str] = None,
+        if_none_match: Optional[str] = None
+    ):
+        async with admission.slot('events', 'read'), self._client() as client:
+            response = await validator_cache.get(
+                client,
+                f'{self.events_service_url}/events/{event_id}/members/count',
+                params={'role': role} if role else None,
+                extensions={'hedge_route': 'events.members_count'}
+            )
+
+            response.raise_for_status()
+
+            return self._passthrough(response, if_none_match)
         
+    async def get_changes_from_event_service(self, since: int, limit: int, wait: float):
+        async with self._client(timeout=wait + 10.0) as client:
+            response = await client.get(
+                f'{self.events_service_url}/changes',
+                params={'since': since, 'limit': limit, 'wait': wait}
+            )
+
+            response.raise_for_status()
+
+            return response.json()
+
+    async def get_changes_head_from_event_service(self):
+        async with admission.slot('events', 'read'), self._client() as client:
+            response = await client.get(f'{self.events_service_url}/changes/head')
+
+            response.raise_for_status()
+
+            return response.json()
+
     # MAPS
 
     async def get_coordinates_by_address(self, address: str):
-        async with httpx.AsyncClient() as client:
+        async with admission.slot('maps', 'read'), self._client() as client:
             response = await client.get(f'{self.maps_service_url}/geocode?address={address}')
 
             response.raise_for_status()
 
             return response.json()
         
+    async def get_address_by_coordinates(self, lat: float, lon: float):
+        async with admission.slot('maps', 'read'), self._client() as client:
+            response = await client.get(f'{self.maps_service_url}/reverse-geocode', params={'lat': lat, 'lon': lon})
+
+            response.raise_for_status()
+
+            return response.json()
+        
     async def get_static_map_url_by_coordinates(
         self, 
         lat: Optional[int] = None,
@@ -136,9 +266,29 @@ class RouterService:
         zoom: Optional[int] = 13,
         size: Optional[str] = '650,450'
     ):
-        async with httpx.AsyncClient() as client:
+        async with admission.slot('maps', 'read'), self._client() as client:
             response = await client.get(f'{self.maps_service_url}/static-map?lat={lat}&lon={lon}&zoom={zoom}&size={size}')
 
             response.raise_for_status()
 
-            return response.json()
\ No newline at end of file
+            return response.json()
+
+    async def get_static_map_image(
+        self,
+        lat: float,
+        lon: float,
+        zoom: Optional[int] = 13,
+        size: Optional[str] = '650,450',
+        headers: Optional[dict] = None
+    ) -> httpx.Response:
+        async with admission.slot('maps', 'read'), self._client() as client:
+            response = await client.get(
+                f'{self.maps_service_url}/static-map/image',
+                params={'lat': lat, 'lon': lon, 'zoom': zoom, 'size': size},
+                headers=headers
+            )
+
+            if response.status_code != 304:
+                response.raise_for_status()
+
+            return response
\ No newline at end of file
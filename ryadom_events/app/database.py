@@ -1,17 +1,34 @@
 import os
 
-from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
-from sqlalchemy.orm import sessionmaker
+from fastapi import Request
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import AsyncGenerator
+
+from app.common.client_address import request_client_address
+from app.common.database import DatabaseRouter
 from app.models.base import Base
 
 
 DATABASE_URL = os.getenv("POSTGRES_EVENTS_URL")
+REPLICA_URLS = os.getenv("POSTGRES_EVENTS_REPLICA_URLS")
+
+db_router = DatabaseRouter.from_env_urls(DATABASE_URL, REPLICA_URLS)
+
+engine = db_router.primary
+async_session_maker = db_router.primary_session_maker
+
+READ_ONLY_METHODS = ('GET', 'HEAD')
+
+
+async def get_async_session(request: Request) -> AsyncGenerator[AsyncSession, None]:
+    read_only = request.method in READ_ONLY_METHODS
+    client_key = request_client_address(request)
 
-engine = create_async_engine(DATABASE_URL, echo=True)
-async_session_maker = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    # Без реплик все запросы идут в основную базу, и закрепления не читаются
+    if not read_only and db_router.replicas:
+        await db_router.pin(client_key)
 
+    session_maker = await db_router.session_maker_for(read_only, client_key)
 
-async def get_async_session() -> AsyncGenerator[AsyncSession, None]:
-    async with async_session_maker() as session:
+    async with session_maker() as session:
         yield session
\ No newline at end of file
@@ -3,21 +3,57 @@
 
 from fastapi import FastAPI
 
+from app.common.compression import setup_compression
+from app.common.database import create_schema
+from app.common.idempotency import setup_idempotency
+from app.common.metrics import setup_metrics
+from app.common.profiling import setup_profiling
+from app.common.query_stats import setup_query_stats
+from app.common.resilience import setup_resilience
+from app.common.responses import ORJSONResponse
+from app.common.tracing import setup_tracing
 from app.config import get_config
-from app.database import engine
+from app.database import db_router, engine
 from app.routes.routes import router
 from app.models.event import Base
+from app.services.changes_service import change_notifier
 
 
 config = get_config()
 
-app = FastAPI(docs_url=config.DOCS_URL, redoc_url=config.REDOC_URL, openapi_url=config.OPENAPI_URL)
+app = FastAPI(
+    docs_url=config.DOCS_URL, redoc_url=config.REDOC_URL, openapi_url=config.OPENAPI_URL,
+    default_response_class=ORJSONResponse
+)
+
+setup_metrics(app, 'events')
+setup_query_stats(app)
+setup_tracing(app, 'events')
+setup_profiling(app)
+setup_resilience(app)
+setup_idempotency(app)
+setup_compression(app)
 
 
 @app.on_event('startup')
 async def startup():
     async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(create_schema, Base.metadata)
+
+    db_router.start()
+
+    change_notifier.start(engine)
+
+
+@app.on_event('shutdown')
+async def shutdown():
+    await change_notifier.stop()
+    await db_router.stop()
+
+
+@app.get('/db-pool', include_in_schema=False)
+async def db_pool():
+    return db_router.stats()
 
 
 app.include_router(router)
\ No newline at end of file
@@ -0,0 +1,18 @@
+from sqlalchemy import Column, Index, Integer, String, Text
+
+from app.models.base import Base
+
+
+class OutboxModel(Base):
+    __tablename__ = 'outbox'
+
+    __table_args__ = (
+        Index('ix_outbox_entity_id', 'entity', 'id'),
+    )
+
+    id = Column(Integer, primary_key=True)
+    entity = Column(String(50), nullable=False)
+    entity_id = Column(Integer, nullable=False)
+    event_id = Column(Integer, nullable=False, index=True)
+    action = Column(String(50), nullable=False)
+    created_at = Column(Text, nullable=False)
@@ -1,20 +1,27 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
+import json
 import typing
 
 import ryadom_schemas.events as schemas_events
 import ryadom_schemas.members as schemas_members
 
-from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi import APIRouter, Depends, HTTPException, Request, Query
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.database import get_async_session
-from app.services.events_service import EventsService
+from app.common.http_cache import etag_matches, make_etag, not_modified, validator_headers
+from app.common.responses import FieldSelection, ORJSONResponse, fields_tag
+from app.database import async_session_maker, get_async_session
+from app.services.changes_service import ChangesService, change_notifier
+from app.services.events_service import EVENT_RESPONSE_COLUMNS, EventsService
 
 
 router = APIRouter(tags=['events'])
 
+event_fields = FieldSelection(EVENT_RESPONSE_COLUMNS)
+
 
 async def get_events_service(session: AsyncSession = Depends(get_async_session)):
     return EventsService(session)
@@ -29,14 +36,33 @@ async def create_event(request: Request, event: schemas_events.EventCreate, serv
 
 
 @router.get("/events/", response_model=schemas_events.EventListResponse)
-async def get_all_events(request: Request, service: EventsService = Depends(get_events_service)):
-    return await service.get_all_events()    
+async def get_all_events(
+    request: Request,
+    columns: typing.Optional[list] = Depends(event_fields),
+    service: EventsService = Depends(get_events_service)
+):
+    etag = make_etag('events', await service.get_events_version(), *fields_tag(columns))
+
+    if etag_matches(request.headers.get('if-none-match'), etag):
+        return not_modified(etag)
+
+    return ORJSONResponse(await service.get_all_events(columns), headers=validator_headers(etag))
 
 
 @router.get("/events/{event_id}", response_model=schemas_events.EventResponse)
-async def get_event_by_id(request: Request, event_id: int, service: EventsService = Depends(get_events_service)) -> typing.Dict | None:
+async def get_event_by_id(
+    request: Request,
+    event_id: int,
+    columns: typing.Optional[list] = Depends(event_fields),
+    service: EventsService = Depends(get_events_service)
+) -> typing.Dict | None:
+    etag = make_etag('event', event_id, await service.get_event_version(event_id), *fields_tag(columns))
+
+    if etag_matches(request.headers.get('if-none-match'), etag):
+        return not_modified(etag)
+
     try:
-        return await service.get_event_by_id(event_id)
+        return ORJSONResponse(await service.get_event_by_id(event_id, columns), headers=validator_headers(etag))
 
     except ValueError as e:
         raise HTTPException(status_code=404, detail=str(e))
@@ -98,11 +124,115 @@ async def add_member_to_event(
 
 @router.get("/events/{event_id}/members/", response_model=schemas_members.MemberListResponse)
 async def get_members_by_event_id(request: Request, event_id: int, service: EventsService = Depends(get_events_service)):
+    etag = make_etag('members', event_id, await service.get_event_version(event_id, with_members=True))
+
+    if etag_matches(request.headers.get('if-none-match'), etag):
+        return not_modified(etag)
+
     try:
-        return await service.get_members_by_event_id(event_id)
+        return ORJSONResponse(await service.get_members_by_event_id(event_id), headers=validator_headers(etag))
 
     except ValueError as e:
         raise HTTPException(status_code=404, detail=str(e))
 
     except Exception as e:
-        raise HTTPException(status_code=400, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.get("/events/{event_id}/members/count")
+async def count_members_by_event_id(
+    request: Request,
+    event_id: int,
+    role: typing.Optional[str] = Query(None, description='Учитывать только участников с этой ролью'),
+    service: EventsService = Depends(get_events_service)
+):
+    """
+    Получить количество участников события, не выбирая их список
+    """
+    etag = make_etag('members-count', event_id, await service.get_event_version(event_id, with_members=True), (role or 'all').lower())
+
+    if etag_matches(request.headers.get('if-none-match'), etag):
+        return not_modified(etag)
+
+    try:
+        count = await service.count_members_by_event_id(event_id, role)
+
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+    return ORJSONResponse({'event_id': event_id, 'role': role, 'count': count}, headers=validator_headers(etag))
+
+
+# CHANGES
+
+async def _fetch_changes(since: int, limit: int) -> typing.List[typing.Dict]:
+    async with async_session_maker() as session:
+        return await ChangesService(session).get_changes(since, limit)
+
+
+@router.get("/changes")
+async def get_changes(
+    request: Request,
+    since: int = Query(0, ge=0, description='id последнего полученного изменения'),
+    limit: int = Query(100, ge=1, le=1000),
+    wait: float = Query(0, ge=0, le=30, description='Сколько секунд ждать новых изменений (long-poll)')
+):
+    """
+    Получить изменения событий и участников после since.
+    При wait > 0 и отсутствии изменений запрос ждет их появления.
+    """
+    changes = await _fetch_changes(since, limit)
+
+    if not changes and wait > 0 and await change_notifier.wait(since, wait):
+        changes = await _fetch_changes(since, limit)
+
+    return {
+        'changes': changes,
+        'last_id': changes[-1]['id'] if changes else since
+    }
+
+
+@router.get("/changes/head")
+async def get_changes_head(request: Request):
+    """
+    Получить id последнего изменения, с которого можно начать чтение ленты
+    """
+    async with async_session_maker() as session:
+        return {'last_id': await ChangesService(session).get_last_id()}
+
+
+@router.get("/changes/stream")
+async def stream_changes(
+    request: Request,
+    since: int = Query(0, ge=0, description='id последнего полученного изменения')
+):
+    """
+    Поток изменений в формате Server-Sent Events.
+    Переподключение продолжает поток с заголовка Last-Event-ID.
+    """
+    last_event_id = request.headers.get('last-event-id')
+
+    if last_event_id and last_event_id.isdigit():
+        since = max(since, int(last_event_id))
+
+    async def event_stream():
+        cursor = since
+
+        while not await request.is_disconnected():
+            changes = await _fetch_changes(cursor, 500)
+
+            for change in changes:
+                cursor = change['id']
+                yield f"id: {change['id']}\ndata: {json.dumps(change)}\n\n"
+
+            if changes:
+                continue
+
+            if not await change_notifier.wait(cursor, 15):
+                yield ": keepalive\n\n"
+
+    return StreamingResponse(
+        event_stream(),
+        media_type='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
\ No newline at end of file
@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import asyncio
+import typing
+
+from app.models.outbox import OutboxModel
+
+from datetime import datetime
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+
+
+CHANGES_CHANNEL = 'event_changes'
+
+# Ключ advisory-блокировки, упорядочивающей записи outbox по commit
+OUTBOX_LOCK_ID = 0x6f7574626f78
+
+
+class ChangeNotifier:
+    """
+    Оповещение ожидающих клиентов о новых записях outbox.
+
+    Внутри процесса уведомления приходят сразу после commit, из других
+    процессов — через LISTEN/NOTIFY в Postgres.
+    """
+
+    def __init__(self):
+        self.last_id = 0
+
+        self._event = asyncio.Event()
+        self._listener_task: typing.Optional[asyncio.Task] = None
+
+    def notify(self, outbox_id: int) -> None:
+        if outbox_id <= self.last_id:
+            return
+
+        self.last_id = outbox_id
+
+        event, self._event = self._event, asyncio.Event()
+        event.set()
+
+    async def wait(self, since: int, timeout: float) -> bool:
+        """
+        Дождаться записи outbox с id больше since
+
+        Returns:
+            bool: True, если новые изменения появились до истечения timeout
+        """
+        if self.last_id > since:
+            return True
+
+        try:
+            await asyncio.wait_for(self._event.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            return False
+
+        return True
+
+    def start(self, engine: AsyncEngine) -> None:
+        if engine.dialect.name != 'postgresql' or self._listener_task is not None:
+            return
+
+        self._listener_task = asyncio.create_task(self._listen(engine))
+
+    async def stop(self) -> None:
+        if self._listener_task is None:
+            return
+
+        self._listener_task.cancel()
+
+        try:
+            await self._listener_task
+        except asyncio.CancelledError:
+            pass
+
+        self._listener_task = None
+
+    async def _listen(self, engine: AsyncEngine) -> None:
+        def on_notification(connection, pid, channel, payload):
+            try:
+                self.notify(int(payload))
+            except ValueError:
+                pass
+
+        while True:
+            try:
+                async with engine.connect() as conn:
+                    raw_connection = await conn.get_raw_connection()
+                    driver_connection = raw_connection.driver_connection
+
+                    await driver_connection.add_listener(CHANGES_CHANNEL, on_notification)
+
+                    try:
+                        await asyncio.Event().wait()
+                    finally:
+                        await driver_connection.remove_listener(CHANGES_CHANNEL, on_notification)
+
+            except asyncio.CancelledError:
+                raise
+
+            except Exception:
+                await asyncio.sleep(5)
+
+
+change_notifier = ChangeNotifier()
+
+
+async def record_change(session: AsyncSession, entity: str, entity_id: int, event_id: int, action: str) -> OutboxModel:
+    """
+    Добавить запись об изменении в outbox в текущей транзакции.
+    В Postgres уведомление NOTIFY будет доставлено после commit.
+
+    id из SERIAL выдается при вставке, а не при commit, поэтому без
+    блокировки запись с меньшим id могла бы стать видимой позже записи
+    с большим, и читатель с since между ними пропустил бы ее. Запись
+    берет advisory-блокировку до конца транзакции: следующая запись
+    получает id только после commit или отката этой, и id видимых
+    записей растут в порядке commit. Вызывать непосредственно перед
+    commit, чтобы блокировка держалась как можно меньше.
+
+    Args:
+        session: сессия, в которой выполняется изменение
+        entity: тип сущности ('event' или 'member')
+        entity_id: id сущности
+        event_id: id события, к которому относится изменение
+        action: 'created', 'updated' или 'deleted'
+
+    Returns:
+        OutboxModel: добавленная запись
+    """
+
+    if session.bind.dialect.name == 'postgresql':
+        await session.execute(select(func.pg_advisory_xact_lock(OUTBOX_LOCK_ID)))
+
+    change = OutboxModel(
+        entity=entity,
+        entity_id=entity_id,
+        event_id=event_id,
+        action=action,
+        created_at=datetime.now().isoformat()
+    )
+
+    session.add(change)
+    await session.flush()
+
+    if session.bind.dialect.name == 'postgresql':
+        await session.execute(select(func.pg_notify(CHANGES_CHANNEL, str(change.id))))
+
+    return change
+
+
+async def get_outbox_version(session: AsyncSession, entity: typing.Optional[str] = None, event_id: typing.Optional[int] = None) -> int:
+    """
+    Версия набора данных для ETag: id последней видимой записи outbox
+    с указанным типом сущности и событием.
+
+    record_change выдает id в порядке commit, поэтому запись, ставшая
+    видимой позже, всегда получает больший id, и версия только растет:
+    изменение, зафиксированное после чтения версии, не может спрятаться
+    за уже выданным ETag и оставить клиенту устаревший ответ с 304
+
+    Args:
+        session: сессия, в которой читается версия
+        entity: тип сущности ('event' или 'member'); None — любой
+        event_id: id события; None — любое
+
+    Returns:
+        int: версия, 0 если изменений не было
+    """
+
+    query = select(func.max(OutboxModel.id))
+
+    if entity is not None:
+        query = query.where(OutboxModel.entity == entity)
+
+    if event_id is not None:
+        query = query.where(OutboxModel.event_id == event_id)
+
+    return (await session.execute(query)).scalar() or 0
+
+
+class ChangesService:
+
+    def __init__(self, session: AsyncSession):
+        self.session = session
+
+    async def get_changes(self, since: int = 0, limit: int = 100) -> typing.List[typing.Dict]:
+        """
+        Получить изменения после указанной записи outbox
+
+        Args:
+            since: id последнего полученного изменения
+            limit: максимальное количество изменений
+
+        Returns:
+            List[Dict]: изменения в порядке возрастания id; изменения
+            с меньшим id не появятся позже (см. record_change)
+        """
+
+        result = await self.session.execute(
+            select(OutboxModel)
+            .where(OutboxModel.id > since)
+            .order_by(OutboxModel.id)
+            .limit(limit)
+        )
+
+        return [
+            {
+                'id': change.id,
+                'entity': change.entity,
+                'entity_id': change.entity_id,
+                'event_id': change.event_id,
+                'action': change.action,
+                'created_at': change.created_at,
+            }
+            for change in result.scalars().all()
+        ]
+
+    async def get_last_id(self) -> int:
+        """
+        Получить id последней записи outbox
+        """
+
+        result = await self.session.execute(select(func.max(OutboxModel.id)))
+
+        return result.scalar() or 0
@@ -8,15 +8,26 @@ import typing
 import ryadom_schemas.events as schemas_events
 import ryadom_schemas.members as schemas_members
 
+from app.common.metrics import upstream_event_hooks
+from app.common.resilience import ResilientTransport
+from app.common.responses import rows_as_dicts, select_schema_columns
+from app.common.tracing import combine_event_hooks, traceparent_event_hooks
 from app.models.event import EventModel
 from app.models.member import MemberModel
+from app.services.changes_service import change_notifier, get_outbox_version, record_change
 
 from datetime import datetime
 from fastapi import HTTPException
-from sqlalchemy import select
+from sqlalchemy import func, select
 from sqlalchemy.ext.asyncio import AsyncSession
 
 
+UPSTREAM_EVENT_HOOKS = combine_event_hooks(upstream_event_hooks('events'), traceparent_event_hooks())
+
+EVENT_RESPONSE_COLUMNS = select_schema_columns(EventModel, schemas_events.EventResponse)
+MEMBER_RESPONSE_COLUMNS = select_schema_columns(MemberModel, schemas_members.MemberResponse)
+
+
 class EventsService:
 
     def __init__(self, session: AsyncSession):
@@ -37,52 +48,76 @@ class EventsService:
 
         new_event = EventModel(**event.model_dump(), created_at=datetime.now().isoformat())
         self.session.add(new_event)
+        await self.session.flush()
+
+        change = await record_change(self.session, 'event', new_event.id, new_event.id, 'created')
 
         await self.session.commit()
         await self.session.refresh(new_event)
 
+        change_notifier.notify(change.id)
+
         return schemas_events.EventResponse.model_validate(new_event, from_attributes=True)
 
-    async def get_all_events(self):
+    async def get_events_version(self) -> int:
+        """
+        Версия списка событий: id последней записи outbox о событиях.
+        Меняется при каждом создании, изменении и удалении события и
+        растет в порядке commit (см. get_outbox_version). Читается до
+        самих данных, чтобы ответ был не старше своего ETag
+        """
+
+        return await get_outbox_version(self.session, entity='event')
+
+    async def get_event_version(self, event_id: int, with_members: bool = False) -> int:
+        """
+        Версия события: id последней записи outbox о нем. При with_members
+        учитываются и изменения участников — это версия списка участников,
+        которая меняется и при удалении самого события
+        """
+
+        return await get_outbox_version(self.session, entity=None if with_members else 'event', event_id=event_id)
+
+    async def get_all_events(self, columns: typing.Optional[typing.List[typing.Any]] = None):
         """
         Получить все события
         
+        Args:
+            columns: выбираемые столбцы, по умолчанию все поля EventResponse
+        
         Returns:
-            EventListResponse: список событий
+            Dict: {'events': [...]}, строки в форме EventResponse
         """
 
-        result = await self.session.execute(select(EventModel))
-        
-        events = result.scalars().all()
+        result = await self.session.execute(select(*(columns or EVENT_RESPONSE_COLUMNS)))
 
-        return schemas_events.EventListResponse(
-            events=[schemas_events.EventResponse.model_validate(event, from_attributes=True) for event in events]
-        )
+        return {'events': rows_as_dicts(result)}
 
-    async def get_event_by_id(self, event_id: int):
+    async def get_event_by_id(self, event_id: int, columns: typing.Optional[typing.List[typing.Any]] = None):
         """
         Получить событие по его id
         
         Args:
             event_id: id события
+            columns: выбираемые столбцы, по умолчанию все поля EventResponse
         
         Returns:
-            EventResponse: событие
+            Dict: событие в форме EventResponse
 
         Raises:
             ValueError: если событие не было найдено
         """
 
         result = await self.session.execute(
-            select(EventModel).where(EventModel.id == event_id)
+            select(*(columns or EVENT_RESPONSE_COLUMNS)).where(EventModel.id == event_id)
         )
 
-        event = result.scalar_one_or_none()
+        event = result.mappings().one_or_none()
 
         if not event:
             raise ValueError(f'Event with id {event_id} not found')
-        
-        return schemas_events.EventResponse.model_validate(event, from_attributes=True)
+
+        return dict(event)
 
     async def update_event(self, event_id: int, event: schemas_events.EventCreate):
         """
@@ -111,9 +146,13 @@ class EventsService:
         for key, value in event.model_dump().items():
             setattr(db_event, key, value)
 
+        change = await record_change(self.session, 'event', event_id, event_id, 'updated')
+
         await self.session.commit()
         await self.session.refresh(db_event)
 
+        change_notifier.notify(change.id)
+
         return schemas_events.EventResponse.model_validate(db_event, from_attributes=True)
 
     async def delete_event(self, event_id: int):
@@ -140,8 +179,13 @@ class EventsService:
             raise ValueError(f'Event with id {event_id} not found')
 
         await self.session.delete(event)
+
+        change = await record_change(self.session, 'event', event_id, event_id, 'deleted')
+
         await self.session.commit()
 
+        change_notifier.notify(change.id)
+
         return schemas_events.EventResponse.model_validate(event, from_attributes=True)
 
     async def add_member_to_event(self, event_id: int, member_data: schemas_members.MemberCreate) -> schemas_members.MemberResponse:
@@ -167,7 +211,7 @@ class EventsService:
             raise ValueError(f'Event with id {event_id} not found')
 
         try:
-            async with httpx.AsyncClient() as client:
+            async with httpx.AsyncClient(transport=ResilientTransport('events'), event_hooks=UPSTREAM_EVENT_HOOKS) as client:
                 response = await client.get(f'{self.users_service_url}/users/{member_data.user_id}')
                 
                 if response.status_code == 404:
@@ -201,9 +245,15 @@ class EventsService:
         )
         
         self.session.add(new_member)
+        await self.session.flush()
+
+        change = await record_change(self.session, 'member', new_member.id, event_id, 'created')
+
         await self.session.commit()
         await self.session.refresh(new_member)
 
+        change_notifier.notify(change.id)
+
         return schemas_members.MemberResponse.model_validate(new_member, from_attributes=True)
     
     async def get_members_by_event_id(self, event_id: int):
@@ -214,25 +264,52 @@ class EventsService:
             event_id: ID события
             
         Returns:
-            MemberListResponse: список участников события
+            Dict: {'members': [...]}, строки в форме MemberResponse
             
         Raises:
             ValueError: если событие не найдено
         """
         
         event_result = await self.session.execute(
-            select(EventModel).where(EventModel.id == event_id)
+            select(EventModel.id).where(EventModel.id == event_id)
         )
-        event = event_result.scalar_one_or_none()
-        
-        if not event:
+
+        if event_result.scalar_one_or_none() is None:
             raise ValueError(f'Event with id {event_id} not found')
-        
+
         result = await self.session.execute(
-            select(MemberModel).where(MemberModel.event_id == event_id)
+            select(*MEMBER_RESPONSE_COLUMNS).where(MemberModel.event_id == event_id)
         )
-        members = result.scalars().all()
-        
-        return schemas_members.MemberListResponse(
-            members=[schemas_members.MemberResponse.model_validate(member, from_attributes=True) for member in members]
-        )
\ No newline at end of file
+
+        return {'members': rows_as_dicts(result)}
+
+    async def count_members_by_event_id(self, event_id: int, role: typing.Optional[str] = None) -> int:
+        """
+        Получить количество участников события без выборки списка
+
+        Args:
+            event_id: ID события
+            role: учитывать только участников с этой ролью (без учета регистра)
+
+        Returns:
+            int: количество участников
+
+        Raises:
+            ValueError: если событие не найдено
+        """
+
+        event_result = await self.session.execute(
+            select(EventModel.id).where(EventModel.id == event_id)
+        )
+
+        if event_result.scalar_one_or_none() is None:
+            raise ValueError(f'Event with id {event_id} not found')
+
+        query = select(func.count(MemberModel.id)).where(MemberModel.event_id == event_id)
+
+        if role:
+            query = query.where(func.lower(MemberModel.role) == role.lower())
+
+        result = await self.session.execute(query)
+
+        return result.scalar() or 0
\ No newline at end of file
@@ -24,4 +24,17 @@ CREATE TABLE IF NOT EXISTS member (
     user_id INTEGER NOT NULL,
     role TEXT DEFAULT 'participant',
     UNIQUE(event_id, user_id)
-);
\ No newline at end of file
+);
+
+-- OUTBOX
+CREATE TABLE IF NOT EXISTS outbox (
+    id SERIAL PRIMARY KEY,
+    entity VARCHAR(50) NOT NULL,
+    entity_id INTEGER NOT NULL,
+    event_id INTEGER NOT NULL,
+    action VARCHAR(50) NOT NULL,
+    created_at TEXT NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS ix_outbox_event_id ON outbox (event_id);
+CREATE INDEX IF NOT EXISTS ix_outbox_entity_id ON outbox (entity, id);
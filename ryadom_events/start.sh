@@ -1,3 +1,3 @@
 #!/bin/sh
 
-uvicorn app.main:app --host 0.0.0.0 --port ${EVENTS_SERVICE_PORT} --reload
+exec python -m app.common.launcher app.main:app --host 0.0.0.0 --port ${EVENTS_SERVICE_PORT}
\ No newline at end of file
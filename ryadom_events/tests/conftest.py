@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Общие фикстуры тестов сервиса events.
+
+Пакет app подключается так же, как в бенчмарках (benchmarks/bootstrap.py),
+поэтому тесты каждого сервиса запускаются отдельно:
+
+    python -m pytest ryadom_events/tests
+
+use_service() переходит в каталог сервиса, как WORKDIR в Dockerfile:
+настройки не читают app.env из каталога запуска, и тесты запускаются
+из любого каталога.
+"""
+
+import os
+import sys
+
+import pytest
+
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'benchmarks'))
+
+from bootstrap import use_service  # noqa: E402
+
+use_service('events')
+
+
+@pytest.fixture
+def config():
+    from app.config import get_config
+
+    return get_config().model_copy(update={
+        'DB_LOG_LEVEL': 'WARNING',
+        'DB_READ_YOUR_WRITES_WINDOW': 0.2,
+        'DB_REPLICA_MAX_LAG': 1.0,
+        'DB_PIN_BACKEND': None,
+    })
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Маршрутизация DatabaseRouter на двух базах SQLite, которые заменяют
+основную базу и реплику: в каждой есть таблица node с именем базы,
+поэтому по ответу видно, куда ушел запрос.
+"""
+
+import asyncio
+import sqlite3
+import time
+
+import pytest
+
+from sqlalchemy import text
+
+
+def make_node(path: str, name: str) -> str:
+    with sqlite3.connect(path) as connection:
+        connection.execute('CREATE TABLE node (name TEXT NOT NULL)')
+        connection.execute('INSERT INTO node (name) VALUES (?)', (name,))
+
+    return f'sqlite+aiosqlite:///{path}'
+
+
+@pytest.fixture
+def urls(tmp_path):
+    return make_node(str(tmp_path / 'primary.sqlite3'), 'primary'), make_node(str(tmp_path / 'replica.sqlite3'), 'replica')
+
+
+def node_for(router, read_only: bool, client_key: str = 'client') -> str:
+    async def run():
+        session_maker = await router.session_maker_for(read_only, client_key)
+
+        async with session_maker() as session:
+            return (await session.execute(text('SELECT name FROM node'))).scalar()
+
+    return asyncio.run(run())
+
+
+def test_reads_go_to_replica_and_writes_to_primary(urls, config):
+    from app.common.database import DatabaseRouter
+
+    router = DatabaseRouter(urls[0], [urls[1]], config)
+
+    assert node_for(router, read_only=True) == 'replica'
+    assert node_for(router, read_only=False) == 'primary'
+
+
+def test_without_replicas_reads_go_to_primary(urls, config):
+    from app.common.database import DatabaseRouter
+
+    router = DatabaseRouter(urls[0], [], config)
+
+    assert node_for(router, read_only=True) == 'primary'
+
+
+def test_pinned_client_reads_primary_until_window_ends(urls, config):
+    from app.common.database import DatabaseRouter
+
+    router = DatabaseRouter(urls[0], [urls[1]], config)
+    asyncio.run(router.pin('writer'))
+
+    assert node_for(router, read_only=True, client_key='writer') == 'primary'
+    assert node_for(router, read_only=True, client_key='reader') == 'replica'
+
+    time.sleep(config.DB_READ_YOUR_WRITES_WINDOW + 0.05)
+
+    assert node_for(router, read_only=True, client_key='writer') == 'replica'
+
+
+def test_pins_are_shared_between_workers(urls, config, tmp_path):
+    from app.common.database import DatabaseRouter
+
+    config = config.model_copy(update={'DB_PIN_BACKEND': str(tmp_path / 'pins.sqlite3')})
+
+    # Два маршрутизатора с общим файлом закреплений — как два воркера gunicorn
+    writer_worker = DatabaseRouter(urls[0], [urls[1]], config)
+    reader_worker = DatabaseRouter(urls[0], [urls[1]], config)
+
+    asyncio.run(writer_worker.pin('writer'))
+
+    assert node_for(reader_worker, read_only=True, client_key='writer') == 'primary'
+
+    time.sleep(config.DB_READ_YOUR_WRITES_WINDOW + 0.05)
+
+    assert node_for(reader_worker, read_only=True, client_key='writer') == 'replica'
+
+
+def test_lagging_or_unreachable_replica_falls_back_to_primary(urls, config):
+    from app.common.database import DatabaseRouter
+
+    router = DatabaseRouter(urls[0], [urls[1]], config)
+
+    router.replica_lag[0] = config.DB_REPLICA_MAX_LAG + 1
+
+    assert node_for(router, read_only=True) == 'primary'
+
+    router.replica_lag[0] = None
+
+    assert node_for(router, read_only=True) == 'primary'
+
+    router.replica_lag[0] = config.DB_REPLICA_MAX_LAG / 2
+
+    assert node_for(router, read_only=True) == 'replica'
+
+
+def test_check_replicas_marks_failed_replica_unavailable(urls, config):
+    from app.common.database import DatabaseRouter
+
+    # Запрос отставания использует функции Postgres и на SQLite падает,
+    # как на недоступной реплике
+    router = DatabaseRouter(urls[0], [urls[1]], config)
+
+    asyncio.run(router.check_replicas())
+
+    assert router.replica_lag == [None]
+    assert node_for(router, read_only=True) == 'primary'
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+IdempotencyMiddleware поверх обработчика, который считает вызовы:
+два экземпляра middleware с общим файлом SQLite — как два воркера gunicorn.
+"""
+
+import asyncio
+import hashlib
+
+import httpx
+import pytest
+
+
+class Handler:
+
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.calls = 0
+
+    async def __call__(self, scope, receive, send):
+        await receive()
+
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+
+        await send({'type': 'http.response.start', 'status': 201, 'headers': [(b'content-type', b'application/json')]})
+        await send({'type': 'http.response.body', 'body': b'{"id":%d}' % self.calls})
+
+
+def post(app, body: bytes = b'{}', key: str = 'key-1'):
+    client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url='http://test')
+
+    async def run():
+        async with client:
+            return await client.post('/events/', content=body, headers={'Idempotency-Key': key})
+
+    return run()
+
+
+@pytest.fixture
+def idempotency_config(config, tmp_path):
+    return config.model_copy(update={'IDEMPOTENCY_BACKEND': str(tmp_path / 'idempotency.sqlite3')})
+
+
+def test_repeat_in_other_worker_is_replayed(idempotency_config):
+    from app.common.idempotency import IdempotencyMiddleware
+
+    handler = Handler()
+    workers = [IdempotencyMiddleware(handler, config=idempotency_config) for _ in range(2)]
+
+    async def run():
+        return await post(workers[0]), await post(workers[1])
+
+    first, second = asyncio.run(run())
+
+    assert handler.calls == 1
+    assert second.status_code == 201
+    assert second.content == first.content
+    assert second.headers['idempotent-replayed'] == 'true'
+
+
+def test_concurrent_duplicates_in_other_workers_run_once(idempotency_config):
+    from app.common.idempotency import IdempotencyMiddleware
+
+    handler = Handler(delay=0.2)
+    workers = [IdempotencyMiddleware(handler, config=idempotency_config) for _ in range(2)]
+
+    async def run():
+        return await asyncio.gather(*(post(workers[index % 2]) for index in range(6)))
+
+    responses = asyncio.run(run())
+
+    assert handler.calls == 1
+    assert {response.content for response in responses} == {b'{"id":1}'}
+
+
+def test_reused_key_with_other_body_is_rejected(idempotency_config):
+    from app.common.idempotency import IdempotencyMiddleware
+
+    handler = Handler()
+    workers = [IdempotencyMiddleware(handler, config=idempotency_config) for _ in range(2)]
+
+    async def run():
+        return await post(workers[0], b'{"a":1}'), await post(workers[1], b'{"a":2}')
+
+    _, second = asyncio.run(run())
+
+    assert second.status_code == 422
+    assert handler.calls == 1
+
+
+def test_abandoned_claim_is_taken_over_after_pending_timeout(idempotency_config):
+    from app.common.idempotency import IdempotencyMiddleware, SQLiteIdempotencyStore
+
+    store = SQLiteIdempotencyStore(idempotency_config.IDEMPOTENCY_BACKEND, ttl=60, max_entries=100, pending_timeout=0.1)
+    handler = Handler()
+
+    async def run():
+        # Ключ занят воркером, который завершился, не сохранив ответ
+        _, claimed = await store.claim('127.0.0.1 /events/ key-1', hashlib.sha256(b'{}').digest())
+        assert claimed
+
+        return await post(IdempotencyMiddleware(handler, store=store, config=idempotency_config))
+
+    response = asyncio.run(run())
+
+    assert response.status_code == 201
+    assert handler.calls == 1
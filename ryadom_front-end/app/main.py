@@ -3,17 +3,40 @@
 
 from fastapi import FastAPI, Request
 from fastapi.responses import RedirectResponse
-from fastapi.staticfiles import StaticFiles
 
+from app.common.client_address import setup_client_address
+from app.common.compression import setup_compression
+from app.common.metrics import setup_metrics
+from app.common.profiling import setup_profiling
+from app.common.resilience import setup_resilience
+from app.common.responses import ORJSONResponse
+from app.common.tracing import setup_tracing
 from app.config import get_config
 from app.routes.routes import router
+from app.utils.assets import PrecompressedStaticFiles, build_static_assets
 
 
 config = get_config()
 
-app = FastAPI(docs_url=config.DOCS_URL, redoc_url=config.REDOC_URL, openapi_url=config.OPENAPI_URL)
-
-app.mount('/static', StaticFiles(directory='app/static'), name='static')
+app = FastAPI(
+    docs_url=config.DOCS_URL, redoc_url=config.REDOC_URL, openapi_url=config.OPENAPI_URL,
+    default_response_class=ORJSONResponse
+)
+
+setup_metrics(app, 'front_end')
+setup_tracing(app, 'front_end')
+setup_profiling(app)
+setup_resilience(app)
+setup_client_address(app)
+setup_compression(app)
+
+build_static_assets(static_dir='app/static', build_dir='app/static_dist')
+
+app.mount(
+    '/static',
+    PrecompressedStaticFiles(directory='app/static', build_directory='app/static_dist'),
+    name='static'
+)
 app.include_router(router)
 
 
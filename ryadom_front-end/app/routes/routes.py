@@ -1,12 +1,17 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
+import asyncio
+import json
 import typing
+import httpx
 
 from fastapi import APIRouter, Depends, HTTPException, Request, Query
-from fastapi.responses import FileResponse, HTMLResponse
+from fastapi.responses import FileResponse, HTMLResponse, Response, StreamingResponse
 
 from app.services.front_end_service import FrontEndService
+from app.services.images_service import IMAGE_FORMATS, ImagesService
+from app.services.participants_broadcaster import participants_broadcaster
 
 
 router = APIRouter(tags=['frontend'])
@@ -16,11 +21,38 @@ async def get_front_end_service():
     return FrontEndService()
 
 
+async def get_images_service():
+    return ImagesService()
+
+
 @router.get('/favicon.ico', include_in_schema=False)
 async def favicon(request: Request, service: FrontEndService = Depends(get_front_end_service)):
     return FileResponse('app/static/src/img/favicon.svg')
 
 
+@router.get('/images/{width}', include_in_schema=False)
+async def image(
+    request: Request,
+    width: int,
+    src: str = Query(..., description='URL или путь /static/... исходного изображения'),
+    service: ImagesService = Depends(get_images_service)
+):
+    image_format = service.negotiate_format(request.headers.get('accept'))
+
+    variant_path, etag = await service.get_variant(src, width, image_format)
+
+    headers = {
+        'ETag': etag,
+        'Cache-Control': 'public, max-age=86400',
+        'Vary': 'Accept',
+    }
+
+    if request.headers.get('if-none-match') == etag:
+        return Response(status_code=304, headers=headers)
+
+    return FileResponse(variant_path, media_type=IMAGE_FORMATS[image_format], headers=headers)
+
+
 @router.get('/', response_class=HTMLResponse)
 async def home(
     request: Request,
@@ -42,6 +74,33 @@ async def events(request: Request, event_id: int, service: FrontEndService = Dep
         raise HTTPException(status_code=500, detail=str(e))
     
 
+@router.get('/event/{event_id}/live', include_in_schema=False)
+async def event_live(request: Request, event_id: int):
+    if participants_broadcaster.subscribers_count >= participants_broadcaster.max_subscribers:
+        raise HTTPException(status_code=503, detail='Too many live subscribers')
+
+    async def event_stream():
+        try:
+            async with participants_broadcaster.subscribe(event_id) as subscription:
+                while True:
+                    try:
+                        message = await asyncio.wait_for(subscription.get(), timeout=15)
+                    except asyncio.TimeoutError:
+                        yield ': keepalive\n\n'
+                        continue
+
+                    yield f'data: {json.dumps(message)}\n\n'
+
+        except (OverflowError, httpx.HTTPError):
+            yield 'event: close\ndata: {}\n\n'
+
+    return StreamingResponse(
+        event_stream(),
+        media_type='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+    
+
 @router.get('/login', response_class=HTMLResponse)
 async def login(request: Request, service: FrontEndService = Depends(get_front_end_service)):
     try:
@@ -3,6 +3,7 @@
 
 import os
 import httpx
+import orjson
 
 from datetime import date, datetime, timedelta
 from fastapi import APIRouter, Request, HTTPException
@@ -10,11 +11,29 @@ from fastapi.responses import HTMLResponse
 from fastapi.templating import Jinja2Templates
 from typing import *
 
+from app.common.client_address import forwarding_headers
+from app.common.http_cache import ValidatorCache
+from app.common.metrics import upstream_event_hooks
+from app.common.resilience import ResilientTransport
+from app.common.tracing import combine_event_hooks, traceparent_event_hooks, tracer
+from app.utils.assets import static_url
+from app.utils.images import image_srcset, image_url
 from app.utils.url import update_query_params
 
 
 router = APIRouter()
 
+UPSTREAM_EVENT_HOOKS = combine_event_hooks(upstream_event_hooks('front_end'), traceparent_event_hooks())
+
+# Локальные копии ответов edge-router, перепроверяемые по ETag
+validator_cache = ValidatorCache()
+
+# Поля, которые шаблоны выводят в карточках событий и слайдере главной страницы
+EVENT_CARD_FIELDS = 'id,name,date,start_time,category,photo,banner,address'
+
+# Поля организатора на странице события
+ORGANIZER_FIELDS = 'id,name,photo'
+
 
 class FrontEndService:
     
@@ -23,6 +42,9 @@ class FrontEndService:
         
         self.templates = Jinja2Templates(directory='app/templates')
         self.templates.env.globals["request_context"] = self.request_context
+        self.templates.env.globals["static_url"] = static_url
+        self.templates.env.globals["image_url"] = image_url
+        self.templates.env.globals["image_srcset"] = image_srcset
 
     def request_context(self, request: Request):
         return {
@@ -49,10 +71,11 @@ class FrontEndService:
 
         context.setdefault('request', request)
 
-        return self.templates.TemplateResponse(
-            name=template_name, 
-            context=context
-        )
+        with tracer.span('render_template', template=template_name):
+            return self.templates.TemplateResponse(
+                name=template_name, 
+                context=context
+            )
     
     async def get_event_data(self, event_id: int) -> dict:
         
@@ -71,8 +94,8 @@ class FrontEndService:
             HTTPException: 503 - Service unavailable, request error
         """
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.get(f'{self.edge_router_service_url}/api/events/{event_id}')
+            async with httpx.AsyncClient(headers=forwarding_headers(), transport=ResilientTransport('front_end'), event_hooks=UPSTREAM_EVENT_HOOKS) as client:
+                response = await validator_cache.get(client, f'{self.edge_router_service_url}/api/events/{event_id}')
                 
                 if response.status_code == 404:
                     raise HTTPException(status_code=404, detail="Event not found")
@@ -106,15 +129,19 @@ class FrontEndService:
             HTTPException: 503 - Service unavailable, request error
         """
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.get(f'{self.edge_router_service_url}/api/events/')
+            async with httpx.AsyncClient(headers=forwarding_headers(), transport=ResilientTransport('front_end'), event_hooks=UPSTREAM_EVENT_HOOKS) as client:
+                response = await validator_cache.get(
+                    client,
+                    f'{self.edge_router_service_url}/api/events/',
+                    params={'fields': EVENT_CARD_FIELDS}
+                )
                 
                 if response.status_code == 404:
                     return []
 
                 response.raise_for_status()
 
-                data = response.json()
+                data = orjson.loads(response.content)
 
                 if 'events' not in data:
                     raise HTTPException(
@@ -182,17 +209,22 @@ class FrontEndService:
 
         is_past = date.fromisoformat(event_data['date']) < date.today()
 
-        organizers_ids = await self._get_event_organizers(event_data['id'])
+        members = await self._get_event_members(event_data['id']) or []
+
+        organizers_ids = [member for member in members if member.get("role", "").lower() == "organizer"]
 
         organizers = [await self._get_user_data(organizer['user_id']) for organizer in organizers_ids]
 
+        participants_count = sum(1 for member in members if member.get("role", "").lower() == "participant")
+
         context = {
             'title': f'Ryadom | {event_data['name']}',
             'event_data': event_data,
             'category': self._get_russian_category_name(event_data['category']),
             'human_date': self._get_human_date(event_data['date']),
             'is_past': is_past,
-            'organizers': organizers
+            'organizers': organizers,
+            'participants_count': participants_count
         }
 
         return self.render_template(
@@ -368,8 +400,9 @@ class FrontEndService:
             HTTPException: При ошибках запроса к сервису
         """
         try:
-            async with httpx.AsyncClient(timeout=5.0) as client:
-                response = await client.get(
+            async with httpx.AsyncClient(timeout=5.0, headers=forwarding_headers(), transport=ResilientTransport('front_end'), event_hooks=UPSTREAM_EVENT_HOOKS) as client:
+                response = await validator_cache.get(
+                    client,
                     f'{self.edge_router_service_url}/api/events/{event_id}/members/',
                     headers={"Accept": "application/json"}
                 )
@@ -383,32 +416,14 @@ class FrontEndService:
             if e.response.status_code == 404:
                 return []
 
-    async def _get_event_organizers(self, event_id) -> List[Dict[str, Any]]:
-        """
-        Получить только организаторов события
-        
-        Args:
-            event_id: ID события
-            
-        Returns:
-            List[Dict]: Список организаторов события
-            
-        Raises:
-            HTTPException: При ошибках запроса к сервису
-        """
-        all_members = await self._get_event_members(event_id)
-        
-        organizers = [
-            member for member in all_members 
-            if member.get("role", "").lower() == "organizer"
-        ]
-        
-        return organizers
-    
     async def _get_user_data(self, user_id):
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.get(f'{self.edge_router_service_url}/api/users/{user_id}')
+            async with httpx.AsyncClient(headers=forwarding_headers(), transport=ResilientTransport('front_end'), event_hooks=UPSTREAM_EVENT_HOOKS) as client:
+                response = await validator_cache.get(
+                    client,
+                    f'{self.edge_router_service_url}/api/users/{user_id}',
+                    params={'fields': ORGANIZER_FIELDS}
+                )
 
                 if response.status_code == 404:
                     raise HTTPException(status_code=404, detail="User not found")
@@ -0,0 +1,357 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import asyncio
+import hashlib
+import ipaddress
+import os
+import socket
+import httpx
+
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from fastapi import HTTPException
+from typing import Dict, Optional, Tuple
+from urllib.parse import urlparse
+
+from app.common.disk_cache import DiskCacheLimit
+
+
+IMAGE_WIDTHS = (160, 320, 640, 960, 1280)
+
+IMAGE_FORMATS = {
+    'avif': 'image/avif',
+    'webp': 'image/webp',
+    'jpeg': 'image/jpeg',
+}
+
+IMAGE_QUALITY = {
+    'avif': 55,
+    'webp': 75,
+    'jpeg': 80,
+}
+
+MAX_SOURCE_SIZE = 20 * 1024 * 1024
+
+DEFAULT_ALLOWED_HOSTS = 'storage.yandexcloud.net'
+
+
+@lru_cache(maxsize=1)
+def avif_supported() -> bool:
+    """
+    Есть ли в установленном Pillow кодировщик AVIF (в колесах Pillow он есть с 11.3)
+    """
+    try:
+        from PIL import features
+
+        return bool(features.check('avif'))
+    except (ImportError, ValueError):
+        return False
+
+
+def _render_variant(source_path: str, target_path: str, width: int, image_format: str) -> None:
+    """
+    Уменьшает изображение до заданной ширины и сохраняет в нужном формате.
+    Выполняется в отдельном процессе.
+    """
+    from PIL import Image, ImageOps
+
+    with Image.open(source_path) as image:
+        image = ImageOps.exif_transpose(image)
+
+        if image.width > width:
+            height = round(image.height * width / image.width)
+            image = image.resize((width, height), Image.Resampling.LANCZOS)
+
+        if image_format == 'jpeg' and image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+
+        tmp_path = f'{target_path}.{os.getpid()}.tmp'
+        image.save(tmp_path, format=image_format.upper(), quality=IMAGE_QUALITY[image_format])
+
+    os.replace(tmp_path, target_path)
+
+
+class ImagesService:
+    """
+    Генерация уменьшенных копий изображений событий и пользователей.
+
+    Исходники и варианты хранятся на диске по хэшу содержимого:
+        sources/<sha256>
+        variants/<sha256>/<width>.<format>
+
+    Размер каталога ограничен IMAGES_CACHE_MAX_BYTES. Удаленные исходники
+    скачиваются только с хостов из IMAGES_ALLOWED_HOSTS и только если
+    имя хоста разрешается в публичные адреса.
+    """
+
+    _executor: Optional[ProcessPoolExecutor] = None
+    _source_index: 'OrderedDict[str, str]' = OrderedDict()
+    _source_index_size = 4096
+    _locks: Dict[str, asyncio.Lock] = {}
+    _cache_limits: Dict[str, DiskCacheLimit] = {}
+
+    def __init__(self):
+        self.cache_dir = os.getenv("IMAGES_CACHE_DIR", "app/images_cache")
+        self.static_dirs = ('app/static_dist', 'app/static')
+        # Пустой список — принимаются только исходники из статики
+        self.allowed_hosts = {
+            host.strip()
+            for host in os.getenv("IMAGES_ALLOWED_HOSTS", DEFAULT_ALLOWED_HOSTS).split(',')
+            if host.strip()
+        }
+
+        # Счетчик размера общий для всех экземпляров сервиса в процессе
+        self.cache_limit = self._cache_limits.get(self.cache_dir)
+
+        if self.cache_limit is None:
+            self.cache_limit = self._cache_limits[self.cache_dir] = DiskCacheLimit(
+                self.cache_dir, int(os.getenv("IMAGES_CACHE_MAX_BYTES", str(1024 ** 3)))
+            )
+
+    @classmethod
+    def _get_executor(cls) -> ProcessPoolExecutor:
+        if cls._executor is None:
+            cls._executor = ProcessPoolExecutor(max_workers=int(os.getenv("IMAGES_WORKERS", "2")))
+
+        return cls._executor
+
+    @classmethod
+    def _get_lock(cls, key: str) -> asyncio.Lock:
+        lock = cls._locks.get(key)
+
+        if lock is None:
+            lock = cls._locks[key] = asyncio.Lock()
+
+        return lock
+
+    def negotiate_format(self, accept: Optional[str]) -> str:
+        """
+        Выбирает формат варианта по заголовку Accept
+        """
+        accept = accept or ''
+
+        if 'image/avif' in accept and avif_supported():
+            return 'avif'
+
+        if 'image/webp' in accept:
+            return 'webp'
+
+        return 'jpeg'
+
+    def snap_width(self, width: int) -> int:
+        """
+        Приводит запрошенную ширину к ближайшей допустимой не меньше нее
+        """
+        for allowed_width in IMAGE_WIDTHS:
+            if allowed_width >= width:
+                return allowed_width
+
+        return IMAGE_WIDTHS[-1]
+
+    def _resolve_static_path(self, src: str) -> Optional[str]:
+        relative_path = src.removeprefix('/static/')
+
+        for directory in self.static_dirs:
+            directory = os.path.realpath(directory)
+            full_path = os.path.realpath(os.path.join(directory, relative_path))
+
+            if os.path.commonpath([full_path, directory]) == directory and os.path.isfile(full_path):
+                return full_path
+
+        return None
+
+    @staticmethod
+    async def _resolve_public_address(hostname: str) -> str:
+        """
+        Разрешить имя хоста и убедиться, что все его адреса публичные,
+        чтобы через ресайзер нельзя было обратиться к внутренним сервисам,
+        localhost или метаданным облака
+
+        Raises:
+            HTTPException: 400 - Source is not allowed
+            HTTPException: 502 - Source request failed
+        """
+        try:
+            infos = await asyncio.get_running_loop().getaddrinfo(hostname, None, type=socket.SOCK_STREAM)
+        except (socket.gaierror, UnicodeError):
+            raise HTTPException(status_code=502, detail="Source request failed")
+
+        addresses = [ipaddress.ip_address(info[4][0]) for info in infos]
+
+        if not addresses or not all(address.is_global for address in addresses):
+            raise HTTPException(status_code=400, detail="Source is not allowed")
+
+        return str(addresses[0])
+
+    async def _read_source(self, src: str) -> bytes:
+        """
+        Читает исходное изображение из статики или по разрешенному URL
+
+        Raises:
+            HTTPException: 400 - Source is not allowed
+            HTTPException: 404 - Source not found
+            HTTPException: 502 - Source request failed
+        """
+        if src.startswith('/static/'):
+            path = self._resolve_static_path(src)
+
+            if path is None:
+                raise HTTPException(status_code=404, detail="Source not found")
+
+            with open(path, 'rb') as file:
+                return file.read()
+
+        parsed = urlparse(src)
+
+        if parsed.scheme not in ('http', 'https') or parsed.hostname not in self.allowed_hosts:
+            raise HTTPException(status_code=400, detail="Source is not allowed")
+
+        address = await self._resolve_public_address(parsed.hostname)
+
+        try:
+            url = httpx.URL(src)
+
+            # Соединение идет на уже проверенный адрес: повторное разрешение
+            # имени в httpx могло бы вернуть другой (DNS rebinding).
+            # Host и SNI остаются исходными, сертификат проверяется по имени
+            async with httpx.AsyncClient(timeout=10.0) as client:
+                async with client.stream(
+                    'GET',
+                    url.copy_with(host=address),
+                    headers={'Host': url.netloc.decode('ascii')},
+                    extensions={'sni_hostname': url.host}
+                ) as response:
+                    if response.status_code == 404:
+                        raise HTTPException(status_code=404, detail="Source not found")
+
+                    response.raise_for_status()
+
+                    if int(response.headers.get('content-length') or 0) > MAX_SOURCE_SIZE:
+                        raise HTTPException(status_code=400, detail="Source is too large")
+
+                    chunks = []
+                    size = 0
+
+                    # Content-Length может отсутствовать или не соответствовать телу
+                    async for chunk in response.aiter_bytes():
+                        size += len(chunk)
+
+                        if size > MAX_SOURCE_SIZE:
+                            raise HTTPException(status_code=400, detail="Source is too large")
+
+                        chunks.append(chunk)
+
+        except httpx.HTTPError:
+            raise HTTPException(status_code=502, detail="Source request failed")
+
+        return b''.join(chunks)
+
+    async def _get_source_hash(self, src: str) -> str:
+        """
+        Возвращает хэш содержимого исходника, при необходимости скачивая его
+        """
+        source_hash = self._source_index.get(src)
+
+        if source_hash is not None:
+            self._source_index.move_to_end(src)
+
+            source_path = os.path.join(self.cache_dir, 'sources', source_hash)
+
+            if os.path.isfile(source_path):
+                self.cache_limit.touch(source_path)
+
+                return source_hash
+
+        try:
+            async with self._get_lock(f'source:{src}'):
+                source_hash = self._source_index.get(src)
+
+                if source_hash is not None and os.path.isfile(os.path.join(self.cache_dir, 'sources', source_hash)):
+                    return source_hash
+
+                data = await self._read_source(src)
+                source_hash = hashlib.sha256(data).hexdigest()
+
+                source_path = os.path.join(self.cache_dir, 'sources', source_hash)
+
+                if not os.path.isfile(source_path):
+                    os.makedirs(os.path.dirname(source_path), exist_ok=True)
+
+                    tmp_path = f'{source_path}.{os.getpid()}.tmp'
+
+                    with open(tmp_path, 'wb') as file:
+                        file.write(data)
+
+                    os.replace(tmp_path, source_path)
+
+                    await self.cache_limit.added(len(data))
+
+                self._source_index[src] = source_hash
+
+                while len(self._source_index) > self._source_index_size:
+                    self._source_index.popitem(last=False)
+
+        finally:
+            self._locks.pop(f'source:{src}', None)
+
+        return source_hash
+
+    async def get_variant(self, src: str, width: int, image_format: str) -> Tuple[str, str]:
+        """
+        Получить путь к уменьшенной копии изображения, создав ее при первом запросе
+
+        Args:
+            src: URL или путь /static/... исходного изображения
+            width: требуемая ширина
+            image_format: avif, webp или jpeg
+
+        Returns:
+            Tuple[str, str]: путь к файлу варианта и его ETag
+
+        Raises:
+            HTTPException: 400 - Unsupported image format
+            HTTPException: 422 - Image could not be processed
+        """
+        if image_format not in IMAGE_FORMATS:
+            raise HTTPException(status_code=400, detail="Unsupported image format")
+
+        width = self.snap_width(width)
+        source_hash = await self._get_source_hash(src)
+
+        etag = f'"{source_hash[:16]}-{width}-{image_format}"'
+        variant_path = os.path.join(self.cache_dir, 'variants', source_hash, f'{width}.{image_format}')
+
+        if os.path.isfile(variant_path):
+            self.cache_limit.touch(variant_path)
+
+            return variant_path, etag
+
+        key = f'variant:{variant_path}'
+
+        try:
+            async with self._get_lock(key):
+                if not os.path.isfile(variant_path):
+                    os.makedirs(os.path.dirname(variant_path), exist_ok=True)
+
+                    loop = asyncio.get_running_loop()
+
+                    try:
+                        await loop.run_in_executor(
+                            self._get_executor(),
+                            _render_variant,
+                            os.path.join(self.cache_dir, 'sources', source_hash),
+                            variant_path,
+                            width,
+                            image_format
+                        )
+                    except Exception:
+                        raise HTTPException(status_code=422, detail="Image could not be processed")
+
+                    await self.cache_limit.added(os.path.getsize(variant_path))
+
+        finally:
+            self._locks.pop(key, None)
+
+        return variant_path, etag
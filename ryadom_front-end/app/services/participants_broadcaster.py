@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import asyncio
+import contextlib
+import os
+import httpx
+
+from typing import *
+
+from app.common.metrics import upstream_event_hooks
+from app.common.resilience import ResilientTransport
+from app.common.tracing import combine_event_hooks, traceparent_event_hooks
+
+
+UPSTREAM_EVENT_HOOKS = combine_event_hooks(upstream_event_hooks('front_end'), traceparent_event_hooks())
+
+
+class Subscription:
+    """
+    Подписка одного браузера на счетчик участников события.
+
+    Очередь ограничена: если клиент не успевает читать, самое старое
+    сообщение отбрасывается — каждое сообщение содержит полный счетчик,
+    поэтому достаточно доставить последнее.
+    """
+
+    def __init__(self, event_id: int, queue_size: int):
+        self.event_id = event_id
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.dropped = 0
+
+    def put(self, message: Dict[str, Any]) -> None:
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+
+        self.queue.put_nowait(message)
+
+    async def get(self) -> Dict[str, Any]:
+        return await self.queue.get()
+
+
+class _Topic:
+
+    def __init__(self, event_id: int, count: int):
+        self.event_id = event_id
+        self.count = count
+        self.subscribers: Set[Subscription] = set()
+
+
+class ParticipantsBroadcaster:
+    """
+    Раздает изменения количества участников событий подключенным браузерам.
+
+    На все события процесса приходится одна подписка на ленту изменений
+    сервиса событий (/api/changes); счетчик события запрашивается один
+    раз на изменение, независимо от количества подписчиков.
+    """
+
+    def __init__(
+        self,
+        fetch_count: Callable[[int], Awaitable[int]],
+        fetch_head: Callable[[], Awaitable[int]],
+        fetch_changes: Callable[[int], Awaitable[Dict[str, Any]]],
+        queue_size: int = 4,
+        max_subscribers: int = 10000
+    ):
+        self.fetch_count = fetch_count
+        self.fetch_head = fetch_head
+        self.fetch_changes = fetch_changes
+
+        self.queue_size = queue_size
+        self.max_subscribers = max_subscribers
+
+        self.subscribers_count = 0
+
+        self._topics: Dict[int, _Topic] = {}
+        self._topic_locks: Dict[int, asyncio.Lock] = {}
+        self._upstream_task: Optional[asyncio.Task] = None
+
+    @contextlib.asynccontextmanager
+    async def subscribe(self, event_id: int) -> AsyncIterator[Subscription]:
+        """
+        Подписаться на счетчик участников события.
+        Первое сообщение подписки — текущее значение счетчика.
+
+        Raises:
+            OverflowError: если достигнут лимит подключений
+        """
+        if self.subscribers_count >= self.max_subscribers:
+            raise OverflowError('Too many live subscribers')
+
+        self.subscribers_count += 1
+        subscription = Subscription(event_id, self.queue_size)
+
+        try:
+            topic = await self._get_topic(event_id)
+
+            topic.subscribers.add(subscription)
+            subscription.put({'event_id': event_id, 'count': topic.count, 'delta': 0})
+
+            self._ensure_upstream()
+
+            yield subscription
+
+        finally:
+            self.subscribers_count -= 1
+
+            topic = self._topics.get(event_id)
+
+            if topic is not None:
+                topic.subscribers.discard(subscription)
+
+                if not topic.subscribers:
+                    del self._topics[event_id]
+
+    async def _get_topic(self, event_id: int) -> _Topic:
+        topic = self._topics.get(event_id)
+
+        if topic is not None:
+            return topic
+
+        lock = self._topic_locks.setdefault(event_id, asyncio.Lock())
+
+        try:
+            async with lock:
+                topic = self._topics.get(event_id)
+
+                if topic is None:
+                    topic = self._topics[event_id] = _Topic(event_id, await self.fetch_count(event_id))
+
+        finally:
+            if not lock.locked():
+                self._topic_locks.pop(event_id, None)
+
+        return topic
+
+    def publish(self, event_id: int, count: int) -> None:
+        """
+        Разослать новое значение счетчика всем подписчикам события
+        """
+        topic = self._topics.get(event_id)
+
+        if topic is None or topic.count == count:
+            return
+
+        message = {'event_id': event_id, 'count': count, 'delta': count - topic.count}
+        topic.count = count
+
+        for subscription in topic.subscribers:
+            subscription.put(message)
+
+    def _ensure_upstream(self) -> None:
+        if self._upstream_task is None or self._upstream_task.done():
+            self._upstream_task = asyncio.create_task(self._consume_changes())
+
+    async def _consume_changes(self) -> None:
+        since = None
+
+        while self._topics:
+            try:
+                if since is None:
+                    since = await self.fetch_head()
+
+                data = await self.fetch_changes(since)
+
+            except asyncio.CancelledError:
+                raise
+
+            except Exception:
+                await asyncio.sleep(1)
+                continue
+
+            since = data.get('last_id', since)
+
+            changed = {change['event_id'] for change in data.get('changes', [])} & self._topics.keys()
+
+            for event_id in changed:
+                try:
+                    self.publish(event_id, await self.fetch_count(event_id))
+                except asyncio.CancelledError:
+                    raise
+                except Exception:
+                    continue
+
+
+class EdgeRouterParticipantsSource:
+    """
+    Источник данных для ParticipantsBroadcaster через edge-router
+    """
+
+    def __init__(self):
+        self.edge_router_service_url = os.getenv("EDGE_ROUTER_SERVICE_URL")
+
+    async def fetch_count(self, event_id: int) -> int:
+        async with httpx.AsyncClient(timeout=5.0, transport=ResilientTransport('front_end'), event_hooks=UPSTREAM_EVENT_HOOKS) as client:
+            response = await client.get(
+                f'{self.edge_router_service_url}/api/events/{event_id}/members/count',
+                params={'role': 'participant'}
+            )
+
+            if response.status_code == 404:
+                return 0
+
+            response.raise_for_status()
+
+            return response.json()['count']
+
+    async def fetch_head(self) -> int:
+        async with httpx.AsyncClient(timeout=5.0, transport=ResilientTransport('front_end'), event_hooks=UPSTREAM_EVENT_HOOKS) as client:
+            response = await client.get(f'{self.edge_router_service_url}/api/changes/head')
+
+            response.raise_for_status()
+
+            return response.json()['last_id']
+
+    async def fetch_changes(self, since: int) -> Dict[str, Any]:
+        async with httpx.AsyncClient(timeout=35.0, transport=ResilientTransport('front_end'), event_hooks=UPSTREAM_EVENT_HOOKS) as client:
+            response = await client.get(
+                f'{self.edge_router_service_url}/api/changes',
+                params={'since': since, 'wait': 25, 'limit': 1000}
+            )
+
+            response.raise_for_status()
+
+            return response.json()
+
+
+_source = EdgeRouterParticipantsSource()
+
+participants_broadcaster = ParticipantsBroadcaster(
+    fetch_count=_source.fetch_count,
+    fetch_head=_source.fetch_head,
+    fetch_changes=_source.fetch_changes,
+    max_subscribers=int(os.getenv("LIVE_MAX_SUBSCRIBERS", "10000"))
+)
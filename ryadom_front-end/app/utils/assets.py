@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import shutil
+
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+from starlette.types import Scope
+from typing import *
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+STATIC_URL_PREFIX = '/static'
+MANIFEST_FILENAME = 'manifest.json'
+
+COMPRESSIBLE_EXTENSIONS = {'.css', '.js', '.svg', '.html', '.json', '.txt', '.ico'}
+COMPRESSION_MIN_SIZE = 256
+
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+_manifest: Dict[str, str] = {}
+
+
+def _file_hash(path: str) -> str:
+    digest = hashlib.sha256()
+
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(65536), b''):
+            digest.update(chunk)
+
+    return digest.hexdigest()[:12]
+
+
+def _write_compressed_variants(path: str, data: bytes) -> None:
+    """
+    Сохраняет рядом с файлом .gz и .br варианты, если они меньше оригинала
+    """
+    gzipped = gzip.compress(data, compresslevel=9, mtime=0)
+
+    if len(gzipped) < len(data):
+        with open(f'{path}.gz', 'wb') as file:
+            file.write(gzipped)
+
+    if brotli is not None:
+        brotlied = brotli.compress(data, quality=11)
+
+        if len(brotlied) < len(data):
+            with open(f'{path}.br', 'wb') as file:
+                file.write(brotlied)
+
+
+def build_static_assets(static_dir: str, build_dir: str) -> Dict[str, str]:
+    """
+    Собирает статику: добавляет хэш содержимого в имя файла, создает
+    сжатые gzip/brotli варианты и сохраняет манифест путей
+
+    Args:
+        static_dir: директория с исходной статикой
+        build_dir: директория для собранных файлов
+
+    Returns:
+        Dict[str, str]: манифест вида {'css/main.css': 'css/main.<hash>.css'}
+    """
+    global _manifest
+
+    shutil.rmtree(build_dir, ignore_errors=True)
+    os.makedirs(build_dir, exist_ok=True)
+
+    manifest = {}
+
+    for root, _, files in os.walk(static_dir):
+        for filename in sorted(files):
+            source_path = os.path.join(root, filename)
+            relative_path = os.path.relpath(source_path, static_dir).replace(os.sep, '/')
+
+            name, extension = os.path.splitext(relative_path)
+            fingerprinted_path = f'{name}.{_file_hash(source_path)}{extension}'
+
+            target_path = os.path.join(build_dir, fingerprinted_path)
+            os.makedirs(os.path.dirname(target_path), exist_ok=True)
+            shutil.copyfile(source_path, target_path)
+
+            if extension.lower() in COMPRESSIBLE_EXTENSIONS:
+                with open(source_path, 'rb') as file:
+                    data = file.read()
+
+                if len(data) >= COMPRESSION_MIN_SIZE:
+                    _write_compressed_variants(target_path, data)
+
+            manifest[relative_path] = fingerprinted_path
+
+    with open(os.path.join(build_dir, MANIFEST_FILENAME), 'w', encoding='utf-8') as file:
+        json.dump(manifest, file, ensure_ascii=False, indent=2)
+
+    _manifest = manifest
+
+    return manifest
+
+
+def static_url(path: str) -> str:
+    """
+    Возвращает URL статического файла с хэшем содержимого в имени.
+    Если файла нет в манифесте, возвращает обычный путь.
+
+    Пример:
+        static_url('css/main.css') -> '/static/css/main.3f2a9c1b7d4e.css'
+    """
+    path = path.lstrip('/')
+
+    return f'{STATIC_URL_PREFIX}/{_manifest.get(path, path)}'
+
+
+class PrecompressedStaticFiles(StaticFiles):
+    """
+    StaticFiles, который сначала ищет файл среди собранной статики,
+    отдает заранее сжатые варианты по Accept-Encoding и помечает
+    файлы с хэшем в имени как immutable
+    """
+
+    ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+    def __init__(self, *, directory: str, build_directory: str, **kwargs):
+        super().__init__(directory=directory, **kwargs)
+
+        self.build_directory = build_directory
+        self.all_directories = [build_directory, *self.all_directories]
+
+    def _accepted_encodings(self, headers: Headers) -> Set[str]:
+        accept_encoding = headers.get('accept-encoding', '')
+
+        accepted = set()
+
+        for value in accept_encoding.split(','):
+            coding, _, params = value.partition(';')
+            quality = params.strip().removeprefix('q=')
+
+            if quality and quality.strip('0.') == '':
+                continue
+
+            accepted.add(coding.strip().lower())
+
+        return accepted
+
+    def file_response(
+        self,
+        full_path: Union[str, os.PathLike],
+        stat_result: os.stat_result,
+        scope: Scope,
+        status_code: int = 200,
+    ) -> Response:
+        request_headers = Headers(scope=scope)
+        full_path = str(full_path)
+
+        media_type = mimetypes.guess_type(full_path)[0] or 'text/plain'
+        response_path = full_path
+        headers = {}
+
+        is_fingerprinted = full_path.startswith(os.path.realpath(self.build_directory))
+
+        if is_fingerprinted:
+            headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+
+            accepted = self._accepted_encodings(request_headers)
+
+            for encoding, suffix in self.ENCODINGS:
+                if encoding in accepted and os.path.isfile(full_path + suffix):
+                    response_path = full_path + suffix
+                    stat_result = os.stat(response_path)
+                    headers['Content-Encoding'] = encoding
+                    break
+
+            headers['Vary'] = 'Accept-Encoding'
+
+        response = FileResponse(
+            response_path,
+            status_code=status_code,
+            stat_result=stat_result,
+            media_type=media_type,
+            headers=headers,
+        )
+
+        if self.is_not_modified(response.headers, request_headers):
+            return NotModifiedResponse(response.headers)
+
+        return response
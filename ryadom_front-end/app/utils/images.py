@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from urllib.parse import urlencode
+from typing import *
+
+from app.utils.assets import static_url
+
+
+LIST_IMAGE_WIDTHS = (320, 640, 960)
+
+
+def image_url(src: Optional[str], width: int, fallback: Optional[str] = None) -> str:
+    """
+    Возвращает URL уменьшенной копии изображения.
+    Если src пустой, используется файл статики fallback.
+
+    Пример:
+        image_url("https://.../event.png", 320) -> "/images/320?src=https%3A%2F%2F...%2Fevent.png"
+    """
+    if not src:
+        if fallback is None:
+            return ''
+
+        src = static_url(fallback)
+
+    return f'/images/{width}?{urlencode({"src": src})}'
+
+
+def image_srcset(src: Optional[str], widths: Sequence[int] = LIST_IMAGE_WIDTHS, fallback: Optional[str] = None) -> str:
+    """
+    Возвращает значение атрибута srcset для набора ширин
+
+    Пример:
+        image_srcset(src, (320, 640)) -> "/images/320?src=... 320w, /images/640?src=... 640w"
+    """
+    return ', '.join(f'{image_url(src, width, fallback)} {width}w' for width in widths)
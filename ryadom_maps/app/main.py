@@ -1,13 +1,50 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
+import asyncio
+
 from fastapi import FastAPI
 
+from app.common.compression import setup_compression
+from app.common.metrics import setup_metrics
+from app.common.profiling import setup_profiling
+from app.common.resilience import setup_resilience
+from app.common.responses import ORJSONResponse
+from app.common.tracing import setup_tracing
 from app.config import get_config
 from app.routes.routes import router
+from app.services.maps_service import MapsService
 
 
 config = get_config()
 
-app = FastAPI(docs_url=config.DOCS_URL, redoc_url=config.REDOC_URL, openapi_url=config.OPENAPI_URL)
+app = FastAPI(
+    docs_url=config.DOCS_URL, redoc_url=config.REDOC_URL, openapi_url=config.OPENAPI_URL,
+    default_response_class=ORJSONResponse
+)
+
+setup_metrics(app, 'maps')
+setup_tracing(app, 'maps')
+setup_profiling(app)
+setup_resilience(app)
+setup_compression(app)
+
+background_tasks = set()
+
+
+async def index_event_addresses():
+    try:
+        await MapsService().index_event_addresses()
+    except Exception:
+        # Индекс продолжит заполняться по мере геокодирования
+        pass
+
+
+@app.on_event('startup')
+async def startup():
+    task = asyncio.create_task(index_event_addresses())
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+
+
 app.include_router(router)
@@ -6,7 +6,9 @@ import typing
 import ryadom_schemas.maps as schemas_maps
 
 from fastapi import APIRouter, Depends, HTTPException, Request, Query
+from fastapi.responses import FileResponse, Response
 
+from app.services.geocoders import GeocodingError
 from app.services.maps_service import MapsService
 
 
@@ -33,6 +35,9 @@ async def geocode(
     try:
         return await service.get_coordinates_by_address(address)
 
+    except GeocodingError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.to_dict())
+
     except ValueError as e:
         raise HTTPException(status_code=404, detail=str(e))
 
@@ -40,6 +45,36 @@ async def geocode(
         raise HTTPException(status_code=400, detail=str(e))
     
 
+@router.get('/reverse-geocode',
+            summary='Получение адреса по координатам',
+            description='Возвращает ближайший известный адрес для точки; к провайдеру обращается, только если рядом нет известных адресов',
+            response_model=schemas_maps.GeocodeResponse)
+async def reverse_geocode(
+    request: Request, 
+    lat: float = Query(
+        ...,
+        description='Широта точки',
+        ge=-90,
+        le=90
+    ),
+    lon: float = Query(
+        ...,
+        description='Долгота точки',
+        ge=-180,
+        le=180
+    ),
+    service: MapsService = Depends(get_maps_service)
+):
+    try:
+        return await service.get_address_by_coordinates(lat, lon)
+
+    except GeocodingError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.to_dict())
+
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+
 @router.get('/static-map',
             summary='Генерация URL статической карты',
             description='Генерирует URL для отображения статической карты с указанной меткой',
@@ -76,4 +111,56 @@ async def static_map(
         raise HTTPException(status_code=404, detail=str(e))
 
     except Exception as e:
-        raise HTTPException(status_code=400, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.get('/static-map/image',
+            summary='Изображение статической карты',
+            description='Отдает изображение статической карты с указанной меткой из кэша сервиса')
+async def static_map_image(
+    request: Request, 
+    lat: float = Query(
+        ...,
+        description='Широта точки',
+        ge=-90,
+        le=90
+    ),
+    lon: float = Query(
+        ...,
+        description='Долгота точки',
+        ge=-180,
+        le=180
+    ),
+    zoom: int = Query (
+        13,
+        description='Уровень масштабирования карты',
+        ge=0,
+        le=21
+    ),
+    size: str = Query (
+        '650,450',
+        description='Размер карты в формате \'ширина,высота\', округляется вверх до 50 и ограничивается 650,450',
+        regex=r'^\d{1,4},\d{1,4}$'
+    ), 
+    service: MapsService = Depends(get_maps_service)
+):
+    try:
+        static_map = await service.get_static_map_image(lat, lon, zoom, size)
+
+    except ValueError as e:
+        raise HTTPException(status_code=502, detail=str(e))
+
+    headers = {
+        'ETag': static_map['etag'],
+        'Last-Modified': static_map['last_modified'],
+        'Cache-Control': 'public, max-age=86400',
+    }
+
+    if_none_match = request.headers.get('if-none-match')
+    if_modified_since = request.headers.get('if-modified-since')
+
+    if (if_none_match and if_none_match == static_map['etag']) or \
+            (not if_none_match and if_modified_since == static_map['last_modified']):
+        return Response(status_code=304, headers=headers)
+
+    return FileResponse(static_map['path'], media_type=static_map['media_type'], headers=headers)
\ No newline at end of file
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import fcntl
+import json
+import os
+
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Iterator, Tuple
+
+
+class GeocodeStore:
+    """
+    Файл геокодированных адресов в формате JSON Lines, общий для воркеров
+    и перезапусков сервиса.
+
+    Им заполняются индекс и кэш геокодирования при старте, чтобы известные
+    адреса не геокодировались у провайдера повторно. Строки только
+    дописываются; exclusive() дает одному воркеру право переписать файл
+    без повторов и проиндексировать адреса событий.
+
+    Дописывание берет разделяемую блокировку <path>.write.lock, сжатие —
+    исключительную на время переноса хвоста и переименования, поэтому
+    строки, дописанные во время сжатия, не теряются.
+    """
+
+    def __init__(self, path: str, max_entries: int):
+        self.path = path
+        self.max_entries = max_entries
+
+    def _read(self) -> bytes:
+        try:
+            with open(self.path, 'rb') as file:
+                return file.read()
+        except FileNotFoundError:
+            return b''
+
+    def _parse(self, data: bytes) -> 'OrderedDict[str, Tuple[float, float]]':
+        entries: 'OrderedDict[str, Tuple[float, float]]' = OrderedDict()
+
+        for line in data.splitlines():
+            try:
+                address, lat, lon = json.loads(line)
+            except (TypeError, ValueError):
+                # Недописанная строка после аварийной остановки
+                continue
+
+            entries.pop(address, None)
+            entries[address] = (float(lat), float(lon))
+
+        while len(entries) > self.max_entries:
+            entries.popitem(last=False)
+
+        return entries
+
+    def load(self) -> 'OrderedDict[str, Tuple[float, float]]':
+        """
+        Прочитать сохраненные адреса; при повторах побеждает последняя запись
+        """
+        return self._parse(self._read())
+
+    @contextmanager
+    def _write_lock(self, operation: int) -> Iterator[None]:
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+
+        with open(f'{self.path}.write.lock', 'w') as lock_file:
+            fcntl.flock(lock_file, operation)
+
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def append(self, address: str, lat: float, lon: float) -> None:
+        line = json.dumps([address, lat, lon], ensure_ascii=False) + '\n'
+
+        # Короткие записи в режиме O_APPEND не перемешиваются между воркерами,
+        # поэтому дописывающим достаточно разделяемой блокировки
+        with self._write_lock(fcntl.LOCK_SH):
+            with open(self.path, 'a', encoding='utf-8') as file:
+                file.write(line)
+
+    def compact(self) -> None:
+        """
+        Переписать файл без повторов, оставив не больше max_entries последних адресов.
+        Строки, дописанные другими воркерами во время сжатия, переносятся
+        в новый файл перед переименованием
+        """
+        data = self._read()
+        # Строка, которую другой воркер еще дописывает, переносится целиком вместе с хвостом
+        data = data[:data.rfind(b'\n') + 1]
+        entries = self._parse(data)
+
+        tmp_path = f'{self.path}.{os.getpid()}.tmp'
+
+        with open(tmp_path, 'wb') as file:
+            for address, (lat, lon) in entries.items():
+                file.write((json.dumps([address, lat, lon], ensure_ascii=False) + '\n').encode('utf-8'))
+
+            with self._write_lock(fcntl.LOCK_EX):
+                try:
+                    with open(self.path, 'rb') as source:
+                        source.seek(len(data))
+                        file.write(source.read())
+                except FileNotFoundError:
+                    pass
+
+                file.flush()
+
+                os.replace(tmp_path, self.path)
+
+    @contextmanager
+    def exclusive(self) -> Iterator[bool]:
+        """
+        Попытаться занять файловую блокировку хранилища без ожидания
+
+        Yields:
+            bool: True, если блокировка получена этим процессом
+        """
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+
+        with open(f'{self.path}.lock', 'w') as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                yield False
+                return
+
+            try:
+                yield True
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
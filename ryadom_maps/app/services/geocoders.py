@@ -0,0 +1,470 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import asyncio
+import hashlib
+import json
+import os
+import time
+import httpx
+
+from abc import ABC, abstractmethod
+from typing import *
+
+from app.common.hedging import LatencyTracker
+from app.common.resilience import CircuitBreaker
+
+
+# ERRORS
+
+class GeocodingError(ValueError):
+    """
+    Базовая ошибка геокодирования с машиночитаемым кодом
+    """
+
+    code = 'geocoding_error'
+    status_code = 503
+
+    def __init__(self, message: str, provider: Optional[str] = None):
+        super().__init__(message)
+
+        self.message = message
+        self.provider = provider
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'code': self.code,
+            'message': self.message,
+            'provider': self.provider,
+        }
+
+
+class AddressNotFoundError(GeocodingError):
+    code = 'address_not_found'
+    status_code = 404
+
+
+class ProviderTimeoutError(GeocodingError):
+    code = 'provider_timeout'
+    status_code = 504
+
+
+class ProviderUnavailableError(GeocodingError):
+    code = 'provider_unavailable'
+    status_code = 503
+
+
+class InvalidProviderResponseError(GeocodingError):
+    code = 'invalid_provider_response'
+    status_code = 502
+
+
+# PROVIDERS
+
+class GeocodingProvider(ABC):
+    """
+    Интерфейс провайдера геокодирования.
+    Провайдеры с обратным геокодированием выставляют supports_reverse
+    и переопределяют reverse
+    """
+
+    name: str = 'base'
+    supports_reverse: bool = False
+
+    def __init__(self, timeout: float = 5.0):
+        self.timeout = timeout
+
+    @abstractmethod
+    async def geocode(self, address: str) -> Dict[str, Any]:
+        """
+        Получить координаты по адресу
+
+        Returns:
+            Dict[str, Any]: {'lat': ..., 'lon': ..., 'address': ...}
+
+        Raises:
+            AddressNotFoundError: если провайдер не нашел адрес
+            GeocodingError: при любой другой ошибке провайдера
+        """
+
+    async def reverse(self, lat: float, lon: float) -> Dict[str, Any]:
+        """
+        Получить адрес по координатам
+
+        Returns:
+            Dict[str, Any]: {'lat': ..., 'lon': ..., 'address': ...}
+
+        Raises:
+            NotImplementedError: если supports_reverse не выставлен
+            AddressNotFoundError: если по координатам ничего не найдено
+            GeocodingError: при любой другой ошибке провайдера
+        """
+        raise NotImplementedError(f'Провайдер {self.name} не поддерживает обратное геокодирование')
+
+
+class YandexGeocodingProvider(GeocodingProvider):
+
+    name = 'yandex'
+    supports_reverse = True
+
+    def __init__(self, api_key: Optional[str], timeout: float = 5.0):
+        super().__init__(timeout)
+
+        self.api_key = api_key
+
+    async def _request(self, geocode: str) -> List[Dict[str, Any]]:
+        try:
+            async with httpx.AsyncClient(timeout=self.timeout) as client:
+                response = await client.get(
+                    'https://geocode-maps.yandex.ru/v1/',
+                    params={
+                        "apikey": self.api_key,
+                        "geocode": geocode,
+                        "format": "json",
+                    }
+                )
+
+                response.raise_for_status()
+                data = response.json()
+
+        except httpx.TimeoutException:
+            raise ProviderTimeoutError('Превышено время ожидания геокодера', self.name)
+
+        except httpx.HTTPStatusError as e:
+            raise ProviderUnavailableError(f'Геокодер вернул ошибку {e.response.status_code}', self.name)
+
+        except httpx.RequestError as e:
+            raise ProviderUnavailableError(f'Геокодер недоступен: {type(e).__name__}', self.name)
+
+        except ValueError:
+            raise InvalidProviderResponseError('Некорректный ответ геокодера', self.name)
+
+        try:
+            return data["response"]["GeoObjectCollection"]["featureMember"]
+        except (KeyError, TypeError):
+            raise InvalidProviderResponseError('Некорректный ответ геокодера', self.name)
+
+    def _parse_point(self, feature_member: Dict[str, Any]) -> Tuple[float, float]:
+        try:
+            lon, lat = feature_member["GeoObject"]["Point"]["pos"].split()
+
+            return float(lat), float(lon)
+
+        except (KeyError, TypeError, ValueError):
+            raise InvalidProviderResponseError(
+                'Некорректный формат координат от сервиса геокодирования', self.name
+            )
+
+    async def geocode(self, address: str) -> Dict[str, Any]:
+        feature_members = await self._request(address)
+
+        if not feature_members:
+            raise AddressNotFoundError(f'Адрес {address} не найден', self.name)
+
+        lat, lon = self._parse_point(feature_members[0])
+
+        return {"lat": lat, "lon": lon, "address": address}
+
+    async def reverse(self, lat: float, lon: float) -> Dict[str, Any]:
+        feature_members = await self._request(f'{lon},{lat}')
+
+        if not feature_members:
+            raise AddressNotFoundError(f'По координатам {lat}, {lon} ничего не найдено', self.name)
+
+        try:
+            address = feature_members[0]["GeoObject"]["metaDataProperty"]["GeocoderMetaData"]["text"]
+        except (KeyError, TypeError):
+            raise InvalidProviderResponseError('Некорректный ответ геокодера', self.name)
+
+        point_lat, point_lon = self._parse_point(feature_members[0])
+
+        return {"lat": point_lat, "lon": point_lon, "address": address}
+
+
+class GazetteerGeocodingProvider(GeocodingProvider):
+    """
+    Офлайн-геокодер по локальному справочнику адресов.
+
+    Справочник — JSON-файл вида {"адрес": [lat, lon], ...}.
+    """
+
+    name = 'gazetteer'
+
+    def __init__(self, path: Optional[str] = None, entries: Optional[Dict[str, Sequence[float]]] = None, timeout: float = 0.5):
+        super().__init__(timeout)
+
+        self.entries: Dict[str, Tuple[float, float, str]] = {}
+
+        if path and os.path.isfile(path):
+            with open(path, 'r', encoding='utf-8') as file:
+                entries = {**json.load(file), **(entries or {})}
+
+        for entry_address, (lat, lon) in (entries or {}).items():
+            self.add(entry_address, lat, lon)
+
+    @staticmethod
+    def normalize(address: str) -> str:
+        return ' '.join(address.lower().replace(',', ' ').replace('.', ' ').replace('ё', 'е').split())
+
+    def add(self, address: str, lat: float, lon: float) -> None:
+        self.entries[self.normalize(address)] = (float(lat), float(lon), address)
+
+    def items(self) -> Iterator[Tuple[str, float, float]]:
+        for lat, lon, address in self.entries.values():
+            yield address, lat, lon
+
+    async def geocode(self, address: str) -> Dict[str, Any]:
+        entry = self.entries.get(self.normalize(address))
+
+        if entry is None:
+            raise AddressNotFoundError(f'Адрес {address} не найден в справочнике', self.name)
+
+        lat, lon, _ = entry
+
+        return {"lat": lat, "lon": lon, "address": address}
+
+
+class StubGeocodingProvider(GeocodingProvider):
+    """
+    Детерминированный геокодер для тестов и нагрузочных прогонов.
+    Возвращает координаты в пределах Санкт-Петербурга, вычисленные
+    по хэшу адреса; задержку и ошибки можно настроить.
+    """
+
+    name = 'stub'
+
+    def __init__(
+        self,
+        delay: float = 0.0,
+        fail: bool = False,
+        not_found: Iterable[str] = (),
+        name: Optional[str] = None,
+        timeout: float = 5.0
+    ):
+        super().__init__(timeout)
+
+        self.delay = delay
+        self.fail = fail
+        self.not_found = set(not_found)
+        self.calls = 0
+
+        if name:
+            self.name = name
+
+    async def geocode(self, address: str) -> Dict[str, Any]:
+        self.calls += 1
+
+        if self.delay:
+            await asyncio.sleep(self.delay)
+
+        if self.fail:
+            raise ProviderUnavailableError('Stub provider failure', self.name)
+
+        if address in self.not_found:
+            raise AddressNotFoundError(f'Адрес {address} не найден', self.name)
+
+        digest = hashlib.sha256(address.encode()).digest()
+
+        lat = 59.80 + int.from_bytes(digest[:4], 'big') / 2 ** 32 * 0.3
+        lon = 30.10 + int.from_bytes(digest[4:8], 'big') / 2 ** 32 * 0.5
+
+        return {"lat": round(lat, 6), "lon": round(lon, 6), "address": address}
+
+
+# RESILIENCE
+
+class HedgedGeocoder:
+    """
+    Опрашивает провайдеров по порядку. Если текущий провайдер не ответил
+    за свой p95, параллельно запускается следующий; при ошибке следующий
+    запускается сразу. Побеждает первый успешный ответ, остальные
+    запросы отменяются. Провайдеры с открытым автоматом пропускаются.
+    """
+
+    def __init__(
+        self,
+        providers: Sequence[GeocodingProvider],
+        default_hedge_delay: float = 0.5,
+        min_hedge_delay: float = 0.02
+    ):
+        self.providers = list(providers)
+        self.default_hedge_delay = default_hedge_delay
+        self.min_hedge_delay = min_hedge_delay
+
+        self.latencies = {provider.name: LatencyTracker(min_samples=10) for provider in self.providers}
+        self.breakers = {provider.name: CircuitBreaker(failure_threshold=5, reset_timeout=30.0) for provider in self.providers}
+
+    def hedge_delay(self, provider: GeocodingProvider) -> float:
+        p95 = self.latencies[provider.name].percentile(0.95)
+
+        if p95 is None:
+            return min(self.default_hedge_delay, provider.timeout)
+
+        return min(max(p95, self.min_hedge_delay), provider.timeout)
+
+    async def _call(self, provider: GeocodingProvider, address: str) -> Dict[str, Any]:
+        breaker = self.breakers[provider.name]
+        started = time.perf_counter()
+
+        try:
+            result = await asyncio.wait_for(provider.geocode(address), timeout=provider.timeout)
+
+        except asyncio.TimeoutError:
+            breaker.record_failure()
+            raise ProviderTimeoutError('Превышено время ожидания геокодера', provider.name)
+
+        except AddressNotFoundError:
+            breaker.record_success()
+            self.latencies[provider.name].record(time.perf_counter() - started)
+            raise
+
+        except GeocodingError:
+            breaker.record_failure()
+            raise
+
+        except asyncio.CancelledError:
+            breaker.release()
+            raise
+
+        except Exception as e:
+            breaker.record_failure()
+            raise ProviderUnavailableError(f'{type(e).__name__}: {e}', provider.name)
+
+        breaker.record_success()
+        self.latencies[provider.name].record(time.perf_counter() - started)
+
+        return result
+
+    async def geocode(self, address: str) -> Dict[str, Any]:
+        """
+        Получить координаты по адресу у самого быстрого доступного провайдера
+
+        Raises:
+            AddressNotFoundError: если ни один провайдер не нашел адрес
+            GeocodingError: если все провайдеры недоступны
+        """
+        pending: Dict[asyncio.Task, GeocodingProvider] = {}
+        errors: List[GeocodingError] = []
+        next_index = 0
+
+        def launch() -> Optional[GeocodingProvider]:
+            nonlocal next_index
+
+            while next_index < len(self.providers):
+                provider = self.providers[next_index]
+                next_index += 1
+
+                if self.breakers[provider.name].allow():
+                    pending[asyncio.create_task(self._call(provider, address))] = provider
+
+                    return provider
+
+            return None
+
+        last_launched = launch()
+
+        if last_launched is None:
+            raise ProviderUnavailableError('Все провайдеры геокодирования временно отключены')
+
+        try:
+            while pending:
+                timeout = self.hedge_delay(last_launched) if next_index < len(self.providers) else None
+
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+
+                if not done:
+                    last_launched = launch() or last_launched
+                    continue
+
+                for task in done:
+                    pending.pop(task)
+
+                    try:
+                        return task.result()
+                    except GeocodingError as e:
+                        errors.append(e)
+
+                if not pending:
+                    last_launched = launch() or last_launched
+
+        finally:
+            for task in pending:
+                task.cancel()
+
+        if errors and all(isinstance(error, AddressNotFoundError) for error in errors):
+            raise AddressNotFoundError(f'Адрес {address} не найден')
+
+        unavailable = [error for error in errors if not isinstance(error, AddressNotFoundError)]
+
+        raise unavailable[-1] if unavailable else ProviderUnavailableError('Геокодирование недоступно')
+
+    async def reverse(self, lat: float, lon: float) -> Dict[str, Any]:
+        """
+        Получить адрес по координатам у первого доступного провайдера,
+        поддерживающего обратное геокодирование
+
+        Raises:
+            AddressNotFoundError: если ни один провайдер не нашел адрес
+            GeocodingError: если все провайдеры недоступны
+        """
+        errors: List[GeocodingError] = []
+
+        for provider in self.providers:
+            if not provider.supports_reverse:
+                continue
+
+            breaker = self.breakers[provider.name]
+
+            if not breaker.allow():
+                continue
+
+            try:
+                result = await asyncio.wait_for(provider.reverse(lat, lon), timeout=provider.timeout)
+
+            except asyncio.TimeoutError:
+                breaker.record_failure()
+                errors.append(ProviderTimeoutError('Превышено время ожидания геокодера', provider.name))
+                continue
+
+            except AddressNotFoundError as e:
+                breaker.record_success()
+                errors.append(e)
+                continue
+
+            except GeocodingError as e:
+                breaker.record_failure()
+                errors.append(e)
+                continue
+
+            breaker.record_success()
+
+            return result
+
+        unavailable = [error for error in errors if not isinstance(error, AddressNotFoundError)]
+
+        if unavailable:
+            raise unavailable[-1]
+
+        raise AddressNotFoundError(f'По координатам {lat}, {lon} ничего не найдено')
+
+
+def build_providers_from_env() -> List[GeocodingProvider]:
+    """
+    Создает провайдеров по переменной GEOCODER_PROVIDERS, например "gazetteer,yandex"
+    """
+    timeout = float(os.getenv("GEOCODER_TIMEOUT", "5.0"))
+
+    factories: Dict[str, Callable[[], GeocodingProvider]] = {
+        'yandex': lambda: YandexGeocodingProvider(os.getenv("GEOCODER_API"), timeout=timeout),
+        'gazetteer': lambda: GazetteerGeocodingProvider(os.getenv("GEOCODER_GAZETTEER_PATH")),
+        'stub': lambda: StubGeocodingProvider(),
+    }
+
+    names = [name.strip() for name in os.getenv("GEOCODER_PROVIDERS", "gazetteer,yandex").split(',') if name.strip()]
+
+    unknown = [name for name in names if name not in factories]
+
+    if unknown:
+        raise RuntimeError(f'Unknown geocoding providers: {", ".join(unknown)}')
+
+    return [factories[name]() for name in names]
@@ -9,6 +9,76 @@ import ryadom_schemas.maps as schemas_maps
 from cachetools import TTLCache
 from fastapi import HTTPException
 from typing import *
+from urllib.parse import urlencode
+
+from app.config import get_config
+from app.services.geocode_store import GeocodeStore
+from app.services.geocoders import GazetteerGeocodingProvider, HedgedGeocoder, build_providers_from_env
+from app.services.spatial_index import GridIndex
+from app.services.static_map_cache import StaticMapCache
+
+
+geocoder = HedgedGeocoder(build_providers_from_env())
+
+geocode_cache = TTLCache(maxsize=10000, ttl=86400)
+
+address_index = GridIndex(max_size=int(os.getenv("ADDRESS_INDEX_SIZE", "50000")))
+
+geocode_store = GeocodeStore(
+    path=os.getenv("GEOCODE_STORE_PATH", "app/geocode_store.jsonl"),
+    max_entries=address_index.max_size
+)
+
+for provider in geocoder.providers:
+    if isinstance(provider, GazetteerGeocodingProvider):
+        for known_address, known_lat, known_lon in provider.items():
+            address_index.add(known_address, known_lat, known_lon)
+
+# Адреса, геокодированные раньше любым воркером, не запрашиваются у провайдера повторно
+for known_address, (known_lat, known_lon) in geocode_store.load().items():
+    address_index.add(known_address, known_lat, known_lon)
+    geocode_cache[known_address] = {"lat": known_lat, "lon": known_lon, "address": known_address}
+
+static_map_cache = StaticMapCache(
+    cache_dir=os.getenv("STATIC_MAP_CACHE_DIR", "app/static_map_cache"),
+    ttl=int(os.getenv("STATIC_MAP_CACHE_TTL", str(30 * 86400))),
+    max_bytes=int(os.getenv("STATIC_MAP_CACHE_MAX_BYTES", str(512 * 1024 ** 2)))
+)
+
+# Наибольший размер карты, который отдает Static API, и шаг размеров:
+# произвольные размеры не умножают число записей кэша и запросов к провайдеру
+STATIC_MAP_MAX_SIZE = (650, 450)
+STATIC_MAP_SIZE_STEP = 50
+
+# 5 знаков — около метра, меньше пикселя карты до 17-го масштаба
+STATIC_MAP_COORDINATE_DIGITS = 5
+
+
+def normalize_static_map_params(lat: float, lon: float, zoom: int, size: str) -> Tuple[float, float, int, str]:
+    """
+    Привести параметры статической карты к конечному набору: координаты
+    округляются, размер округляется вверх до шага и ограничивается
+    размером, допустимым у провайдера
+
+    Raises:
+        ValueError: если размер не в формате "ширина,высота"
+    """
+    try:
+        width, height = (int(value) for value in size.split(','))
+    except (AttributeError, ValueError):
+        raise ValueError('Размер карты должен быть в формате "ширина,высота"')
+
+    width, height = (
+        min(limit, max(STATIC_MAP_SIZE_STEP, -(-value // STATIC_MAP_SIZE_STEP) * STATIC_MAP_SIZE_STEP))
+        for value, limit in zip((width, height), STATIC_MAP_MAX_SIZE)
+    )
+
+    return (
+        round(lat, STATIC_MAP_COORDINATE_DIGITS),
+        round(lon, STATIC_MAP_COORDINATE_DIGITS),
+        zoom,
+        f'{width},{height}',
+    )
 
 
 class MapsService:
@@ -16,10 +86,12 @@ class MapsService:
     def __init__(self):
         self.edge_router_service_url = os.getenv("EDGE_ROUTER_SERVICE_URL")
 
-        self.geocode_cache = TTLCache(maxsize=1000, ttl=86400)
+        self.geocode_cache = geocode_cache
+        self.address_index = address_index
+        self.reverse_geocode_tolerance = float(os.getenv("REVERSE_GEOCODE_TOLERANCE_M", "75"))
 
         self.maps_api_key = os.getenv("MAPS_API")
-        self.geocoder_api_key = os.getenv("GEOCODER_API")
+        self.static_maps_api_url = os.getenv("STATIC_MAPS_API_URL", "https://static-maps.yandex.ru/v1")
 
     async def get_coordinates_by_address(self, address: Optional[str] = None):
         """
@@ -27,6 +99,10 @@ class MapsService:
         
         Returns:
             GeocodeResponse: 
+
+        Raises:
+            ValueError: если адрес пустой
+            GeocodingError: если адрес не найден или провайдеры недоступны
         """
 
         if not address:
@@ -35,54 +111,79 @@ class MapsService:
         if address in self.geocode_cache:
             return self.geocode_cache[address]
         
-        try:
-            async with httpx.AsyncClient(timeout=5.0) as client:
-                response = await client.get(
-                    'https://geocode-maps.yandex.ru/v1/',
-                    params={
-                        "apikey": self.geocoder_api_key,
-                        "geocode": address,
-                        "format": "json",
-                    }
-                )
+        result = await geocoder.geocode(address)
 
-                response.raise_for_status()
-                data = response.json()
-                
-                feature_members = data["response"]["GeoObjectCollection"]["featureMember"]
+        self.geocode_cache[address] = result
+        self.address_index.add(address, result['lat'], result['lon'])
+        geocode_store.append(address, result['lat'], result['lon'])
 
-                if not feature_members:
-                    raise ValueError(f'Адрес {address} не найден')
-                
-                pos = feature_members[0]["GeoObject"]["Point"]["pos"]
-                lon, lat = pos.split()
+        return schemas_maps.GeocodeResponse.model_validate(result, from_attributes=True)
 
-                try:
-                    lat = float(lat)
-                    lon = float(lon)
+    async def get_address_by_coordinates(self, lat: float, lon: float):
+        """
+        Получить адрес по координатам.
+        Сначала ищется ближайший известный адрес в пределах допуска,
+        и только если его нет, запрос уходит к провайдеру.
+        
+        Args:
+            lat: Широта точки
+            lon: Долгота точки
 
-                except (TypeError, ValueError) as e:
-                    raise ValueError('Некорректный формат координат от сервиса геокодирования')
-                
-                result = {
-                    "lat": lat,
-                    "lon": lon,
-                    "address": address
-                }
+        Returns:
+            GeocodeResponse: ближайший адрес и его координаты
 
-                self.geocode_cache[address] = result
+        Raises:
+            GeocodingError: если адрес не найден или провайдеры недоступны
+        """
 
-                return schemas_maps.GeocodeResponse.model_validate(result, from_attributes=True)
+        nearest = self.address_index.nearest(lat, lon, self.reverse_geocode_tolerance)
 
-        
-        except httpx.HTTPStatusError as e:
-            raise ValueError(f'{e}' + " 1")
-        
-        except httpx.RequestError as e:
-            raise ValueError(f'{e}' + " 2")
-        
-        except Exception as e:
-            raise ValueError(f'{e}' + " 3")
+        if nearest is not None:
+            address, point_lat, point_lon, _ = nearest
+
+            return schemas_maps.GeocodeResponse(lat=point_lat, lon=point_lon, address=address)
+
+        result = await geocoder.reverse(lat, lon)
+
+        self.address_index.add(result['address'], result['lat'], result['lon'])
+
+        return schemas_maps.GeocodeResponse.model_validate(result, from_attributes=True)
+
+    async def index_event_addresses(self) -> int:
+        """
+        Заполнить индекс адресами событий при старте сервиса.
+        Индексирует один воркер, и геокодируются только адреса,
+        которых еще нет в geocode_store
+
+        Returns:
+            int: количество геокодированных адресов
+        """
+
+        with geocode_store.exclusive() as acquired:
+            if not acquired:
+                return 0
+
+            geocode_store.compact()
+
+            async with httpx.AsyncClient(timeout=10.0) as client:
+                response = await client.get(f'{self.edge_router_service_url}/api/events/')
+
+                response.raise_for_status()
+
+                events = response.json().get('events', [])
+
+            addresses = {event['address'] for event in events if event.get('address')} - set(geocode_store.load())
+
+            indexed = 0
+
+            for address in addresses:
+                try:
+                    await self.get_coordinates_by_address(address)
+                    indexed += 1
+                except ValueError:
+                    continue
+
+            return indexed
 
     async def get_static_map_url_by_coordinates(
             self, 
@@ -110,15 +211,71 @@ class MapsService:
         if lat is None or lon is None:
             raise ValueError("Широта и долгота обязательны для генерации карты")
 
+        lat, lon, zoom, size = normalize_static_map_params(lat, lon, zoom, size)
+
         try:
-            map_url = (
-                f"https://static-maps.yandex.ru/v1?ll={lon},{lat}"
-                f"&z={zoom}&size={size}"
-                f"&pt={lon},{lat},pmwtm1&lang=ru_RU"
-                f"&apikey={self.maps_api_key}"
-            )
+            query = urlencode({'lat': lat, 'lon': lon, 'zoom': zoom, 'size': size})
+            map_url = f"{get_config().API_PREFIX}/static-map/image?{query}"
         
             return schemas_maps.StaticMapResponse(url=map_url)
         
         except Exception as e:
-            raise ValueError(f'Ошибка генерации URL карты: {str(e)}')
\ No newline at end of file
+            raise ValueError(f'Ошибка генерации URL карты: {str(e)}')
+
+    async def get_static_map_image(
+            self, 
+            lat: float,
+            lon: float,
+            zoom: Optional[int] = 13,
+            size: Optional[str] = '650,450'
+        ) -> Dict[str, Any]:
+        """
+        Получить изображение статической карты из дискового кэша.
+        При промахе изображение один раз загружается у провайдера.
+        
+        Args:
+            lat: Широта точки
+            lon: Долгота точки
+            zoom: Уровень масштабирования (по умолчанию 13)
+            size: Размер карты в формате "ширина,высота" (по умолчанию "650,450")
+        
+        Returns:
+            Dict[str, Any]: путь к файлу, media_type, etag и last_modified
+
+        Raises:
+            ValueError: если провайдер карт вернул ошибку
+        """
+
+        if lat is None or lon is None:
+            raise ValueError("Широта и долгота обязательны для генерации карты")
+
+        lat, lon, zoom, size = normalize_static_map_params(lat, lon, zoom, size)
+
+        async def fetch() -> Tuple[bytes, str]:
+            try:
+                async with httpx.AsyncClient(timeout=10.0) as client:
+                    response = await client.get(
+                        self.static_maps_api_url,
+                        params={
+                            "ll": f"{lon},{lat}",
+                            "z": zoom,
+                            "size": size,
+                            "pt": f"{lon},{lat},pmwtm1",
+                            "lang": "ru_RU",
+                            "apikey": self.maps_api_key,
+                        }
+                    )
+
+                    response.raise_for_status()
+
+            except httpx.HTTPStatusError as e:
+                raise ValueError(f'Сервис карт вернул ошибку: {e.response.status_code}')
+
+            except httpx.RequestError as e:
+                raise ValueError(f'Сервис карт недоступен: {type(e).__name__}')
+
+            return response.content, response.headers.get('content-type', 'image/png')
+
+        key = static_map_cache.make_key(lat, lon, zoom, size)
+
+        return await static_map_cache.get_or_fetch(key, fetch)
\ No newline at end of file
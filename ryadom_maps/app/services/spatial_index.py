@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import math
+
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+
+EARTH_RADIUS_M = 6371008.8
+METERS_PER_DEGREE = math.pi * EARTH_RADIUS_M / 180
+
+
+def haversine_m(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """
+    Расстояние между двумя точками в метрах
+    """
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    d_phi = phi2 - phi1
+    d_lambda = math.radians(lon2 - lon1)
+
+    a = math.sin(d_phi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2
+
+    return 2 * EARTH_RADIUS_M * math.asin(math.sqrt(a))
+
+
+class GridIndex:
+    """
+    Пространственный индекс известных адресов на равномерной сетке.
+
+    Точки раскладываются по ячейкам размером cell_size градусов;
+    поиск ближайшей точки просматривает только ячейки, попадающие
+    в радиус допуска. Вставка и обновление работают инкрементально.
+    При max_size индекс хранит не больше max_size адресов и вытесняет
+    те, которые дольше всего не добавлялись и не находились.
+    """
+
+    def __init__(self, cell_size: float = 0.005, max_size: Optional[int] = None):
+        self.cell_size = cell_size
+        self.max_size = max_size
+
+        self._cells: Dict[Tuple[int, int], Dict[str, Tuple[float, float]]] = {}
+        self._points: 'OrderedDict[str, Tuple[float, float]]' = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._points)
+
+    def _cell(self, lat: float, lon: float) -> Tuple[int, int]:
+        return math.floor(lat / self.cell_size), math.floor(lon / self.cell_size)
+
+    def add(self, address: str, lat: float, lon: float) -> None:
+        """
+        Добавить адрес в индекс или переместить уже известный
+        """
+        previous = self._points.get(address)
+
+        if previous == (lat, lon):
+            self._points.move_to_end(address)
+            return
+
+        if previous is not None:
+            self.remove(address)
+
+        self._points[address] = (lat, lon)
+        self._cells.setdefault(self._cell(lat, lon), {})[address] = (lat, lon)
+
+        if self.max_size is not None:
+            while len(self._points) > self.max_size:
+                self.remove(next(iter(self._points)))
+
+    def remove(self, address: str) -> None:
+        point = self._points.pop(address, None)
+
+        if point is None:
+            return
+
+        cell = self._cell(*point)
+        bucket = self._cells.get(cell)
+
+        if bucket is not None:
+            bucket.pop(address, None)
+
+            if not bucket:
+                del self._cells[cell]
+
+    def nearest(self, lat: float, lon: float, max_distance_m: float) -> Optional[Tuple[str, float, float, float]]:
+        """
+        Найти ближайший известный адрес в пределах max_distance_m
+
+        Returns:
+            Optional[Tuple[str, float, float, float]]: (адрес, lat, lon, расстояние в метрах)
+        """
+        lat_radius = max_distance_m / METERS_PER_DEGREE
+        lon_radius = lat_radius / max(math.cos(math.radians(lat)), 1e-6)
+
+        min_lat_cell, min_lon_cell = self._cell(lat - lat_radius, lon - lon_radius)
+        max_lat_cell, max_lon_cell = self._cell(lat + lat_radius, lon + lon_radius)
+
+        best = None
+        best_distance = max_distance_m
+
+        for lat_cell in range(min_lat_cell, max_lat_cell + 1):
+            for lon_cell in range(min_lon_cell, max_lon_cell + 1):
+                bucket = self._cells.get((lat_cell, lon_cell))
+
+                if not bucket:
+                    continue
+
+                for address, (point_lat, point_lon) in bucket.items():
+                    distance = haversine_m(lat, lon, point_lat, point_lon)
+
+                    if distance <= best_distance:
+                        best = (address, point_lat, point_lon, distance)
+                        best_distance = distance
+
+        if best is not None:
+            self._points.move_to_end(best[0])
+
+        return best
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import asyncio
+import hashlib
+import json
+import os
+import time
+
+from email.utils import formatdate
+from typing import *
+
+from app.common.disk_cache import DiskCacheLimit
+
+
+class StaticMapCache:
+    """
+    Дисковый кэш изображений статических карт.
+
+    Каждая запись хранится как пара файлов <key>.png и <key>.json
+    (ETag, Last-Modified, время загрузки). Устаревшая запись продолжает
+    отдаваться, пока один фоновый запрос обновляет ее; при отсутствии
+    записи параллельные запросы ждут одну загрузку.
+
+    Размер каталога ограничен max_bytes: давно не использованные записи
+    вытесняются (app.common.disk_cache).
+    """
+
+    def __init__(self, cache_dir: str, ttl: int, max_bytes: int = 512 * 1024 ** 2):
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.limit = DiskCacheLimit(cache_dir, max_bytes)
+
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._refreshing: Set[str] = set()
+        self._background_tasks: Set[asyncio.Task] = set()
+
+    @staticmethod
+    def make_key(lat: float, lon: float, zoom: int, size: str) -> str:
+        normalized = f'{lat:.6f},{lon:.6f},{zoom},{size}'
+
+        return hashlib.sha256(normalized.encode()).hexdigest()
+
+    def _paths(self, key: str) -> Tuple[str, str]:
+        directory = os.path.join(self.cache_dir, key[:2])
+
+        return os.path.join(directory, f'{key}.png'), os.path.join(directory, f'{key}.json')
+
+    def read(self, key: str) -> Optional[Dict[str, Any]]:
+        """
+        Прочитать метаданные записи или None, если ее нет
+        """
+        image_path, meta_path = self._paths(key)
+
+        try:
+            with open(meta_path, 'r', encoding='utf-8') as file:
+                meta = json.load(file)
+        except (OSError, ValueError):
+            return None
+
+        if not os.path.isfile(image_path):
+            return None
+
+        self.limit.touch(image_path)
+        self.limit.touch(meta_path)
+
+        meta['path'] = image_path
+
+        return meta
+
+    def write(self, key: str, content: bytes, media_type: str) -> Dict[str, Any]:
+        image_path, meta_path = self._paths(key)
+        os.makedirs(os.path.dirname(image_path), exist_ok=True)
+
+        fetched_at = time.time()
+
+        meta = {
+            'etag': f'"{hashlib.sha256(content).hexdigest()[:32]}"',
+            'last_modified': formatdate(fetched_at, usegmt=True),
+            'fetched_at': fetched_at,
+            'media_type': media_type,
+        }
+
+        for path, data, mode in ((image_path, content, 'wb'), (meta_path, json.dumps(meta), 'w')):
+            tmp_path = f'{path}.{os.getpid()}.tmp'
+
+            with open(tmp_path, mode) as file:
+                file.write(data)
+
+            os.replace(tmp_path, path)
+
+        meta['path'] = image_path
+        meta['size'] = len(content)
+
+        return meta
+
+    def is_fresh(self, meta: Dict[str, Any]) -> bool:
+        return time.time() - meta['fetched_at'] < self.ttl
+
+    async def get_or_fetch(self, key: str, fetch: Callable[[], Awaitable[Tuple[bytes, str]]]) -> Dict[str, Any]:
+        """
+        Получить запись из кэша, загрузив ее при необходимости
+
+        Args:
+            key: ключ записи
+            fetch: корутина-загрузчик, возвращающая (содержимое, media type)
+
+        Returns:
+            Dict[str, Any]: метаданные записи с путем к файлу
+        """
+        meta = self.read(key)
+
+        if meta is not None:
+            if not self.is_fresh(meta) and key not in self._refreshing:
+                self._refreshing.add(key)
+                task = asyncio.create_task(self._refresh(key, fetch))
+                self._background_tasks.add(task)
+                task.add_done_callback(self._background_tasks.discard)
+
+            return meta
+
+        lock = self._locks.setdefault(key, asyncio.Lock())
+
+        try:
+            async with lock:
+                meta = self.read(key)
+
+                if meta is None:
+                    content, media_type = await fetch()
+                    meta = self.write(key, content, media_type)
+
+                    await self.limit.added(meta['size'])
+        finally:
+            if not lock.locked():
+                self._locks.pop(key, None)
+
+        return meta
+
+    async def _refresh(self, key: str, fetch: Callable[[], Awaitable[Tuple[bytes, str]]]) -> None:
+        try:
+            content, media_type = await fetch()
+            meta = self.write(key, content, media_type)
+
+            await self.limit.added(meta['size'])
+        except Exception:
+            # Устаревшая запись остается в кэше до следующей попытки
+            pass
+        finally:
+            self._refreshing.discard(key)
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Общие фикстуры тестов сервиса maps.
+
+Пакет app подключается так же, как в бенчмарках (benchmarks/bootstrap.py),
+поэтому тесты каждого сервиса запускаются отдельно:
+
+    python -m pytest ryadom_maps/tests
+
+use_service() переходит в каталог сервиса, как WORKDIR в Dockerfile:
+настройки не читают app.env из каталога запуска, и тесты запускаются
+из любого каталога.
+"""
+
+import os
+import sys
+import tempfile
+import threading
+import time
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import *
+
+import pytest
+
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'benchmarks'))
+
+os.environ.setdefault('GEOCODER_PROVIDERS', 'stub')
+_workdir = tempfile.mkdtemp(prefix='ryadom-maps-tests-')
+
+os.environ.setdefault('GEOCODE_STORE_PATH', os.path.join(_workdir, 'geocode_store.jsonl'))
+os.environ.setdefault('TRACE_EXPORT_DIR', os.path.join(_workdir, 'traces'))
+
+from bootstrap import use_service  # noqa: E402
+
+use_service('maps')
+
+
+class StubImageServer:
+    """
+    Локальная замена сервиса статических карт: отдает content
+    с задержкой delay и считает запросы
+    """
+
+    def __init__(self):
+        self.content = b'\x89PNG\r\n\x1a\nfirst'
+        self.delay = 0.0
+        self.requests = 0
+
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), self._handler())
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address
+
+        return f'http://{host}:{port}/v1'
+
+    def _handler(self) -> Type[BaseHTTPRequestHandler]:
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def do_GET(self):
+                with stub._lock:
+                    stub.requests += 1
+
+                time.sleep(stub.delay)
+
+                self.send_response(200)
+                self.send_header('Content-Type', 'image/png')
+                self.send_header('Content-Length', str(len(stub.content)))
+                self.end_headers()
+                self.wfile.write(stub.content)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+
+@pytest.fixture
+def stub_server(monkeypatch):
+    server = StubImageServer()
+    server.start()
+
+    monkeypatch.setenv('STATIC_MAPS_API_URL', server.url)
+
+    yield server
+
+    server.stop()
+
+
+@pytest.fixture
+def map_cache(tmp_path, monkeypatch):
+    from app.services import maps_service
+    from app.services.static_map_cache import StaticMapCache
+
+    cache = StaticMapCache(cache_dir=str(tmp_path), ttl=3600)
+    monkeypatch.setattr(maps_service, 'static_map_cache', cache)
+
+    return cache
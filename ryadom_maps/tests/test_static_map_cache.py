@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import asyncio
+
+import pytest
+
+from fastapi.testclient import TestClient
+
+
+LAT, LON = 59.941, 30.298
+
+IMAGE_URL = f'/static-map/image?lat={LAT}&lon={LON}'
+
+
+@pytest.fixture
+def client(stub_server, map_cache):
+    from app.main import app
+
+    return TestClient(app)
+
+
+def test_image_has_validators_and_answers_304_to_etag(client, stub_server):
+    response = client.get(IMAGE_URL)
+
+    assert response.status_code == 200
+    assert response.content == stub_server.content
+    assert response.headers['etag']
+    assert response.headers['last-modified']
+
+    etag = response.headers['etag']
+
+    response = client.get(IMAGE_URL, headers={'If-None-Match': etag})
+
+    assert response.status_code == 304
+    assert response.content == b''
+    assert response.headers['etag'] == etag
+
+    response = client.get(IMAGE_URL, headers={'If-None-Match': '"other"'})
+
+    assert response.status_code == 200
+    assert stub_server.requests == 1
+
+
+def test_image_answers_304_to_last_modified(client, stub_server):
+    last_modified = client.get(IMAGE_URL).headers['last-modified']
+
+    response = client.get(IMAGE_URL, headers={'If-Modified-Since': last_modified})
+
+    assert response.status_code == 304
+
+    # If-None-Match приоритетнее If-Modified-Since
+    response = client.get(IMAGE_URL, headers={'If-Modified-Since': last_modified, 'If-None-Match': '"other"'})
+
+    assert response.status_code == 200
+    assert stub_server.requests == 1
+
+
+def test_concurrent_misses_fetch_once(stub_server, map_cache):
+    from app.services.maps_service import MapsService
+
+    stub_server.delay = 0.2
+
+    async def run():
+        service = MapsService()
+
+        return await asyncio.gather(*(service.get_static_map_image(LAT, LON) for _ in range(10)))
+
+    results = asyncio.run(run())
+
+    assert stub_server.requests == 1
+    assert len({meta['etag'] for meta in results}) == 1
+    assert not map_cache._locks
+
+
+def test_stale_entry_is_served_while_one_refresh_runs(stub_server, map_cache):
+    from app.services.maps_service import MapsService
+
+    async def run():
+        service = MapsService()
+        first = await service.get_static_map_image(LAT, LON)
+
+        map_cache.ttl = 0
+        stub_server.content = b'\x89PNG\r\n\x1a\nsecond'
+        stub_server.delay = 0.2
+
+        stale = await asyncio.gather(*(service.get_static_map_image(LAT, LON) for _ in range(10)))
+
+        await asyncio.gather(*map_cache._background_tasks)
+
+        return first, stale
+
+    first, stale = asyncio.run(run())
+
+    assert {meta['etag'] for meta in stale} == {first['etag']}
+    assert stub_server.requests == 2
+
+    refreshed = map_cache.read(map_cache.make_key(LAT, LON, 13, '650,450'))
+
+    assert refreshed['etag'] != first['etag']
+
+    with open(refreshed['path'], 'rb') as file:
+        assert file.read() == stub_server.content
+
+
+def test_nearby_points_and_sizes_share_one_entry(stub_server, map_cache):
+    from app.services.maps_service import MapsService
+
+    async def run():
+        service = MapsService()
+
+        return [
+            await service.get_static_map_image(LAT + 0.000001, LON, 13, '640,440'),
+            await service.get_static_map_image(LAT, LON - 0.000001, 13, '9999,9999'),
+        ]
+
+    first, second = asyncio.run(run())
+
+    assert first['etag'] == second['etag']
+    assert stub_server.requests == 1
+
+
+def test_cache_evicts_least_recently_used_entries(stub_server, map_cache):
+    from app.services.maps_service import MapsService
+
+    map_cache.limit.max_bytes = len(stub_server.content) * 3
+
+    async def run():
+        service = MapsService()
+
+        for index in range(6):
+            await service.get_static_map_image(LAT + index, LON)
+
+    asyncio.run(run())
+
+    cached = [map_cache.read(map_cache.make_key(LAT + index, LON, 13, '650,450')) for index in range(6)]
+
+    assert cached[0] is None
+    assert cached[-1] is not None
+    assert map_cache.limit.evicted > 0
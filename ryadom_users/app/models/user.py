@@ -20,4 +20,8 @@ class UserModel(Base):
     course = Column(Integer)
     photo = Column(Text)
     email_verified = Column(Boolean, nullable=False, default=False)
-    created_at = Column(Text)
\ No newline at end of file
+    created_at = Column(Text)
+    version = Column(Integer, nullable=False, default=1, server_default='1')
+
+    # SQLAlchemy увеличивает version при каждом UPDATE, это версия строки для ETag
+    __mapper_args__ = {'version_id_col': version}
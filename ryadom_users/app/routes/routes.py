@@ -8,12 +8,16 @@ import ryadom_schemas.users as schemas_users
 from fastapi import APIRouter, Depends, HTTPException, Request
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from app.common.http_cache import etag_matches, make_etag, not_modified, validator_headers
+from app.common.responses import FieldSelection, ORJSONResponse, fields_tag
 from app.database import get_async_session
-from app.services.users_service import UsersService
+from app.services.users_service import USER_RESPONSE_COLUMNS, UsersService
 
 
 router = APIRouter(tags=['users'])
 
+user_fields = FieldSelection(USER_RESPONSE_COLUMNS)
+
 
 async def get_users_service(session: AsyncSession = Depends(get_async_session)):
     return UsersService(session)
@@ -28,15 +32,34 @@ async def create_user(request: Request, user: schemas_users.UserCreate, service:
 
 
 @router.get("/users/", response_model=schemas_users.UserListResponse)
-async def get_all_users(request: Request, service: UsersService = Depends(get_users_service)):
-    return await service.get_all_users()    
+async def get_all_users(
+    request: Request,
+    columns: typing.Optional[list] = Depends(user_fields),
+    service: UsersService = Depends(get_users_service)
+):
+    etag = make_etag('users', *await service.get_users_version(), *fields_tag(columns))
+
+    if etag_matches(request.headers.get('if-none-match'), etag):
+        return not_modified(etag)
+
+    return ORJSONResponse(await service.get_all_users(columns), headers=validator_headers(etag))
 
 
 @router.get("/users/{user_id}", response_model=schemas_users.UserResponse)
-async def get_user_by_id(request: Request, user_id: int, service: UsersService = Depends(get_users_service)) -> typing.Dict | None:
+async def get_user_by_id(
+    request: Request,
+    user_id: int,
+    columns: typing.Optional[list] = Depends(user_fields),
+    service: UsersService = Depends(get_users_service)
+) -> typing.Dict | None:
+    version = await service.get_user_version(user_id)
+    etag = make_etag('user', user_id, version, *fields_tag(columns))
+
+    if version is not None and etag_matches(request.headers.get('if-none-match'), etag):
+        return not_modified(etag)
+
     try:
-        user = await service.get_user_by_id(user_id)
-        return user
+        return ORJSONResponse(await service.get_user_by_id(user_id, columns), headers=validator_headers(etag))
 
     except ValueError as e:
         raise HTTPException(status_code=404, detail=str(e))
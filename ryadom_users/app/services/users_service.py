@@ -6,15 +6,19 @@ import typing
 
 import ryadom_schemas.users as schemas_users
 
+from app.common.responses import rows_as_dicts, select_schema_columns
 from app.models.user import UserModel
 
 from datetime import datetime
 from fastapi import HTTPException
 from passlib.context import CryptContext
-from sqlalchemy import select
+from sqlalchemy import func, select
 from sqlalchemy.ext.asyncio import AsyncSession
 
 
+USER_RESPONSE_COLUMNS = select_schema_columns(UserModel, schemas_users.UserResponse)
+
+
 class UsersService:
 
     def __init__(self, session: AsyncSession):
@@ -58,46 +62,72 @@ class UsersService:
 
         return schemas_users.UserResponse.model_validate(new_user, from_attributes=True)
 
-    async def get_all_users(self):
+    async def get_users_version(self) -> typing.Tuple[int, int, int]:
+        """
+        Версия списка пользователей: количество, максимальный id и сумма версий строк.
+        Создание увеличивает максимальный id, удаление уменьшает количество,
+        изменение увеличивает сумму версий
+        """
+
+        result = await self.session.execute(
+            select(func.count(UserModel.id), func.max(UserModel.id), func.sum(UserModel.version))
+        )
+
+        count, max_id, versions = result.one()
+
+        return count, max_id or 0, versions or 0
+
+    async def get_user_version(self, user_id: int) -> typing.Optional[int]:
+        """
+        Версия строки пользователя или None, если пользователя нет
+        """
+
+        result = await self.session.execute(
+            select(UserModel.version).where(UserModel.id == user_id)
+        )
+
+        return result.scalar_one_or_none()
+
+    async def get_all_users(self, columns: typing.Optional[typing.List[typing.Any]] = None):
         """
         Получить всех пользователей
         
+        Args:
+            columns: выбираемые столбцы, по умолчанию все поля UserResponse
+        
         Returns:
-            UserListResponse: список пользователей
+            Dict: {'users': [...]}, строки в форме UserResponse
         """
 
-        result = await self.session.execute(select(UserModel))
-        
-        users = result.scalars().all()
+        result = await self.session.execute(select(*(columns or USER_RESPONSE_COLUMNS)))
 
-        return schemas_users.UserListResponse(
-            users=[schemas_users.UserResponse.model_validate(user, from_attributes=True) for user in users]
-        )
+        return {'users': rows_as_dicts(result)}
 
-    async def get_user_by_id(self, user_id: int):
+    async def get_user_by_id(self, user_id: int, columns: typing.Optional[typing.List[typing.Any]] = None):
         """
         Получить пользователя по его id
         
         Args:
             user_id: id пользователя
+            columns: выбираемые столбцы, по умолчанию все поля UserResponse
         
         Returns:
-            UserResponse: пользователь
+            Dict: пользователь в форме UserResponse
 
         Raises:
             ValueError: если пользователь не был найден
         """
 
         result = await self.session.execute(
-            select(UserModel).where(UserModel.id == user_id)
+            select(*(columns or USER_RESPONSE_COLUMNS)).where(UserModel.id == user_id)
         )
 
-        user = result.scalar_one_or_none()
+        user = result.mappings().one_or_none()
 
         if not user:
             raise ValueError(f'User with id {user_id} not found')
-        
-        return schemas_users.UserResponse.model_validate(user, from_attributes=True)
+
+        return dict(user)
 
     async def update_user(self, user_id: int, user: schemas_users.UserCreate):
         """
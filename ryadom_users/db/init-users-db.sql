@@ -12,5 +12,6 @@ CREATE TABLE IF NOT EXISTS user_ (
     course INTEGER,
     photo TEXT,
     email_verified BOOLEAN NOT NULL DEFAULT FALSE,
-    created_at TEXT
+    created_at TEXT,
+    version INTEGER NOT NULL DEFAULT 1
 );
\ No newline at end of file